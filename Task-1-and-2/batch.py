@@ -0,0 +1,277 @@
+"""Headless batch runner for shape detection and symmetry analysis.
+
+Usage:
+    python batch.py problems/ --workers 4 --output results.jsonl --images output/batch
+
+Every input CSV is processed in a separate worker process and produces one
+JSON-lines record with the detected shapes, symmetry results and per-stage
+timings. No window is ever opened, and nothing but the records is written
+to stdout (set GENSOLVE_LOG_LEVEL=INFO for progress messages on stderr).
+With ``--npz DIR`` the shapes and symmetry of every input are also saved in
+the columnar ``ShapeResults`` form as ``DIR/<name>.npz``, and with
+``--regularize DIR`` the regularized paths as ``DIR/<name>.csv``. ``--score``
+adds the distances of the detected outlines (and regularized paths) to the
+input's ``*_sol.csv`` ground truth, see ``scoring``.
+"""
+import argparse
+import glob
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Never open a window, even when images are written; matplotlib itself is only
+# imported if the matplotlib rendering backend draws something
+os.environ["MPLBACKEND"] = "Agg"
+
+import cv2
+import numpy as np
+
+import main as shape_main
+import regularize
+import result_cache
+import scoring
+import tracing
+from shape_results import ShapeResults
+
+DEFAULT_SHAPES = ['lines', 'rectangles', 'circles', 'ellipses', 'polygons', 'stars']
+
+def collect_inputs(patterns):
+    """Expand directories and glob patterns into a sorted list of CSV files."""
+    csv_paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, "*.csv")
+        csv_paths.extend(glob.glob(pattern))
+    return sorted(set(csv_paths))
+
+def to_jsonable(value):
+    """Convert shapes (NumPy arrays, tuples and scalars) into plain JSON values."""
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [to_jsonable(v) for v in value]
+    if isinstance(value, dict):
+        return {k: to_jsonable(v) for k, v in value.items()}
+    return value
+
+def init_worker(trace_dir=None, trace_memory=False, profile_stage=None):
+    # One OpenCV thread per process so the pool, not OpenCV, owns the cores
+    cv2.setNumThreads(1)
+    if trace_dir is not None or profile_stage is not None:
+        tracing.configure(trace_dir, trace_memory, profile_stage)
+
+def process_csv(csv_path, shapes_to_detect, scale=5, vector=False, use_cache=False, image_dir=None, tile_size=None,
+                render=None, cache_dir=None, cache_bytes=512 * 2 ** 20, npz_dir=None, regularize_dir=None,
+                pyramid=False, score=False):
+    """Run the full pipeline on one CSV and return its JSON-lines record.
+
+    With ``cache_dir`` the shapes and symmetry come from the shared result
+    cache when this CSV was already processed with the same parameters.
+    With ``npz_dir`` they are also saved there as a ``ShapeResults`` file,
+    and with ``regularize_dir`` the regularized paths are written there.
+    ``score`` compares the outputs to the ground truth of the input.
+    """
+    record = {"input": csv_path, "timings": {}}
+    timings = record["timings"]
+
+    def timed(stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        timings[stage] = time.perf_counter() - start
+        return result
+
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    try:
+        with tracing.session(name):
+            cache = cached = None
+            if cache_dir is not None:
+                cache = result_cache.ResultCache(cache_dir, cache_bytes)
+                key = shape_main.detection_cache_key(cache, csv_path, shapes_to_detect, scale, vector, tile_size,
+                                                     pyramid)
+                cached = timed("result_cache", cache.get, key)
+            original_image = processed_image = None
+            if cached is not None:
+                shapes, symmetric_shapes = cached
+                record["cached"] = True
+            else:
+                shapes, original_image, processed_image = detect_stages(timed, csv_path, shapes_to_detect, scale,
+                                                                        vector, use_cache, tile_size, pyramid)
+                symmetric_shapes = timed("detect_symmetry", shape_main.detect_symmetry, shapes)
+                if cache is not None:
+                    timed("cache_store", cache.put, key, (shapes, symmetric_shapes))
+
+            if image_dir is not None:
+                if original_image is None:
+                    original_image, _ = timed("rasterize", shape_main.parse_csv_with_read_csv, csv_path, scale)
+                    processed_image = original_image
+                    if not vector and not tile_size and not pyramid:
+                        processed_image = timed("preprocess", shape_main.preprocess_image, original_image)
+                # The canvas starts at the drawing's bounding box, the shapes are in scaled CSV coordinates
+                left, top = shape_main.canvas_bounds(shape_main.read_csv(csv_path, use_cache=use_cache), scale)[:2]
+                # The backend picks the extension (.svg for 'svg') and writes nothing for 'none'
+                record["image"] = timed("plot_shapes", shape_main.plot_shapes, original_image, processed_image,
+                                        shape_main.translate_shapes(shapes, (-left, -top)), output_dir=image_dir,
+                                        output_filename=f"detected_shapes_{name}.png", show=False, backend=render)
+
+            if npz_dir is not None:
+                results = ShapeResults.from_dicts(shapes, symmetric_shapes)
+                record["npz"] = os.path.join(npz_dir, f"{name}.npz")
+                timed("save_npz", results.save, record["npz"])
+
+            if regularize_dir is not None:
+                record["regularized"] = os.path.join(regularize_dir, f"{name}.csv")
+                kinds = timed("regularize", regularize.regularize_csv, csv_path, record["regularized"],
+                              use_cache=use_cache)
+                record["regularized_segments"] = {kind or "unchanged": int(np.sum(kinds == kind))
+                                                  for kind in sorted(set(kinds))}
+
+            truth_path = scoring.solution_path(csv_path) if score else None
+            if truth_path is not None:
+                record["score"] = timed("score", score_outputs, truth_path, shapes, scale, record.get("regularized"))
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        return record
+
+    record["shapes"] = to_jsonable(shapes)
+    record["symmetry"] = to_jsonable(symmetric_shapes)
+    record["timings"]["total"] = sum(timings.values())
+    return record
+
+def score_outputs(truth_path, shapes, scale, regularized_path=None):
+    """Curve scores of the detected outlines and the regularized paths against ``truth_path``."""
+    truth_xy, truth_offsets = shape_main.read_csv_flat(truth_path)
+    truth = (truth_xy, scoring.flat_starts(truth_offsets))
+    scores = {"truth": truth_path, "detected": scoring.curve_scores(*scoring.shape_polylines(shapes, scale), *truth)}
+    if regularized_path is not None:
+        xy, offsets = shape_main.read_csv_flat(regularized_path)
+        scores["regularized"] = scoring.curve_scores(xy, scoring.flat_starts(offsets), *truth)
+    return scores
+
+def detect_stages(timed, csv_path, shapes_to_detect, scale, vector, use_cache, tile_size, pyramid=False):
+    """Run the detection stages, returning the shapes and the images they were found in.
+
+    The images are None for the vector, tiled and pyramid modes, which never
+    draw the whole canvas.
+    """
+    path_XYs = timed("read_csv", shape_main.read_csv, csv_path, use_cache=use_cache)
+    original_image = processed_image = None
+    if vector:
+        shapes = timed("detect_shapes", shape_main.detect_shapes_from_paths, path_XYs, shapes_to_detect, scale)
+    elif tile_size:
+        shapes = timed("detect_shapes", shape_main.detect_shapes_tiled, path_XYs, shapes_to_detect, scale, tile_size)
+    elif pyramid:
+        shapes = timed("detect_shapes", shape_main.detect_shapes_pyramid, path_XYs, shapes_to_detect, scale)
+    else:
+        original_image, _ = timed("rasterize", shape_main.parse_csv_with_read_csv, csv_path, scale)
+        processed_image = timed("preprocess", shape_main.preprocess_image, original_image)
+        shapes = timed("detect_shapes", shape_main.detect_shapes, processed_image, shapes_to_detect)
+        shapes = shape_main.translate_shapes(shapes, shape_main.canvas_bounds(path_XYs, scale)[:2])
+    return shapes, original_image, processed_image
+
+def run_batch(csv_paths, shapes_to_detect, workers=None, scale=5, vector=False, use_cache=False,
+              image_dir=None, output=sys.stdout, tile_size=None, trace_dir=None, trace_memory=False,
+              profile_stage=None, render=None, cache_dir=None, cache_bytes=512 * 2 ** 20, npz_dir=None,
+              regularize_dir=None, pyramid=False, score=False):
+    """Process ``csv_paths`` on a process pool, writing one JSON line per input in input order.
+
+    With ``trace_dir`` every input also gets a Chrome trace of its stages there;
+    ``profile_stage`` runs that stage under cProfile (see ``tracing``).
+    ``cache_dir`` is a result cache shared by all workers (see ``result_cache``).
+    ``npz_dir`` receives a ``ShapeResults`` file per input and ``regularize_dir``
+    the regularized CSV of every input. ``score`` adds the ``scoring`` results
+    against the ``*_sol.csv`` ground truth to the records.
+    """
+    count = len(csv_paths)
+    for directory in (npz_dir, regularize_dir):
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(trace_dir, trace_memory, profile_stage)) as pool:
+        records = pool.map(process_csv, csv_paths, [shapes_to_detect] * count, [scale] * count,
+                           [vector] * count, [use_cache] * count, [image_dir] * count, [tile_size] * count,
+                           [render] * count, [cache_dir] * count, [cache_bytes] * count, [npz_dir] * count,
+                           [regularize_dir] * count, [pyramid] * count, [score] * count)
+        for record in records:
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+
+def stream_csv(csv_path, shapes_to_detect, scale=5, output=sys.stdout):
+    """Process one CSV path by path, writing a record for every path as soon as it is done."""
+    results = shape_main.stream_detect(csv_path, shapes_to_detect, scale)
+    while True:
+        start = time.perf_counter()
+        item = next(results, None)
+        if item is None:
+            break
+        path_index, shapes, symmetric_shapes = item
+        record = {"input": csv_path, "path": path_index, "shapes": to_jsonable(shapes),
+                  "symmetry": to_jsonable(symmetric_shapes), "timings": {"total": time.perf_counter() - start}}
+        output.write(json.dumps(record) + "\n")
+        output.flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detect shapes and symmetry in a batch of CSV files.")
+    parser.add_argument("inputs", nargs="+", help="CSV files, directories or glob patterns")
+    parser.add_argument("--shapes", default=",".join(DEFAULT_SHAPES),
+                        help="comma-separated shape types to detect (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: CPU count)")
+    parser.add_argument("--output", default="-", help="JSON-lines output file, '-' for stdout (default)")
+    parser.add_argument("--images", metavar="DIR", help="also save a detected-shapes image per input to DIR")
+    parser.add_argument("--render", choices=["file", "matplotlib", "svg", "none"], default="file",
+                        help="how --images are drawn: OpenCV straight to a file (no matplotlib), the matplotlib "
+                             "figure, an SVG or not at all (default: %(default)s)")
+    parser.add_argument("--npz", metavar="DIR",
+                        help="also save the shapes and symmetry of every input as DIR/<name>.npz")
+    parser.add_argument("--regularize", metavar="DIR",
+                        help="also fit ideal lines, circles, ellipses, rectangles and regular polygons to the paths "
+                             "and write them as DIR/<name>.csv")
+    parser.add_argument("--scale", type=int, default=5, help="rasterization scale (default: %(default)s)")
+    parser.add_argument("--vector", action="store_true", help="classify the CSV paths directly, without rasterizing")
+    parser.add_argument("--cache", action="store_true", help="read and write the binary CSV cache next to each input")
+    parser.add_argument("--result-cache", metavar="DIR",
+                        help="reuse shapes and symmetry from this result cache, keyed on the CSV contents and options")
+    parser.add_argument("--result-cache-mb", type=int, default=512,
+                        help="size cap of the result cache in MB (default: %(default)s)")
+    raster_mode = parser.add_mutually_exclusive_group()
+    raster_mode.add_argument("--tile-size", type=int, help="detect tile by tile with tiles of this many pixels")
+    raster_mode.add_argument("--pyramid", action="store_true",
+                             help="find the inked regions at a quarter of the scale first and filter only those at "
+                                  "full scale")
+    parser.add_argument("--score", action="store_true",
+                        help="score the detected outlines (and --regularize output) against the input's *_sol.csv")
+    parser.add_argument("--stream", action="store_true",
+                        help="read each CSV path by path and write one record per path (bounded memory)")
+    parser.add_argument("--trace", metavar="DIR", help="write a Chrome trace of the stages of every input to DIR")
+    parser.add_argument("--trace-memory", action="store_true", help="also record the peak allocation per stage")
+    parser.add_argument("--profile", metavar="STAGE", help="run STAGE (e.g. detect_shapes) under cProfile")
+    args = parser.parse_args(argv)
+
+    csv_paths = collect_inputs(args.inputs)
+    if not csv_paths:
+        parser.error("no CSV files matched the given inputs")
+    shapes_to_detect = [s.strip() for s in args.shapes.split(",") if s.strip()]
+
+    if args.trace or args.profile:
+        tracing.configure(args.trace, args.trace_memory, args.profile)
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        if args.stream:
+            for csv_path in csv_paths:
+                stream_csv(csv_path, shapes_to_detect, args.scale, output)
+        else:
+            run_batch(csv_paths, shapes_to_detect, args.workers, args.scale, args.vector, args.cache,
+                      args.images, output, args.tile_size, args.trace, args.trace_memory, args.profile,
+                      args.render, args.result_cache, args.result_cache_mb * 2 ** 20, args.npz,
+                      args.regularize, args.pyramid, args.score)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get("GENSOLVE_LOG_LEVEL", "WARNING"), format="%(message)s")
+    main()
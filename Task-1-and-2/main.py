@@ -1,139 +1,765 @@
 #FINAL SCRIPT WITH SYMMETRY
 import numpy as np
-from PIL import Image, ImageDraw
+from PIL import Image
 import cv2
-import matplotlib.pyplot as plt
-from matplotlib.patches import Ellipse
+import logging
 import os
+import sys
+import tempfile
+from itertools import islice
+
+import spatial_index
+from spatial_index import GridIndex
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rendering
+import result_cache
+import tracing
+
+# Silent unless the application configures logging (the scripts read GENSOLVE_LOG_LEVEL)
+logger = logging.getLogger("gensolve.shapes")
+
+def count_shapes(shapes):
+    return {'shapes': sum(len(shape_list) for shape_list in shapes.values())}
+
+def group_paths(np_path_XYs):
+    """Group raw CSV rows into a flat point array plus segment offsets.
+
+    Rows are stable-sorted by (path id, segment id) once, so points keep their
+    file order inside each segment. ``offsets`` has one row per segment holding
+    (path number, first point index), followed by a sentinel row
+    (number of paths, number of points).
+    """
+    order = np.lexsort((np_path_XYs[:, 1], np_path_XYs[:, 0]))
+    rows = np_path_XYs[order]
+    ids = rows[:, :2]
+    xy = np.ascontiguousarray(rows[:, 2:4])
+
+    # A segment starts wherever the (path, segment) id pair changes
+    seg_starts = np.concatenate(([0], np.flatnonzero(np.any(ids[1:] != ids[:-1], axis=1)) + 1))
+    new_path = np.concatenate(([True], ids[seg_starts[1:], 0] != ids[seg_starts[:-1], 0]))
+    path_numbers = np.cumsum(new_path) - 1
+
+    offsets = np.empty((len(seg_starts) + 1, 2), dtype=np.int64)
+    offsets[:-1, 0] = path_numbers
+    offsets[:-1, 1] = seg_starts
+    offsets[-1] = (path_numbers[-1] + 1, len(xy))
+    return xy, offsets
+
+def paths_from_offsets(xy, offsets):
+    """Rebuild the nested ``path_XYs`` lists from a flat point array and its offsets."""
+    segments = np.split(xy, offsets[1:-1, 1])
+    path_breaks = np.flatnonzero(np.diff(offsets[:-1, 0])) + 1
+    bounds = zip(np.concatenate(([0], path_breaks)), np.concatenate((path_breaks, [len(segments)])))
+    return [segments[start:end] for start, end in bounds]
+
+def cache_paths(csv_path):
+    """Return the sidecar file paths used to cache a parsed CSV."""
+    return csv_path + '.xy.npy', csv_path + '.offsets.npy'
+
+def save_atomic(path, array):
+    """``np.save`` to a temporary file next to ``path`` and move it into place, so readers never see a partial file."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, array)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+def load_cached_csv(csv_path):
+    """Memory-map the sidecar of a CSV, or return None when it is missing, stale or damaged."""
+    xy_path, offsets_path = cache_paths(csv_path)
+    try:
+        if min(os.path.getmtime(xy_path), os.path.getmtime(offsets_path)) < os.path.getmtime(csv_path):
+            return None
+        xy, offsets = np.load(xy_path, mmap_mode='r'), np.load(offsets_path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+    # The sentinel row must account for every point
+    if xy.ndim != 2 or offsets.ndim != 2 or not len(offsets) or offsets[-1, 1] != len(xy):
+        return None
+    return xy, offsets
+
+def read_csv_flat(csv_path, use_cache=False):
+    """Read a CSV file into a flat point array and segment offsets (see ``group_paths``).
+
+    With ``use_cache`` a binary sidecar is written next to the CSV on the first
+    run and memory-mapped on later runs, skipping text parsing entirely. The
+    sidecar is ignored once the CSV is newer than it, and rebuilt when it does
+    not match its offsets.
+    """
+    if use_cache:
+        cached = load_cached_csv(csv_path)
+        if cached is not None:
+            return cached
 
-def read_csv(csv_path):
-    """Read CSV file and organize data into paths."""
     np_path_XYs = np.genfromtxt(csv_path, delimiter=',')
-    path_XYs = []
-    for i in np.unique(np_path_XYs[:, 0]):
-        npXYs = np_path_XYs[np_path_XYs[:, 0] == i][:, 1:]
-        XYs = []
-        for j in np.unique(npXYs[:, 0]):
-            XY = npXYs[npXYs[:, 0] == j][:, 1:]
-            XYs.append(XY)
-        path_XYs.append(XYs)
-    return path_XYs
+    xy, offsets = group_paths(np_path_XYs)
+
+    if use_cache:
+        # Each file is replaced atomically, and the offsets go last so a
+        # half-written cache is never picked up
+        xy_path, offsets_path = cache_paths(csv_path)
+        save_atomic(xy_path, xy)
+        save_atomic(offsets_path, offsets)
+    return xy, offsets
+
+@tracing.stage('read_csv', lambda paths: {'paths': len(paths)})
+def read_csv(csv_path, use_cache=False):
+    """Read CSV file and organize data into paths."""
+    xy, offsets = read_csv_flat(csv_path, use_cache=use_cache)
+    return paths_from_offsets(xy, offsets)
+
+def iter_csv_paths(csv_path, chunk_rows=65536):
+    """Yield the paths of a CSV file one at a time, in file order, reading ``chunk_rows`` lines at a time.
+
+    Each yielded item is the list of segment arrays of one path, as in
+    ``read_csv``. Rows of a path must be contiguous in the file, which is how
+    the exports are written. Only the path being assembled is kept in memory.
+    """
+    pending = []  # Rows of the path that continues into the next chunk
+
+    def finish(parts):
+        xy, offsets = group_paths(np.concatenate(parts))
+        return paths_from_offsets(xy, offsets)[0]
+
+    with open(csv_path) as f:
+        while True:
+            lines = list(islice(f, chunk_rows))
+            if not lines:
+                break
+            rows = np.loadtxt(lines, delimiter=',', ndmin=2)
+            if not len(rows):
+                continue
+            breaks = np.flatnonzero(rows[1:, 0] != rows[:-1, 0]) + 1
+            if pending and pending[-1][-1, 0] != rows[0, 0]:
+                yield finish(pending)
+                pending = []
+            starts = np.concatenate(([0], breaks))
+            for start, end in zip(starts[:-1], breaks):
+                pending.append(rows[start:end])
+                yield finish(pending)
+                pending = []
+            pending.append(rows[starts[-1]:])
+    if pending:
+        yield finish(pending)
+
+def pixel_bounds(points, padding=16):
+    """Integer (x0, y0, x1, y1) box around already scaled points with ``padding`` pixels on every side."""
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if not len(points):
+        return 0, 0, padding, padding
+    low = np.floor(points.min(axis=0)).astype(np.int64)
+    high = np.ceil(points.max(axis=0)).astype(np.int64) + padding
+    # Drawings that already start within ``padding`` of 0 keep their origin at 0, so they are drawn
+    # exactly where they always were (HoughLinesP does not give the same lines after a shift)
+    x0, y0 = np.where((low >= 0) & (low <= padding), 0, low - padding)
+    return int(x0), int(y0), int(high[0]), int(high[1])
+
+def canvas_bounds(path_XYs, scale=5, padding=16):
+    """Pixel box (x0, y0, x1, y1) of a canvas that holds every scaled path plus ``padding`` pixels.
+
+    The canvas follows the drawing's bounding box, so its size does not depend
+    on where the drawing lies and negative coordinates are kept. A point is
+    drawn at its scaled coordinates minus (x0, y0); the origin is a whole pixel,
+    so the drawing only moves by whole pixels.
+    """
+    segments = [np.asarray(XY, dtype=np.float64).reshape(-1, 2) for XYs in path_XYs for XY in XYs if len(XY)]
+    return pixel_bounds(np.concatenate(segments) * scale if segments else [], padding)
+
+def canvas_size(path_XYs, scale=5, padding=16):
+    """Return the (width, height) of the ``canvas_bounds`` canvas."""
+    x0, y0, x1, y1 = canvas_bounds(path_XYs, scale, padding)
+    return x1 - x0, y1 - y0
+
+def translate_shapes(shapes, offset):
+    """Return a copy of a ``detect_shapes`` dict with every detection moved by ``offset`` pixels."""
+    dx, dy = offset
+    moved = {}
+    for shape_type, shape_list in shapes.items():
+        if shape_type == 'lines':
+            moved[shape_type] = [((x1 + dx, y1 + dy), (x2 + dx, y2 + dy)) for (x1, y1), (x2, y2) in shape_list]
+        elif shape_type == 'circles':
+            moved[shape_type] = [(x + dx, y + dy, radius) for x, y, radius in shape_list]
+        elif shape_type == 'ellipses':
+            moved[shape_type] = [((cx + dx, cy + dy), axes, angle) for (cx, cy), axes, angle in shape_list]
+        else:
+            moved[shape_type] = [np.asarray(shape) + np.array([dx, dy], dtype=np.asarray(shape).dtype)
+                                 for shape in shape_list]
+    return moved
+
+@tracing.stage('rasterize', lambda result: {'pixels': result[0].size})
+def parse_csv_with_read_csv(csv_path, scale=5, padding=16):
+    """Rasterize a CSV onto a white canvas and return it with the scaled paths.
+
+    All coordinates are scaled in one NumPy operation and every segment is
+    drawn in one batched pass (``rendering.rasterize_polylines``), giving the
+    same pixels as drawing each segment with PIL. The canvas covers the
+    drawing's bounding box (``canvas_bounds``) and the paths are returned like
+    ``read_csv`` in its pixel coordinates. Move anything found in the image
+    by the canvas origin, ``canvas_bounds(read_csv(csv_path), scale)[:2]``,
+    to get scaled CSV coordinates.
+    """
+    xy, offsets = read_csv_flat(csv_path)
+    scaled = xy * scale
+    x0, y0, x1, y1 = pixel_bounds(scaled, padding)
+    scaled -= (x0, y0)
+    original_paths = paths_from_offsets(scaled, offsets)
+
+    image = np.full((y1 - y0, x1 - x0), 255, dtype=np.uint8)
+    rendering.rasterize_polylines(image, scaled, offsets[:, 1])
+
+    return image, original_paths
+
+# Gaussian kernel that smooths the 1-pixel strokes before Canny
+blur_kernel = (5, 5)
+
+# Canny traces a blurred stroke on both sides, at most the kernel width minus one pixels apart
+duplicate_tolerance = blur_kernel[0] - 1
+
+@tracing.stage('preprocess')
+def preprocess_image(image):
+    blurred = cv2.GaussianBlur(image, blur_kernel, 0)
+    return blurred
+
+@tracing.stage('contour_features', lambda features: {'contours': len(features['contours'])})
+def extract_contour_features(contours, min_area=100):
+    """Measure every contour once and return the shared feature table.
+
+    Contours smaller than ``min_area`` are dropped. Every other entry is a NumPy
+    array aligned with ``features['contours']``, so the shape classifiers can
+    work on whole columns instead of recomputing the measurements per shape.
+    """
+    contours = [c for c in contours if cv2.contourArea(c) >= min_area]
+    count = len(contours)
+
+    area = np.array([cv2.contourArea(c) for c in contours], dtype=np.float64)
+    perimeter = np.array([cv2.arcLength(c, True) for c in contours], dtype=np.float64)
+    approx = [cv2.approxPolyDP(c, 0.02 * p, True) for c, p in zip(contours, perimeter)]
+    hull_area = np.array([cv2.contourArea(cv2.convexHull(a)) for a in approx], dtype=np.float64)
+    n_vertices = np.array([len(a) for a in approx], dtype=np.int64)
+    n_points = np.array([len(c) for c in contours], dtype=np.int64)
+
+    # Interior angle at every approximated vertex, computed over all polygons at once
+    angle_mean = np.full(count, np.nan)
+    angle_spread = np.full(count, np.nan)
+    if count:
+        vertices = np.concatenate([a.reshape(-1, 2) for a in approx]).astype(np.float64)
+        starts = np.concatenate(([0], np.cumsum(n_vertices)[:-1]))
+        owner = np.repeat(np.arange(count), n_vertices)
+        local = np.arange(len(vertices)) - starts[owner]
+        size = n_vertices[owner]
+        p1 = vertices
+        p2 = vertices[starts[owner] + (local + 1) % size]
+        p3 = vertices[starts[owner] + (local + 2) % size]
+        v1, v2 = p2 - p1, p2 - p3
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cosine = np.einsum('ij,ij->i', v1, v2) / (np.linalg.norm(v1, axis=1) * np.linalg.norm(v2, axis=1))
+            angles = np.arccos(cosine)
+        angle_mean = np.add.reduceat(angles, starts) / n_vertices
+        angle_spread = np.maximum.reduceat(np.abs(angles - angle_mean[owner]), starts)
+
+    return {
+        'contours': contours,
+        'approx': approx,
+        'area': area,
+        'perimeter': perimeter,
+        'hull_area': hull_area,
+        'n_vertices': n_vertices,
+        'n_points': n_points,
+        'angle_mean': angle_mean,
+        'angle_spread': angle_spread,
+    }
+
+@tracing.stage('classify')
+def classify_features(features, shapes_to_detect, shapes):
+    """Classify every contour in a feature table and append the matches to ``shapes``."""
+    area = features['area']
+    perimeter = features['perimeter']
+    n_vertices = features['n_vertices']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        area_ratio = area / features['hull_area']
+        circularity = 4 * np.pi * (area / (perimeter * perimeter))
+
+    def append(shape_type, mask, source):
+        shapes[shape_type].extend(source[i] for i in np.flatnonzero(mask))
+
+    if 'rectangles' in shapes_to_detect:
+        append('rectangles', n_vertices == 4, features['approx'])
+    if 'rounded_rectangles' in shapes_to_detect:
+        append('rounded_rectangles', (n_vertices == 4) & (area_ratio < 0.9), features['approx'])
+    if 'stars' in shapes_to_detect:
+        append('stars', (n_vertices >= 5) & (area_ratio < 0.8), features['approx'])
+
+    # When circles are requested, contours too small to be circles are not
+    # considered for ellipses or polygons either
+    min_contour_area = 350000  # Adjust this value based on your requirements
+    gate = np.ones(len(area), dtype=bool)
+    if 'circles' in shapes_to_detect:
+        gate = (area >= min_contour_area) & (perimeter > 0)
+        for i in np.flatnonzero(gate & (circularity > 0.7) & (circularity < 1.2)):
+            (x, y), radius = cv2.minEnclosingCircle(features['contours'][i])
+            shapes['circles'].append((int(x), int(y), int(radius)))
+
+    if 'ellipses' in shapes_to_detect:
+        for i in np.flatnonzero(gate & (features['n_points'] >= 5)):
+            shapes['ellipses'].append(cv2.fitEllipse(features['contours'][i]))
+
+    if 'polygons' in shapes_to_detect:
+        # Same tolerance as np.allclose(angles, avg_angle, atol=0.1)
+        regular = features['angle_spread'] <= 0.1 + 1e-5 * np.abs(features['angle_mean'])
+        append('polygons', gate & (n_vertices >= 5) & regular, features['approx'])
+
+def print_detected_shapes(shapes):
+    """Log the detected shape types (INFO) and every detection (DEBUG)."""
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    logger.info("Detected shapes:")
+    for shape_type, shape_list in shapes.items():
+        if shape_list:
+            logger.info("- %s: %d detected", shape_type.capitalize(), len(shape_list))
+            for i, shape in enumerate(shape_list, 1):
+                logger.debug("  %d. %s", i, shape)
+
+@tracing.stage('hough_lines', lambda lines: {'lines': len(lines)})
+def detect_lines(edges):
+    """Run the probabilistic Hough transform once over an edge image."""
+    lines = cv2.HoughLinesP(edges, 1, np.pi / 180, 50, minLineLength=100, maxLineGap=10)
+    if lines is None:
+        return []
+    return [((x1, y1), (x2, y2)) for x1, y1, x2, y2 in lines.reshape(-1, 4)]
+
+@tracing.stage('canny_contours', lambda result: {'contours': len(result[1])})
+def find_contours(image):
+    """Return the Canny edge image and its contours."""
+    edges = cv2.Canny(image, 50, 150, apertureSize=3)
+    contours, _ = cv2.findContours(edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    return edges, contours
+
+def shape_bbox(shape_type, shape):
+    """Axis-aligned bounding box ``(x0, y0, x1, y1)`` of a detection."""
+    if shape_type == 'lines':
+        (x1, y1), (x2, y2) = shape
+        return min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)
+    if shape_type == 'circles':
+        x, y, r = shape
+        return x - r, y - r, x + r, y + r
+    if shape_type == 'ellipses':
+        points = cv2.boxPoints(shape)
+    else:
+        points = np.asarray(shape).reshape(-1, 2)
+    x0, y0 = points.min(axis=0)
+    x1, y1 = points.max(axis=0)
+    return float(x0), float(y0), float(x1), float(y1)
+
+def is_duplicate_shape(shape_type, shape, kept, tolerance, angle_tolerance=np.deg2rad(5)):
+    """Whether ``shape`` repeats the (larger) detection ``kept`` to within ``tolerance`` pixels."""
+    if shape_type == 'lines':
+        # Parallel, at most ``tolerance`` off the kept line and overlapping the kept segment; the ends of
+        # Hough segments on the two sides of a stroke can overhang each other by a little more
+        (ax, ay), (bx, by) = shape
+        (cx, cy), (dx, dy) = kept
+        angle = abs(np.arctan2(by - ay, bx - ax) - np.arctan2(dy - cy, dx - cx)) % np.pi
+        if min(angle, np.pi - angle) > angle_tolerance:
+            return False
+        direction = np.subtract(kept[1], kept[0], dtype=float)
+        length = np.hypot(*direction)
+        if length == 0:
+            return all(np.hypot(*np.subtract(p, kept[0])) <= tolerance for p in shape)
+        offsets = np.subtract(shape, kept[0], dtype=float)
+        along = offsets @ direction / length
+        across = np.abs(offsets @ (-direction[1], direction[0])) / length
+        return bool(np.all(across <= tolerance) and np.all(along >= -2 * tolerance) and
+                    np.all(along <= length + 2 * tolerance))
+    if shape_type == 'circles':
+        return np.hypot(shape[0] - kept[0], shape[1] - kept[1]) <= tolerance and abs(shape[2] - kept[2]) <= tolerance
+    if shape_type == 'ellipses':
+        # The axes are diameters, so an inner and outer contour differ by twice the offset
+        (x, y), axes, _ = shape
+        (kx, ky), kept_axes, _ = kept
+        return np.hypot(x - kx, y - ky) <= tolerance and \
+            np.all(np.abs(np.sort(axes) - np.sort(kept_axes)) <= 2 * tolerance)
+    # Outlines: the bounding boxes agree to within the tolerance
+    return np.all(np.abs(np.subtract(shape_bbox(shape_type, shape), shape_bbox(shape_type, kept))) <= tolerance)
+
+def deduplicate_shapes(shapes, tolerance=duplicate_tolerance, cell_size=64):
+    """Merge near-duplicate detections of the same type, such as the inner and outer contour of a stroke.
+
+    ``tolerance`` defaults to the separation of the two contours of one
+    blurred stroke (``duplicate_tolerance``), so distinct shapes drawn
+    further apart than that are kept. Detections are visited largest first
+    and a detection is dropped when it repeats one already kept (see
+    ``is_duplicate_shape``); candidates come from a ``GridIndex`` over the
+    bounding boxes, so this runs in near-linear time. The kept detections
+    stay in their original order.
+    """
+    deduplicated = {}
+    for shape_type, shape_list in shapes.items():
+        boxes = [shape_bbox(shape_type, shape) for shape in shape_list]
+        sizes = [(x1 - x0) + (y1 - y0) for x0, y0, x1, y1 in boxes]
+        index = GridIndex(cell_size)
+        kept = []
+        for i in sorted(range(len(shape_list)), key=lambda i: -sizes[i]):
+            x0, y0, x1, y1 = boxes[i]
+            candidates = index.query((x0 - tolerance, y0 - tolerance, x1 + tolerance, y1 + tolerance))
+            if any(is_duplicate_shape(shape_type, shape_list[i], shape_list[j], tolerance) for j in candidates):
+                continue
+            index.insert(i, boxes[i])
+            kept.append(i)
+        deduplicated[shape_type] = [shape_list[i] for i in sorted(kept)]
+    return deduplicated
+
+def index_shapes(shapes, cell_size=64):
+    """Build a ``GridIndex`` of all detections for region queries.
+
+    Items are ``(shape_type, index)`` pairs, e.g.
+    ``index_shapes(shapes).query((x0, y0, x1, y1))`` lists every detection
+    whose bounding box intersects that rectangle.
+    """
+    index = GridIndex(cell_size)
+    for shape_type, shape_list in shapes.items():
+        for i, shape in enumerate(shape_list):
+            index.insert((shape_type, i), shape_bbox(shape_type, shape))
+    return index
 
-def parse_csv_with_read_csv(csv_path, scale=5):
-    path_XYs = read_csv(csv_path)
+@tracing.stage('detect_shapes', count_shapes)
+def detect_shapes(image, shapes_to_detect, dedupe=True):
+    edges, contours = find_contours(image)
 
-    width, height = 500 * scale, 500 * scale
-    image = Image.new("L", (width, height), 255)
-    draw = ImageDraw.Draw(image)
+    shapes = {shape: [] for shape in shapes_to_detect}
 
-    original_paths = []
+    features = extract_contour_features(contours)
+    if 'lines' in shapes_to_detect and len(features['contours']):
+        shapes['lines'].extend(detect_lines(edges))
 
-    for XYs in path_XYs:
-        path_points = []
-        for XY in XYs:
-            points = [(x * scale, y * scale) for x, y in XY]
-            draw.line(points, fill=0, width=1)
-            path_points.append(points)
-        original_paths.append(path_points)
+    classify_features(features, shapes_to_detect, shapes)
+    if dedupe:
+        shapes = deduplicate_shapes(shapes)
 
-    return np.array(image), original_paths
+    print_detected_shapes(shapes)
 
-def preprocess_image(image):
-    blurred = cv2.GaussianBlur(image, (5, 5), 0)
-    return blurred
+    return shapes
 
-def detect_shapes(image, shapes_to_detect):
-    edges = cv2.Canny(image, 50, 150, apertureSize=3)
-    contours, _ = cv2.findContours(edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+def rasterize_window(segments, bounds, window):
+    """Draw the scaled segments that intersect ``window`` (x0, y0, x1, y1) onto a window-sized canvas.
+
+    The points are truncated before they are shifted to the window, so every
+    window holds exactly the pixels of the same area of the full canvas.
+    """
+    x0, y0, x1, y1 = window
+    image = np.full((y1 - y0, x1 - x0), 255, dtype=np.uint8)
+    visible = np.flatnonzero((bounds[:, 0] <= x1) & (bounds[:, 2] >= x0) & (bounds[:, 1] <= y1) & (bounds[:, 3] >= y0))
+    if len(visible):
+        lengths = [len(segments[i]) for i in visible]
+        starts = np.concatenate(([0], np.cumsum(lengths)))
+        points = np.trunc(np.concatenate([segments[i] for i in visible]))
+        rendering.rasterize_polylines(image, points, starts, origin=(x0, y0))
+    return image
+
+def window_contours(segments, bounds, window, canvas, margin):
+    """Detect contours inside one window and split them by whether they touch its cut edges.
+
+    Returns the edge image, the contours in canvas coordinates, their bounding
+    boxes and a mask of the ones that reach within ``margin`` pixels of an edge
+    that lies inside the canvas (those may continue in a neighbouring window).
+    """
+    x0, y0, x1, y1 = window
+    edges, contours = find_contours(preprocess_image(rasterize_window(segments, bounds, window)))
+    contours = [c + (x0, y0) for c in contours]
+    boxes = np.array([cv2.boundingRect(c) for c in contours], dtype=np.int64).reshape(-1, 4)
+    bx0, by0 = boxes[:, 0], boxes[:, 1]
+    bx1, by1 = bx0 + boxes[:, 2], by0 + boxes[:, 3]
+    cut = ((x0 > 0) & (bx0 < x0 + margin)) | ((y0 > 0) & (by0 < y0 + margin)) | \
+          ((x1 < canvas[0]) & (bx1 > x1 - margin)) | ((y1 < canvas[1]) & (by1 > y1 - margin))
+    return edges, contours, np.stack([bx0, by0, bx1, by1], axis=1), cut
+
+def merge_boxes(boxes, pad):
+    """Grow boxes by ``pad`` and merge overlapping ones until all are disjoint."""
+    boxes = [list(b) for b in np.asarray(boxes).reshape(-1, 4) - (pad, pad, -pad, -pad)]
+    merged = True
+    while merged:
+        merged = False
+        result = []
+        for box in boxes:
+            for other in result:
+                if box[0] <= other[2] and other[0] <= box[2] and box[1] <= other[3] and other[1] <= box[3]:
+                    other[:] = [min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3])]
+                    merged = True
+                    break
+            else:
+                result.append(box)
+        boxes = result
+    return boxes
+
+@tracing.stage('detect_shapes_tiled', count_shapes)
+def detect_shapes_tiled(path_XYs, shapes_to_detect, scale=5, tile_size=1024, overlap=32, dedupe=True):
+    """Rasterize and detect tile by tile so peak memory depends on the tile size, not the drawing.
+
+    Every tile is drawn with ``overlap`` extra pixels on each side. A contour
+    that fits inside some tile is taken from the first such tile. Contours cut
+    by a tile edge are re-detected on one window around all of their fragments,
+    which gives the same contours as drawing the whole canvas at once. Lines
+    come from HoughLinesP per tile, keeping those whose midpoint falls in the
+    tile; lines longer than a tile are reported per tile.
+    """
+    margin = 4  # Reach of the 5x5 blur and the Canny gradient
+    left, top, right, bottom = canvas_bounds(path_XYs, scale)
+    canvas, origin = (right - left, bottom - top), (left, top)
+    segments = [np.asarray(XY, dtype=np.float64) * scale - origin for XYs in path_XYs for XY in XYs if len(XY)]
+    bounds = np.array([np.concatenate((s.min(axis=0), s.max(axis=0))) for s in segments]).reshape(-1, 4)
+
+    cores, windows = [], []
+    for y in range(0, canvas[1], tile_size):
+        for x in range(0, canvas[0], tile_size):
+            core = (x, y, min(x + tile_size, canvas[0]), min(y + tile_size, canvas[1]))
+            cores.append(core)
+            windows.append((max(core[0] - overlap, 0), max(core[1] - overlap, 0),
+                            min(core[2] + overlap, canvas[0]), min(core[3] + overlap, canvas[1])))
+    # Region of every window where contours are known to be complete
+    safe = np.array([(x0 + margin if x0 > 0 else 0, y0 + margin if y0 > 0 else 0,
+                      x1 - margin if x1 < canvas[0] else x1, y1 - margin if y1 < canvas[1] else y1)
+                     for x0, y0, x1, y1 in windows]).reshape(-1, 4)
+
+    def owning_tile(box):
+        fits = (safe[:, 0] <= box[0]) & (safe[:, 1] <= box[1]) & (safe[:, 2] >= box[2]) & (safe[:, 3] >= box[3])
+        return np.argmax(fits) if fits.any() else -1
 
     shapes = {shape: [] for shape in shapes_to_detect}
-
-    for contour in contours:
-        if cv2.contourArea(contour) < 100:
-            continue
+    contours, pending = [], []
+    for index, (core, window) in enumerate(zip(cores, windows)):
+        edges, tile_contours, boxes, cut = window_contours(segments, bounds, window, canvas, margin)
+        for contour, box, is_cut in zip(tile_contours, boxes, cut):
+            if is_cut:
+                pending.append(box)
+            elif owning_tile(box) == index:
+                contours.append(contour)
 
         if 'lines' in shapes_to_detect:
-            lines = cv2.HoughLinesP(edges, 1, np.pi / 180, 50, minLineLength=100, maxLineGap=10)
-            if lines is not None:
-                for line in lines:
-                    for x1, y1, x2, y2 in line:
-                        shapes['lines'].append(((x1, y1), (x2, y2)))
-
-        if 'rectangles' in shapes_to_detect or 'rounded_rectangles' in shapes_to_detect:
-            epsilon = 0.02 * cv2.arcLength(contour, True)
-            approx = cv2.approxPolyDP(contour, epsilon, True)
-
-            if len(approx) == 4:
-                shapes['rectangles'].append(approx)
-                if 'rounded_rectangles' in shapes_to_detect:
-                    hull = cv2.convexHull(approx)
-                    hull_area = cv2.contourArea(hull)
-                    contour_area = cv2.contourArea(contour)
-                    area_ratio = contour_area / hull_area
-                    if area_ratio < 0.9:
-                        shapes['rounded_rectangles'].append(approx)
-
-        if 'stars' in shapes_to_detect:
-            epsilon = 0.02 * cv2.arcLength(contour, True)
-            approx = cv2.approxPolyDP(contour, epsilon, True)
-            if len(approx) >= 5:
-                hull = cv2.convexHull(approx)
-                hull_area = cv2.contourArea(hull)
-                contour_area = cv2.contourArea(contour)
-                area_ratio = contour_area / hull_area
-                if area_ratio < 0.8:
-                    shapes['stars'].append(approx)
-
-        min_contour_area = 350000  # Adjust this value based on your requirements
-
-        if 'circles' in shapes_to_detect:
-        # Circle detection using contour circularity
-            area = cv2.contourArea(contour)
-            if area < min_contour_area:
-                continue  # Skip contours that are too small to be considered circles
-
-            perimeter = cv2.arcLength(contour, True)
-            if perimeter == 0:
+            for (x1, y1), (x2, y2) in detect_lines(edges):
+                mx, my = (x1 + x2) / 2 + window[0], (y1 + y2) / 2 + window[1]
+                if core[0] <= mx < core[2] and core[1] <= my < core[3]:
+                    shapes['lines'].append(((x1 + window[0], y1 + window[1]), (x2 + window[0], y2 + window[1])))
+
+    # Re-detect contours that were cut by tile edges on one window per group of fragments
+    for x0, y0, x1, y1 in merge_boxes(pending, overlap):
+        window = (max(x0, 0), max(y0, 0), min(x1, canvas[0]), min(y1, canvas[1]))
+        _, merged_contours, boxes, cut = window_contours(segments, bounds, window, canvas, margin)
+        for contour, box, is_cut in zip(merged_contours, boxes, cut):
+            if not is_cut and owning_tile(box) == -1:
+                contours.append(contour)
+
+    if 'lines' in shapes_to_detect and not any(cv2.contourArea(c) >= 100 for c in contours):
+        shapes['lines'].clear()
+    classify_features(extract_contour_features(contours), shapes_to_detect, shapes)
+    if dedupe:
+        shapes = deduplicate_shapes(shapes)
+    shapes = translate_shapes(shapes, origin)
+
+    print_detected_shapes(shapes)
+
+    return shapes
+
+def candidate_tiles(segments, canvas, shapes_to_detect, factor=4, tile_size=128, min_area=100,
+                    min_line_length=100, min_shape_area=350000, line_gap=10):
+    """Find the full-scale tiles worth processing from a drawing rasterized ``factor`` times smaller.
+
+    Strokes closer than ``line_gap`` (the Hough gap) are joined, and every
+    connected cluster of coarse ink that is too small for any requested shape
+    class is dropped: no contour inside it could reach ``min_area``, no line
+    ``min_line_length`` and no circle, ellipse or polygon ``min_shape_area``.
+    Returns the (x0, y0, x1, y1) bands of consecutive ``tile_size`` tiles that
+    hold the remaining ink, and the number of coarse pixels.
+    """
+    coarse_size = (canvas[0] // factor + 1, canvas[1] // factor + 1)
+    coarse_segments = [s / factor for s in segments]
+    bounds = np.array([np.concatenate((s.min(axis=0), s.max(axis=0))) for s in coarse_segments]).reshape(-1, 4)
+    ink = (rasterize_window(coarse_segments, bounds, (0, 0) + coarse_size) < 255).astype(np.uint8)
+    ink = cv2.dilate(ink, np.ones((3, 3), np.uint8), iterations=line_gap // factor + 1)
+
+    _, labels, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    # Full-scale extent of every cluster, rounded up
+    width = (stats[:, cv2.CC_STAT_WIDTH] + 1) * factor
+    height = (stats[:, cv2.CC_STAT_HEIGHT] + 1) * factor
+    requested = set(shapes_to_detect)
+    # With circles requested, ellipses and polygons share their area gate (see ``classify_features``)
+    gated = {'circles', 'ellipses', 'polygons'} if 'circles' in requested else set()
+    keep = np.zeros(len(stats), dtype=bool)
+    if requested & ({'rectangles', 'rounded_rectangles', 'stars', 'ellipses', 'polygons'} - gated):
+        keep |= width * height >= min_area
+    if requested & gated:
+        keep |= width * height >= min_shape_area
+    if 'lines' in requested:
+        # Lines are only reported next to a contour of ``min_area``
+        keep |= (np.maximum(width, height) >= min_line_length) | (width * height >= min_area)
+    keep[0] = False  # Background
+    active = keep[labels]
+
+    # A tile is processed when any kept ink falls into it
+    cell = tile_size // factor
+    rows, columns = -(-active.shape[0] // cell), -(-active.shape[1] // cell)
+    padded = np.zeros((rows * cell, columns * cell), dtype=bool)
+    padded[:active.shape[0], :active.shape[1]] = active
+    occupied = padded.reshape(rows, cell, columns, cell).any(axis=(1, 3))
+
+    # Join the occupied tiles of every tile row into runs, so each run is filtered in one call
+    bands = []
+    for y, row in enumerate(occupied):
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], row.astype(np.int8), [0]))))
+        for start, end in zip(edges[::2], edges[1::2]):
+            band = (start * tile_size, y * tile_size, min(end * tile_size, canvas[0]),
+                    min((y + 1) * tile_size, canvas[1]))
+            if band[0] < band[2] and band[1] < band[3]:
+                bands.append(band)
+    return bands, ink.size
+
+@tracing.stage('detect_shapes_pyramid', count_shapes)
+def detect_shapes_pyramid(path_XYs, shapes_to_detect, scale=5, factor=4, tile_size=128, dedupe=True):
+    """Detect coarse to fine: locate the useful ink at ``scale / factor``, then run the pixel stages only there.
+
+    The coarse pass (``candidate_tiles``) costs ``1 / factor**2`` of the
+    canvas and picks the tiles that hold ink of a size some requested shape
+    class could come from. Only those tiles are blurred and run through Canny
+    at full scale (with enough overlap that their edges equal the full-canvas
+    ones), and ``findContours`` and ``HoughLinesP`` see an edge image that is
+    empty everywhere else. The results match ``detect_shapes`` on the whole
+    canvas while the blank parts of the drawing are never filtered.
+    """
+    overlap = 8  # Reach of the 5x5 blur, the Sobel kernel and non-maximum suppression
+    left, top, right, bottom = canvas_bounds(path_XYs, scale)
+    canvas, origin = (right - left, bottom - top), (left, top)
+    segments = [np.asarray(XY, dtype=np.float64) * scale - origin for XYs in path_XYs for XY in XYs if len(XY)]
+    shapes = {shape: [] for shape in shapes_to_detect}
+    if not segments:
+        return shapes
+
+    bands, coarse_pixels = candidate_tiles(segments, canvas, shapes_to_detect, factor, tile_size)
+    # Rasterizing costs in proportion to the ink, so the full-scale canvas is drawn in one go
+    image = np.full((canvas[1], canvas[0]), 255, dtype=np.uint8)
+    rendering.rasterize_polylines(image, np.concatenate(segments), np.cumsum([0] + [len(s) for s in segments]))
+    edges = np.zeros_like(image)
+    for x0, y0, x1, y1 in bands:
+        wx0, wy0 = max(x0 - overlap, 0), max(y0 - overlap, 0)
+        window = image[wy0:min(y1 + overlap, canvas[1]), wx0:min(x1 + overlap, canvas[0])]
+        band_edges = cv2.Canny(preprocess_image(window), 50, 150, apertureSize=3)
+        edges[y0:y1, x0:x1] = band_edges[y0 - wy0:y1 - wy0, x0 - wx0:x1 - wx0]
+    logger.debug("Pyramid detection filtered %d coarse and %d of %d full-scale pixels", coarse_pixels,
+                 sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in bands), image.size)
+
+    contours, _ = cv2.findContours(edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
+    features = extract_contour_features(contours)
+    if 'lines' in shapes_to_detect and len(features['contours']):
+        shapes['lines'].extend(detect_lines(edges))
+    classify_features(features, shapes_to_detect, shapes)
+    if dedupe:
+        shapes = deduplicate_shapes(shapes)
+    shapes = translate_shapes(shapes, origin)
+
+    print_detected_shapes(shapes)
+
+    return shapes
+
+def path_to_contour(XY, scale=5):
+    """Scale a path segment into image coordinates and return it as an OpenCV contour."""
+    return np.round(np.asarray(XY) * scale).astype(np.int32).reshape(-1, 1, 2)
+
+def is_closed_contour(contour, tolerance=0.05):
+    """A segment is closed when its end points meet within ``tolerance`` of its length."""
+    gap = np.linalg.norm(contour[0, 0] - contour[-1, 0])
+    return gap <= max(3.0, tolerance * cv2.arcLength(contour, False))
+
+def join_open_contours(contours, tolerance=10.0):
+    """Chain open contours whose end points meet within ``tolerance`` pixels into closed loops.
+
+    Fragmented drawings split one outline over several segments; only chains
+    that close on themselves are returned.
+    """
+    remaining = list(contours)
+    loops = []
+    while remaining:
+        chain = [remaining.pop()]
+        while remaining:
+            start, end = chain[0][0, 0], chain[-1][-1, 0]
+            if len(chain) > 1 and np.linalg.norm(end - start) <= tolerance:
+                loops.append(np.concatenate(chain))
+                break
+            heads = np.array([c[0, 0] for c in remaining])
+            tails = np.array([c[-1, 0] for c in remaining])
+            head_dist = np.linalg.norm(heads - end, axis=1)
+            tail_dist = np.linalg.norm(tails - end, axis=1)
+            i, j = np.argmin(head_dist), np.argmin(tail_dist)
+            if min(head_dist[i], tail_dist[j]) > tolerance:
+                break
+            if head_dist[i] <= tail_dist[j]:
+                chain.append(remaining.pop(i))
+            else:
+                chain.append(remaining.pop(j)[::-1])
+    return loops
+
+@tracing.stage('detect_shapes_from_paths', count_shapes)
+def detect_shapes_from_paths(path_XYs, shapes_to_detect, scale=5, dedupe=True):
+    """Detect shapes directly on the polylines from ``read_csv`` without rasterizing them.
+
+    Coordinates are scaled exactly like ``parse_csv_with_read_csv`` so the area
+    thresholds and the returned ``shapes`` dict match ``detect_shapes``.
+    """
+    shapes = {shape: [] for shape in shapes_to_detect}
+
+    closed_contours = []
+    open_contours = []
+    for XYs in path_XYs:
+        for XY in XYs:
+            if len(XY) < 2:
                 continue
+            contour = path_to_contour(XY, scale)
+
+            if 'lines' in shapes_to_detect:
+                # Straight runs of at least 100px, the same minimum length used with HoughLinesP
+                approx = cv2.approxPolyDP(contour, 2.0, False).reshape(-1, 2)
+                lengths = np.linalg.norm(np.diff(approx, axis=0), axis=1)
+                for i in np.flatnonzero(lengths >= 100):
+                    (x1, y1), (x2, y2) = approx[i], approx[i + 1]
+                    shapes['lines'].append(((x1, y1), (x2, y2)))
+
+            if len(contour) >= 3 and is_closed_contour(contour):
+                closed_contours.append(contour)
+            else:
+                open_contours.append(contour)
 
-            circularity = 4 * np.pi * (area / (perimeter * perimeter))
-            if 0.7 < circularity < 1.2:  # Adjust the range for circularity as needed
-                (x, y), radius = cv2.minEnclosingCircle(contour)
-                shapes['circles'].append((int(x), int(y), int(radius)))
-
-        if 'ellipses' in shapes_to_detect:
-            if len(contour) >= 5:
-                ellipse = cv2.fitEllipse(contour)
-                shapes['ellipses'].append(ellipse)
-
-        if 'polygons' in shapes_to_detect:
-            epsilon = 0.02 * cv2.arcLength(contour, True)
-            approx = cv2.approxPolyDP(contour, epsilon, True)
-            if len(approx) >= 5:
-                polygon = np.array(approx).reshape(-1, 2)
-                num_sides = len(polygon)
-                angles = []
-                for i in range(num_sides):
-                    p1, p2, p3 = polygon[i], polygon[(i + 1) % num_sides], polygon[(i + 2) % num_sides]
-                    angle = np.arccos(np.dot(p2 - p1, p2 - p3) / (np.linalg.norm(p2 - p1) * np.linalg.norm(p2 - p3)))
-                    angles.append(angle)
-                avg_angle = np.mean(angles)
-                if np.allclose(angles, avg_angle, atol=0.1):
-                    shapes['polygons'].append(approx)
-    print("Detected shapes:")
-    # can be used to print the coordinates of the shapes detected (or center, radius in case of circle)
-    # for shape_type, shape_list in shapes.items():
-    #     if shape_list:
-    #         print(f"- {shape_type.capitalize()}: {len(shape_list)} detected")
-    #         for i, shape in enumerate(shape_list, 1):
-    #             print(f"  {i}. {shape}")
-    for shape_type, shape_list in shapes.items():
-        if shape_list:
-            print(f"- {shape_type.capitalize()}")                   
+    contours = [c[:-1] if np.array_equal(c[0], c[-1]) else c
+                for c in closed_contours + join_open_contours(open_contours)]
+    classify_features(extract_contour_features(contours), shapes_to_detect, shapes)
+    if dedupe:
+        shapes = deduplicate_shapes(shapes)
+
+    print_detected_shapes(shapes)
 
     return shapes
 
-def plot_shapes(original_image, processed_image, shapes, output_dir="output", output_filename=None):
+def stream_detect(csv_path, shapes_to_detect, scale=5, chunk_rows=65536):
+    """Detect shapes and symmetry path by path, yielding ``(path_index, shapes, symmetric_shapes)``.
+
+    Paths are read with ``iter_csv_paths`` and classified with
+    ``detect_shapes_from_paths``, so peak memory depends on the largest single
+    path rather than the whole file. Fragments are only joined within a path.
+    """
+    for path_index, XYs in enumerate(iter_csv_paths(csv_path, chunk_rows)):
+        shapes = detect_shapes_from_paths([XYs], shapes_to_detect, scale)
+        yield path_index, shapes, detect_symmetry(shapes)
+
+@tracing.stage('plot_shapes')
+def plot_shapes(original_image, processed_image, shapes, output_dir="output", output_filename=None, show=True,
+                backend=None):
+    """Draw the detected shapes next to the original image with a ``rendering`` backend.
+
+    ``backend`` is 'none', 'file' (OpenCV, no window) or 'matplotlib'; by
+    default it comes from GENSOLVE_RENDER. Returns the saved path or None.
+    """
+    renderer = rendering.get_backend(backend)
+    if isinstance(renderer, rendering.NullBackend):
+        return None
+
     # Ensure the output directory exists
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -141,132 +767,150 @@ def plot_shapes(original_image, processed_image, shapes, output_dir="output", ou
     # Set the default output filename if not provided
     if output_filename is None:
         output_filename = "detected_shapes.png"
-    
-    # Create the plot
-    fig, axes = plt.subplots(1, 2, figsize=(16, 8))
-
-    # Show the original image
-    axes[0].imshow(original_image, cmap='gray')
-    axes[0].set_title("Original Image")
-    axes[0].axis("off")
-
-    # Show the processed image with detected shapes
-    axes[1].imshow(processed_image, cmap='gray')
-    axes[1].set_title("Detected Shapes")
-    axes[1].axis("off")
-
-    if 'lines' in shapes:
-        for line in shapes['lines']:
-            (x1, y1), (x2, y2) = line
-            axes[1].plot([x1, x2], [y1, y2], 'b-', linewidth=2)
-
-    if 'circles' in shapes:
-        for circle in shapes['circles']:
-            cx, cy, r = circle
-            circle_patch = plt.Circle((cx, cy), r, color='g', fill=False, linewidth=2)
-            axes[1].add_patch(circle_patch)
-
-    if 'ellipses' in shapes:
-        for ellipse in shapes['ellipses']:
-            center, axes_length, angle = ellipse
-            ellipse_patch = Ellipse(center, axes_length[0], axes_length[1], angle=angle, color='r', fill=False, linewidth=2)
-            axes[1].add_patch(ellipse_patch)
-
-    if 'rectangles' in shapes:
-        for rect in shapes['rectangles']:
-            rect = np.array(rect)
-            axes[1].plot(rect[:, 0, 0], rect[:, 0, 1], 'c-', linewidth=2)
-            axes[1].plot([rect[-1, 0, 0], rect[0, 0, 0]], [rect[-1, 0, 1], rect[0, 0, 1]], 'c-', linewidth=2)
-
-    if 'rounded_rectangles' in shapes:
-        for rounded_rect in shapes['rounded_rectangles']:
-            rounded_rect = np.array(rounded_rect)
-            axes[1].plot(rounded_rect[:, 0, 0], rounded_rect[:, 0, 1], 'm-', linewidth=2)
-            axes[1].plot([rounded_rect[-1, 0, 0], rounded_rect[0, 0, 0]], [rounded_rect[-1, 0, 1], rounded_rect[0, 0, 1]], 'm-', linewidth=2)
-
-    if 'polygons' in shapes:
-        for polygon in shapes['polygons']:
-            polygon = np.array(polygon)
-            axes[1].plot(polygon[:, 0, 0], polygon[:, 0, 1], 'y-', linewidth=2)
-            axes[1].plot([polygon[-1, 0, 0], polygon[0, 0, 0]], [polygon[-1, 0, 1], polygon[0, 0, 1]], 'y-', linewidth=2)
-
-    if 'stars' in shapes:
-        for star in shapes['stars']:
-            star = np.array(star)
-            axes[1].plot(star[:, 0, 0], star[:, 0, 1], 'b-', linewidth=2)
-            axes[1].plot([star[-1, 0, 0], star[0, 0, 0]], [star[-1, 0, 1], star[0, 0, 1]], 'b-', linewidth=2)
-
-    # Save the image
-    output_path = os.path.join(output_dir, output_filename)
-    plt.savefig(output_path)
-    print(f"Detected shapes saved to {output_path}")
-
-    # Show the image
-    plt.show()
-
-    # Close the plot to release memory
-    plt.close()
 
+    output_path = renderer.shapes(original_image, processed_image, shapes, os.path.join(output_dir, output_filename),
+                                  show)
+    logger.info("Detected shapes saved to %s", output_path)
+    return output_path
+
+def resample_closed(points, samples):
+    """Resample a closed polygon at ``samples`` points evenly spaced along its perimeter, as complex numbers."""
+    closed = np.vstack([points, points[:1]])
+    cumulative = np.concatenate(([0], np.cumsum(np.hypot(*np.diff(closed, axis=0).T))))
+    t = np.linspace(0, cumulative[-1], samples, endpoint=False)
+    return np.interp(t, cumulative, closed[:, 0]) + 1j * np.interp(t, cumulative, closed[:, 1])
+
+def cyclic_minima(error, tolerance):
+    """Return the index of the smallest error in every cyclic run of ``error <= tolerance``.
+
+    Returns None when the whole cycle is within tolerance (continuous symmetry).
+    """
+    within = error <= tolerance
+    if within.all():
+        return None
+    offset = np.argmin(within)  # Start the scan on a value outside tolerance
+    rolled = np.roll(within, -offset).astype(np.int8)
+    steps = np.diff(np.concatenate(([0], rolled, [0])))
+    starts, stops = np.flatnonzero(steps == 1), np.flatnonzero(steps == -1)
+    rolled_error = np.roll(error, -offset)
+    return [(start + np.argmin(rolled_error[start:stop]) + offset) % len(error) for start, stop in zip(starts, stops)]
+
+def analyze_symmetry(points, tolerance=0.05, samples=1024, circle_tolerance=0.005, angle_tolerance=1.0):
+    """Find the rotational order and every reflection axis of a closed polygon.
+
+    The outline is resampled evenly along its perimeter into a cyclic sequence
+    z (complex, centered on its centroid). A rotation is a cyclic shift d with
+    z[j + d] ~ a * z[j], and a reflection an offset s with z[j] ~ a * conj(z[s - j]).
+    The autocorrelation and self-convolution computed with one FFT give the fit
+    for every d and s at once, in O(n log n). The factor a is the one the
+    dominant harmonic (the best-fit circle) implies for d or s, so the
+    remaining harmonics have to match as well; ``tolerance`` is the allowed RMS
+    deviation relative to the RMS radius. For outlines close to a circle, such
+    as polygons with many sides, it shrinks to half their deviation from that
+    circle, and outlines within ``circle_tolerance`` of it count as circles.
+
+    Returns a dict with the ``center``, the ``rotational_order`` (1 when there is
+    no rotational symmetry, 0 for continuous symmetry) and the
+    ``reflection_axes`` as a list of ((x, y), angle in degrees) lines, or None
+    when every axis through the center is one. Axes closer than
+    ``angle_tolerance`` degrees are reported once.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    result = {'center': None, 'rotational_order': 1, 'reflection_axes': []}
+    if len(points) < 3:
+        return result
+
+    size = max(samples, 2 ** int(np.ceil(np.log2(len(points)))))
+    z = resample_closed(points, size)
+    center = z.mean()
+    z = z - center
+    result['center'] = (center.real, center.imag)
+    energy = np.vdot(z, z).real
+    if energy == 0:
+        return result
+
+    spectrum = np.fft.fft(z)
+    power = np.abs(spectrum) ** 2
+    dominant = np.argmax(power)
+    # Relative RMS deviation from the best-fit circle (the dominant harmonic)
+    deviation = np.sqrt(max(1 - power[dominant] / power.sum(), 0))
+    if deviation <= circle_tolerance:
+        return dict(result, rotational_order=0, reflection_axes=None)
+    tolerance = min(tolerance, deviation / 2)
+
+    rotations = np.fft.ifft(power)
+    reflections = np.fft.ifft(spectrum * spectrum)
+    # Factors of the dominant harmonic for every shift and offset
+    frequency = np.fft.fftfreq(size, 1 / size)[dominant]
+    turn = np.exp(2j * np.pi * frequency * np.arange(size) / size)
+    mirror = turn * (spectrum[dominant] / abs(spectrum[dominant])) ** 2
+
+    def relative_error(correlation, factor):
+        return np.sqrt(np.maximum(2 * (1 - (np.conj(factor) * correlation).real / energy), 0))
+
+    rotation_shifts = cyclic_minima(relative_error(rotations, turn), tolerance)
+    result['rotational_order'] = 0 if rotation_shifts is None else len(rotation_shifts)
+
+    reflection_error = relative_error(reflections, mirror)
+    reflection_offsets = cyclic_minima(reflection_error, tolerance)
+    if reflection_offsets is None:
+        result['reflection_axes'] = None
+        return result
+    angles = []
+    for s in sorted(reflection_offsets, key=reflection_error.__getitem__):
+        angle = float(np.degrees(np.angle(reflections[s]) / 2) % 180)
+        if all(min(abs(angle - other), 180 - abs(angle - other)) > angle_tolerance for other in angles):
+            angles.append(angle)
+    result['reflection_axes'] = [(result['center'], angle) for angle in sorted(angles)]
+    return result
+
+def ellipse_symmetry(ellipse, tolerance=1e-2):
+    """Symmetry of an ellipse from ``cv2.fitEllipse`` output: order 2 with its two axes.
+
+    Ellipses with equal axes are circles, which are reported with a
+    ``rotational_order`` of 0 (continuous) and no finite list of axes (None).
+    """
+    center, axes, angle = ellipse
+    if np.isclose(axes[0], axes[1], rtol=tolerance):
+        return {'center': tuple(center), 'rotational_order': 0, 'reflection_axes': None}
+    axes_lines = [(tuple(center), angle % 180), (tuple(center), (angle + 90) % 180)]
+    return {'center': tuple(center), 'rotational_order': 2, 'reflection_axes': axes_lines}
+
+def has_reflectional_symmetry(symmetry):
+    """Whether an ``analyze_symmetry`` result has any reflection axis (None means every axis)."""
+    return symmetry['reflection_axes'] is None or bool(symmetry['reflection_axes'])
+
+def has_rotational_symmetry(symmetry):
+    """Whether an ``analyze_symmetry`` result has a rotational order above 1 or continuous (0) symmetry."""
+    return symmetry['rotational_order'] != 1
 
 def is_reflectionally_symmetric(points, shape_type):
     """Check if the points of a shape are reflectionally symmetric."""
-    points = np.array(points)
-
-    if shape_type == 'circle':
-        return True  # Circles are always reflectionally symmetric around their center
-
-    if shape_type == 'ellipse':
-        # Ellipses are reflectionally symmetric around both major and minor axes
-        center, axes, angle = points[0], points[1], points[2]  # Assumes format [center, axes, angle]
-        major_axis = axes[0]
-        minor_axis = axes[1]
-
-        if np.allclose(np.mean(points, axis=0), center, atol=1e-2):
-            return True
-
-    # For polygons and other shapes, use the existing reflectional symmetry check
-    centroid = np.mean(points, axis=0)
-    for angle in [0, np.pi / 2]:
-        rot_matrix = np.array([[np.cos(angle), -np.sin(angle)],
-                               [np.sin(angle),  np.cos(angle)]])
-        rotated_points = (rot_matrix @ (points - centroid).T).T + centroid
-        if np.all(np.isclose(rotated_points, np.flipud(points), atol=1e-2)):
-            return True
-    return False
+    if shape_type in ('circle', 'ellipse'):
+        return True  # Circles and ellipses are symmetric about their axes
+
+    return has_reflectional_symmetry(analyze_symmetry(points))
 
 def is_rotationally_symmetric(points, shape_type):
     """Check if the points of a shape are rotationally symmetric."""
-    points = np.array(points)
-
-    if shape_type == 'circle':
-        return True  # Circles are always rotationally symmetric around their center
-
-    if shape_type == 'ellipse':
-        center, axes, angle = points[0], points[1], points[2]  # Assumes format [center, axes, angle]
-        num_rotations = 360  # Number of rotations to test
-        for i in range(num_rotations):
-            rotated_points = np.roll(points, i, axis=0)
-            if np.all(np.isclose(rotated_points, points, atol=1e-2)):
-                return True
-        return False
-
-    # For polygons and other shapes, use the existing rotational symmetry check
-    n = len(points)
-    if n < 3:
-        return False
-
-    for i in range(n):
-        rotated_points = np.roll(points, i, axis=0)
-        if np.all(np.isclose(rotated_points, points, atol=1e-2)):
-            return True
-    return False
+    if shape_type in ('circle', 'ellipse'):
+        return True  # Circles and ellipses are symmetric about their center
+
+    return has_rotational_symmetry(analyze_symmetry(points))
 
+@tracing.stage('detect_symmetry', lambda result: {'reflectional': len(result['reflectional']),
+                                                 'rotational': len(result['rotational'])})
 def detect_symmetry(shapes):
-    """Detect symmetry for the detected shapes and print results."""
-    symmetric_shapes = {'reflectional': [], 'rotational': []}
+    """Detect symmetry for the detected shapes and log the results.
+
+    Besides the 'reflectional' and 'rotational' shape lists, the result holds
+    'details': one dict per analysed shape with its type, index, center,
+    rotational order and reflection axes (see ``analyze_symmetry``).
+    """
+    symmetric_shapes = {'reflectional': [], 'rotational': [], 'details': []}
 
     for shape_type, shape_list in shapes.items():
-        for shape in shape_list:
+        for index, shape in enumerate(shape_list):
             if shape_type == 'lines':
                 continue
 
@@ -274,110 +918,159 @@ def detect_symmetry(shapes):
                 # Circles are inherently symmetric
                 symmetric_shapes['reflectional'].append(shape)
                 symmetric_shapes['rotational'].append(shape)
-                print(f"Circle at center {shape[0]} with radius {shape[1]} has symmetry.")
+                symmetry = {'center': shape[:2], 'rotational_order': 0, 'reflection_axes': None}
+                logger.info("Circle at center %s with radius %s has symmetry.", shape[:2], shape[2])
 
             elif shape_type == 'ellipses':
                 # Ellipses are inherently symmetric around their major and minor axes
                 symmetric_shapes['reflectional'].append(shape)
                 symmetric_shapes['rotational'].append(shape)
-                print(f"Ellipse with center {shape[0]}, axes {shape[1]}, and angle {shape[2]} has symmetry.")
+                symmetry = ellipse_symmetry(shape)
+                logger.info("Ellipse with center %s, axes %s, and angle %s has symmetry.", *shape)
 
             else:
                 # Handle other shapes (polygons)
                 try:
                     points = np.array([pt[0] for pt in shape])
                 except (TypeError, IndexError) as e:
-                    print(f"Error processing shape: {e}")
+                    logger.warning("Error processing shape: %s", e)
                     continue
 
-                has_reflectional_symmetry = is_reflectionally_symmetric(points, shape_type)
-                has_rotational_symmetry = is_rotationally_symmetric(points, shape_type)
+                symmetry = analyze_symmetry(points)
 
-                if has_reflectional_symmetry:
+                # The point arrays are only formatted when DEBUG logging is enabled
+                reflectional = has_reflectional_symmetry(symmetry)
+                rotational = has_rotational_symmetry(symmetry)
+                if reflectional:
                     symmetric_shapes['reflectional'].append(shape)
-                    print(f"{shape_type.capitalize()} shape with points {points} has reflectional symmetry.")
-                if has_rotational_symmetry:
+                    axes = symmetry['reflection_axes']
+                    logger.info("%s shape %d has reflectional symmetry about %s axes.", shape_type.capitalize(),
+                                index, 'all' if axes is None else len(axes))
+                if rotational:
                     symmetric_shapes['rotational'].append(shape)
-                    print(f"{shape_type.capitalize()} shape with points {points} has rotational symmetry.")
+                    logger.info("%s shape %d has rotational symmetry of order %s.", shape_type.capitalize(), index,
+                                symmetry['rotational_order'] or 'infinity')
+                if reflectional or rotational:
+                    logger.debug("%s shape %d points: %s", shape_type.capitalize(), index, points)
+
+            symmetric_shapes['details'].append({'shape_type': shape_type, 'index': index, **symmetry})
 
     if not symmetric_shapes['reflectional'] and not symmetric_shapes['rotational']:
-        print("No shapes with symmetry detected.")
+        logger.info("No shapes with symmetry detected.")
 
     return symmetric_shapes
 
 
 
+def symmetric_detections(shapes, symmetric_shapes):
+    """Group the shapes with any reflectional or rotational symmetry by type, using ``symmetric_shapes['details']``."""
+    grouped = {}
+    for detail in symmetric_shapes['details']:
+        if has_reflectional_symmetry(detail) or has_rotational_symmetry(detail):
+            grouped.setdefault(detail['shape_type'], []).append(shapes[detail['shape_type']][detail['index']])
+    return grouped
+
+@tracing.stage('overlay')
 def overlay_detected_shapes(original_image, original_paths, shapes, symmetric_shapes):
+    """Draw the paths, the detections (black) and the symmetric detections (red, as gray 76) in batched calls."""
     if isinstance(original_image, np.ndarray):
-        final_image = Image.fromarray(original_image)
-    else:
         final_image = original_image.copy()
-
-    if final_image.mode != 'L':
-        final_image = final_image.convert('L')
-    draw = ImageDraw.Draw(final_image)
+    else:
+        final_image = np.array(original_image.convert('L'))
 
     # Draw original paths
-    for path_points in original_paths:
-        for points in path_points:
-            if len(points) > 1:
-                draw.line(points, fill=0, width=1)
-
-    # Draw detected shapes
-    for shape_type, shape_list in shapes.items():
-        if shape_type == 'lines':
-            for line in shape_list:
-                (x1, y1), (x2, y2) = line
-                draw.line([x1, y1, x2, y2], fill=0, width=2)
-        elif shape_type == 'circles':
-            for circle in shape_list:
-                cx, cy, r = circle
-                draw.ellipse([cx - r, cy - r, cx + r, cy + r], outline=0, width=2)
-        elif shape_type == 'ellipses':
-            for ellipse in shape_list:
-                center, axes, angle = ellipse
-                draw.ellipse([
-                    center[0] - axes[0], center[1] - axes[1],
-                    center[0] + axes[0], center[1] + axes[1]
-                ], outline=0, width=2)
-        elif shape_type in ['rectangles', 'rounded_rectangles', 'polygons', 'stars']:
-            for shape in shape_list:
-                for i in range(len(shape)):
-                    p1 = tuple(shape[i, 0])
-                    p2 = tuple(shape[(i + 1) % len(shape), 0])
-                    draw.line([p1, p2], fill=0, width=2)
-
-    # Highlight symmetric shapes
-    for shape_type, shape_list in symmetric_shapes.items():
-        for shape in shape_list:
-            for i in range(len(shape)):
-                p1 = tuple(shape[i, 0])
-                p2 = tuple(shape[(i + 1) % len(shape), 0])
-                draw.line([p1, p2], fill='red', width=2)
-
-    return final_image
+    segments = [np.asarray(XY, dtype=np.float64).reshape(-1, 2) for XYs in original_paths for XY in XYs]
+    if segments:
+        starts = np.concatenate(([0], np.cumsum([len(XY) for XY in segments])))
+        rendering.rasterize_polylines(final_image, np.concatenate(segments), starts)
+
+    # Draw detected shapes, then highlight the symmetric ones in PIL's grayscale 'red'
+    rendering.draw_shapes(final_image, shapes, color=0)
+    rendering.draw_shapes(final_image, symmetric_detections(shapes, symmetric_shapes), color=76)
+
+    return Image.fromarray(final_image)
+
+def export_svg(original_paths, shapes, symmetric_shapes, output_path, size=None):
+    """Write the scaled paths, the detections and the symmetric detections as an SVG vector image.
+
+    ``size`` is the (width, height) of the canvas; by default it fits the paths.
+    """
+    segments = [XY for XYs in original_paths for XY in XYs]
+    width, height = size or canvas_size(original_paths, 1)
+    return rendering.write_svg(output_path, width, height, paths=segments, shapes=shapes,
+                               highlights=symmetric_detections(shapes, symmetric_shapes))
+
+# Source files whose code decides the detections, hashed into every cache key
+detection_sources = [__file__, spatial_index.__file__, rendering.__file__]
+
+def detection_cache_key(cache, csv_path, shapes_to_detect, scale=5, vector=False, tile_size=None, pyramid=False):
+    """Key of ``detect_csv``'s result in ``cache`` for these arguments.
+
+    Every file is hashed by content, so the key changes with the CSV itself
+    and with any of the ``detection_sources``.
+    """
+    return cache.key([csv_path] + detection_sources, shapes=list(shapes_to_detect), scale=scale, vector=vector,
+                     tile_size=tile_size, pyramid=pyramid)
+
+def detect_csv(csv_path, shapes_to_detect, scale=5, vector=False, tile_size=None, processed_image=None, cache=None,
+               pyramid=False):
+    """Detect shapes and their symmetry in a CSV, returning ``(shapes, symmetric_shapes)``.
+
+    ``vector`` classifies the paths directly, ``tile_size`` detects tile by
+    tile, ``pyramid`` detects coarse to fine, otherwise ``processed_image``
+    (the ``parse_csv_with_read_csv`` canvas, rasterized and preprocessed here
+    when not given) is used. The shapes are in scaled CSV coordinates in
+    every mode. Results go through ``result_cache``: ``cache`` or the
+    GENSOLVE_CACHE_DIR cache, keyed on the CSV contents, the
+    ``detection_sources`` and the parameters. Without a cache this just
+    runs the detection.
+    """
+    def compute():
+        if vector:
+            shapes = detect_shapes_from_paths(read_csv(csv_path), shapes_to_detect, scale)
+        elif tile_size:
+            shapes = detect_shapes_tiled(read_csv(csv_path), shapes_to_detect, scale, tile_size)
+        elif pyramid:
+            shapes = detect_shapes_pyramid(read_csv(csv_path), shapes_to_detect, scale)
+        else:
+            image = processed_image
+            if image is None:
+                image = preprocess_image(parse_csv_with_read_csv(csv_path, scale)[0])
+            # Move the detections from the canvas back to scaled CSV coordinates
+            shapes = translate_shapes(detect_shapes(image, shapes_to_detect),
+                                      canvas_bounds(read_csv(csv_path), scale)[:2])
+        return shapes, detect_symmetry(shapes)
+
+    cache = cache or result_cache.default_cache()
+    if cache is None:
+        return compute()
+    return cache.get_or_compute(detection_cache_key(cache, csv_path, shapes_to_detect, scale, vector, tile_size,
+                                                    pyramid), compute)
 
 def main():
     csv_path = "./problems/isolated.csv"  # Change this path as needed
     shapes_to_detect = ['rectangles', 'circles', 'stars']  #Only Add the shapes you want to detect
     # 'lines', 'rectangles', 'rounded_rectangles', 'circles', 'ellipses', 'polygons', 'stars'
+    use_vector_detection = False  # Classify the CSV paths directly instead of the rasterized image
 
     # Get the base name of the CSV file and create a unique output filename
     csv_filename = os.path.basename(csv_path)
     output_filename = f"detected_shapes_{os.path.splitext(csv_filename)[0]}.png"
 
-    # Parse CSV and preprocess image
-    original_image, original_paths = parse_csv_with_read_csv(csv_path)
-    processed_image = preprocess_image(original_image)
-
-    # Detect shapes
-    shapes = detect_shapes(processed_image, shapes_to_detect)
+    with tracing.session(os.path.splitext(csv_filename)[0]):
+        # Parse CSV and preprocess image
+        original_image, original_paths = parse_csv_with_read_csv(csv_path)
+        processed_image = preprocess_image(original_image)
 
-    # Detect symmetry
-    symmetric_shapes = detect_symmetry(shapes)
+        # Detect shapes and their symmetry (cached when GENSOLVE_CACHE_DIR is set)
+        shapes, symmetric_shapes = detect_csv(csv_path, shapes_to_detect, vector=use_vector_detection,
+                                              processed_image=processed_image)
 
-    # Plot shapes with detected symmetry
-    plot_shapes(original_image, processed_image, shapes, output_filename=output_filename)
+        # Plot shapes with detected symmetry, moved onto the canvas
+        origin = canvas_bounds(read_csv(csv_path))[:2]
+        plot_shapes(original_image, processed_image, translate_shapes(shapes, (-origin[0], -origin[1])),
+                    output_filename=output_filename)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get("GENSOLVE_LOG_LEVEL", "WARNING"), format="%(message)s")
     main()
@@ -0,0 +1,436 @@
+"""Regularize hand-drawn paths into ideal lines, circles, ellipses, rectangles and regular polygons.
+
+Usage:
+    python regularize.py problems/isolated.csv output/isolated_regularized.csv
+
+Every segment is first resampled evenly along its length, so the fits do not
+depend on how densely it was drawn. All segments are then fitted with every
+model at once: the least-squares sums of all segments come out of single
+``np.add.reduceat`` calls over the flat point array of ``read_csv_flat``, and
+the small per-segment systems are solved as stacked NumPy arrays. There is no
+Python loop over the paths, so thousands of curves are regularized per second.
+
+A segment is replaced by the simplest model that fits it within ``tolerance``
+(the RMS distance of its points to the model, relative to the segment's
+bounding-box diagonal). Open segments become lines or circular and elliptical
+arcs, closed ones circles, ellipses, rectangles or regular polygons. Open
+strokes get the tighter ``open_tolerance``: a short S-bend fits an arc about
+as well, relative to its size, as a wobbly closed circle. Segments that fit
+nothing are kept as drawn. The result is written in the CSV format of the
+inputs, with lines as their end points, rectangles and polygons as their
+corners and curves sampled with as many points as the original segment.
+"""
+import logging
+import os
+import sys
+
+import numpy as np
+
+import main as shape_main
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import tracing
+
+logger = logging.getLogger("gensolve.regularize")
+
+# Candidate models, simplest first
+models = ('lines', 'circles', 'ellipses', 'rectangles', 'polygons')
+open_models = ('lines', 'circles', 'ellipses')
+closed_models = ('circles', 'ellipses', 'rectangles', 'polygons')
+
+# Side counts tried for regular polygons (squares are rectangles)
+polygon_sides = (3, 5, 6, 7, 8)
+
+def resample_segments(xy, offsets, min_samples=64):
+    """Resample every segment at evenly spaced arc lengths, keeping its end points.
+
+    Each segment gets at least ``min_samples`` points (more when it already
+    had more). Returns a new flat point array and offsets.
+    """
+    xy = np.asarray(xy, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    starts = offsets[:-1, 1]
+    counts = np.diff(offsets[:, 1])
+    ends = starts + counts - 1
+
+    # Arc length position of every point; steps into the first point of a segment are zero
+    step = np.zeros(len(xy))
+    step[1:] = np.hypot(*np.diff(xy, axis=0).T)
+    step[starts] = 0
+    position = np.cumsum(step)
+
+    samples = np.maximum(counts, min_samples)
+    index = np.repeat(np.arange(len(starts)), samples)
+    k = np.arange(samples.sum()) - np.repeat(np.cumsum(samples) - samples, samples)
+    target = position[starts][index] + (position[ends] - position[starts])[index] * k / (samples - 1)[index]
+    # Interpolate inside the owning segment between the points around each target
+    before = np.searchsorted(position, target, side='right') - 1
+    before = np.clip(before, starts[index], np.maximum(ends[index] - 1, starts[index]))
+    after = np.minimum(before + 1, ends[index])
+    span = position[after] - position[before]
+    fraction = np.clip((target - position[before]) / np.where(span > 0, span, 1), 0, 1)
+    new_xy = xy[before] + fraction[:, None] * (xy[after] - xy[before])
+
+    new_offsets = offsets.copy()
+    new_offsets[:-1, 1] = np.cumsum(samples) - samples
+    new_offsets[-1, 1] = samples.sum()
+    return new_xy, new_offsets
+
+class Segments:
+    """The segments of a flat point array, with the per-point and per-segment values every fit needs."""
+
+    def __init__(self, xy, offsets):
+        self.xy = np.asarray(xy, dtype=np.float64)
+        self.starts = np.asarray(offsets[:-1, 1], dtype=np.int64)
+        self.path_numbers = np.asarray(offsets[:-1, 0], dtype=np.int64)
+        self.counts = np.diff(np.asarray(offsets[:, 1], dtype=np.int64))
+        self.ends = self.starts + self.counts - 1
+        self.index = np.repeat(np.arange(len(self.starts)), self.counts)  # Segment of every point
+
+        # Work relative to each segment's mean for numerically stable sums
+        self.mean = self.sum(self.xy) / self.counts[:, None]
+        self.local = self.xy - self.mean[self.index]
+        low = np.minimum.reduceat(self.xy, self.starts, axis=0)
+        high = np.maximum.reduceat(self.xy, self.starts, axis=0)
+        self.size = np.maximum(np.hypot(*(high - low).T), 1e-12)
+
+        # Step from every point to the next one inside its segment (zero at segment ends)
+        is_end = np.zeros(len(self.xy), dtype=bool)
+        is_end[self.ends] = True
+        self.step = np.zeros_like(self.xy)
+        self.step[:-1] = self.xy[1:] - self.xy[:-1]
+        self.step[is_end] = 0
+        step_length = np.hypot(*self.step.T)
+        self.length = self.sum(step_length)
+        gap = np.hypot(*(self.xy[self.starts] - self.xy[self.ends]).T)
+        self.closed = (self.counts >= 4) & (gap <= 0.05 * self.length)
+
+        # Shoelace terms over the outline closed back to the first point
+        following = np.where(is_end[:, None], self.local[self.starts[self.index]], np.roll(self.local, -1, axis=0))
+        cross = self.local[:, 0] * following[:, 1] - self.local[:, 1] * following[:, 0]
+        self.area = self.sum(cross) / 2  # Positive when drawn counterclockwise (y up)
+        # Area centroid, exact for polygons whatever the point spacing
+        centroid_sum = self.sum((self.local + following) * cross[:, None]) / 6
+        flat = np.abs(self.area) <= 1e-12 * self.size ** 2
+        self.centroid = self.mean + np.where(flat[:, None], 0, centroid_sum / np.where(flat, 1, self.area)[:, None])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def sum(self, values):
+        """Per-segment sums of per-point ``values`` (any trailing shape)."""
+        return np.add.reduceat(values, self.starts, axis=0)
+
+    def rms(self, distances):
+        """Per-segment RMS of per-point distances, relative to the segment size."""
+        return np.sqrt(self.sum(distances ** 2) / self.counts) / self.size
+
+def fit_lines(segments):
+    """Total least-squares line of every segment; returns the end points and the relative RMS distance."""
+    x, y = segments.local.T
+    sxx, sxy, syy = segments.sum(x * x), segments.sum(x * y), segments.sum(y * y)
+    theta = 0.5 * np.arctan2(2 * sxy, sxx - syy)
+    direction = np.stack([np.cos(theta), np.sin(theta)], axis=1)
+    along = np.einsum('ij,ij->i', segments.local, direction[segments.index])
+    across = np.einsum('ij,ij->i', segments.local, direction[segments.index] @ [[0, 1], [-1, 0]])
+    # Keep the drawing direction: the line runs from the first point's end to the last point's
+    low, high = np.minimum.reduceat(along, segments.starts), np.maximum.reduceat(along, segments.starts)
+    forward = along[segments.starts] <= along[segments.ends]
+    t = np.stack([np.where(forward, low, high), np.where(forward, high, low)], axis=1)
+    ends = segments.mean[:, None, :] + t[:, :, None] * direction[:, None, :]
+    return ends, segments.rms(across)
+
+def fit_circles(segments):
+    """Algebraic (Kasa) circle of every segment; returns centers, radii and the relative RMS distance."""
+    x, y = segments.local.T
+    z = x * x + y * y
+    sxx, sxy, syy = segments.sum(x * x), segments.sum(x * y), segments.sum(y * y)
+    sxz, syz, sz = segments.sum(x * z), segments.sum(y * z), segments.sum(z)
+    # Around the mean the normal equations reduce to a 2x2 system for the center
+    det = sxx * syy - sxy * sxy
+    valid = (segments.counts >= 3) & (np.abs(det) > 1e-12 * np.maximum(sxx * syy, 1e-300))
+    safe_det = np.where(valid, det, 1)
+    d = -(syy * sxz - sxy * syz) / safe_det
+    e = -(sxx * syz - sxy * sxz) / safe_det
+    center = np.stack([-d / 2, -e / 2], axis=1)
+    radius = np.sqrt(np.maximum(center[:, 0] ** 2 + center[:, 1] ** 2 + sz / segments.counts, 0))
+    distance = np.hypot(*(segments.local - center[segments.index]).T) - radius[segments.index]
+    error = np.where(valid, segments.rms(distance), np.inf)
+    return segments.mean + center, radius, error
+
+def fit_ellipses(segments):
+    """Direct least-squares ellipse (Halir and Flusser) of every segment.
+
+    Returns centers, semi-axes, angles (radians) and the relative RMS of the
+    first-order (Sampson) distance of the points to the ellipse.
+    """
+    count = len(segments)
+    centers = np.zeros((count, 2))
+    semi_axes = np.ones((count, 2))
+    angles = np.zeros(count)
+    error = np.full(count, np.inf)
+
+    # Normalize every segment to unit size to keep the 6x6 scatter matrices well conditioned
+    scale = segments.size[segments.index]
+    x, y = (segments.local / scale[:, None]).T
+    design = np.stack([x * x, x * y, y * y, x, y, np.ones_like(x)], axis=1)
+    scatter = segments.sum(design[:, :, None] * design[:, None, :])
+    s1, s2, s3 = scatter[:, :3, :3], scatter[:, :3, 3:], scatter[:, 3:, 3:]
+    valid = (segments.counts >= 6) & (np.abs(np.linalg.det(s3)) > 1e-14)
+    if not valid.any():
+        return centers, semi_axes, angles, error
+
+    s1, s2, s3 = s1[valid], s2[valid], s3[valid]
+    t = -np.linalg.solve(s3, np.swapaxes(s2, 1, 2))
+    m = s1 + s2 @ t
+    # Multiply by the inverse of the ellipse constraint matrix
+    m = np.stack([m[:, 2] / 2, -m[:, 1], m[:, 0] / 2], axis=1)
+    _, vectors = np.linalg.eig(m)
+    vectors = vectors.real
+    condition = 4 * vectors[:, 0] * vectors[:, 2] - vectors[:, 1] ** 2
+    best = np.argmax(condition, axis=1)
+    ellipse = condition[np.arange(len(best)), best] > 0
+    a1 = vectors[np.arange(len(best)), :, best]
+    conic = np.concatenate([a1, np.einsum('ijk,ik->ij', t, a1)], axis=1)
+    a, b, c, d, e, f = conic.T
+
+    # Center, axes and angle of the conic a x^2 + b xy + c y^2 + d x + e y + f = 0
+    det = 4 * a * c - b * b
+    safe_det = np.where(ellipse, det, 1)
+    x0 = (b * e - 2 * c * d) / safe_det
+    y0 = (b * d - 2 * a * e) / safe_det
+    f0 = a * x0 * x0 + b * x0 * y0 + c * y0 * y0 + d * x0 + e * y0 + f
+    theta = 0.5 * np.arctan2(b, a - c)
+    cos, sin = np.cos(theta), np.sin(theta)
+    a_rot = a * cos * cos + b * cos * sin + c * sin * sin
+    c_rot = a * sin * sin - b * cos * sin + c * cos * cos
+    with np.errstate(divide='ignore', invalid='ignore'):
+        axes = np.sqrt(np.stack([-f0 / a_rot, -f0 / c_rot], axis=1))
+    ellipse &= np.all(np.isfinite(axes), axis=1)
+
+    # Sampson distance |Q(p)| / |grad Q(p)| of every point, back in drawing units
+    rows = np.flatnonzero(valid)
+    lookup = np.full(count, -1)
+    lookup[rows] = np.arange(len(rows))
+    point_rows = lookup[segments.index]
+    has_fit = point_rows >= 0
+    q = conic[np.maximum(point_rows, 0)]
+    value = np.einsum('ij,ij->i', design, q)
+    grad_x = 2 * q[:, 0] * x + q[:, 1] * y + q[:, 3]
+    grad_y = q[:, 1] * x + 2 * q[:, 2] * y + q[:, 4]
+    distance = np.where(has_fit, np.abs(value) / np.maximum(np.hypot(grad_x, grad_y), 1e-12), 0) * scale
+
+    size = segments.size[valid][:, None]
+    centers[valid] = segments.mean[valid] + np.stack([x0, y0], axis=1) * size
+    semi_axes[valid] = np.where(ellipse[:, None], axes * size, 1)
+    angles[valid] = theta
+    error[valid] = np.where(ellipse, segments.rms(distance)[valid], np.inf)
+    return centers, semi_axes, angles, error
+
+def fit_rectangles(segments):
+    """Least-squares rectangle of every segment; returns the four corners and the relative RMS distance.
+
+    The orientation comes from the fourfold mean of the step
+    directions. Each point is then assigned to its nearest side, and every
+    side is the mean of the points assigned to it.
+    """
+    phi = np.arctan2(segments.step[:, 1], segments.step[:, 0])
+    moving = np.any(segments.step != 0, axis=1)
+    theta = np.arctan2(segments.sum(moving * np.sin(4 * phi)), segments.sum(moving * np.cos(4 * phi))) / 4
+    cos, sin = np.cos(theta)[segments.index], np.sin(theta)[segments.index]
+    u = segments.local[:, 0] * cos + segments.local[:, 1] * sin
+    v = -segments.local[:, 0] * sin + segments.local[:, 1] * cos
+    uv = np.stack([u, v], axis=1)
+    low = np.minimum.reduceat(uv, segments.starts, axis=0)
+    high = np.maximum.reduceat(uv, segments.starts, axis=0)
+    sides = np.stack([low[:, 0], high[:, 0], low[:, 1], high[:, 1]], axis=1)
+
+    # One refinement pass: every side becomes the mean coordinate of its nearest points
+    coordinate = np.stack([u, u, v, v], axis=1)
+    nearest = np.argmin(np.abs(coordinate - sides[segments.index]), axis=1)
+    slot = segments.index * 4 + nearest
+    totals = np.bincount(slot, coordinate[np.arange(len(u)), nearest], minlength=4 * len(segments))
+    hits = np.bincount(slot, minlength=4 * len(segments))
+    refined = sides.ravel().copy()
+    refined[hits > 0] = totals[hits > 0] / hits[hits > 0]
+    sides = refined.reshape(-1, 4)
+    distance = np.min(np.abs(coordinate - sides[segments.index]), axis=1)
+
+    u0, u1, v0, v1 = sides.T
+    corners_uv = np.stack([np.stack([u0, v0], 1), np.stack([u1, v0], 1), np.stack([u1, v1], 1),
+                           np.stack([u0, v1], 1)], axis=1)
+    cos, sin = np.cos(theta)[:, None], np.sin(theta)[:, None]
+    corners = np.stack([corners_uv[..., 0] * cos - corners_uv[..., 1] * sin,
+                        corners_uv[..., 0] * sin + corners_uv[..., 1] * cos], axis=2) + segments.mean[:, None, :]
+    return corners, segments.rms(distance)
+
+def fit_regular_polygons(segments, sides):
+    """Least-squares regular polygons around every segment's area centroid, for each side count in ``sides``.
+
+    The vertex direction is the phase of the n-fold harmonic of the radius,
+    and the apothem the mean distance of the points to the center along the
+    normal of their side. Returns the corners of the best side count, the
+    index of that count in ``sides`` and its relative RMS distance.
+    """
+    relative = segments.xy - segments.centroid[segments.index]
+    rho = np.hypot(*relative.T)
+    phi = np.arctan2(relative[:, 1], relative[:, 0])
+    fits = []
+    for count in sides:
+        vertex = np.arctan2(segments.sum(rho * np.sin(count * phi)), segments.sum(rho * np.cos(count * phi))) / count
+        wedge = 2 * np.pi / count
+        # Angle of every point from the middle of its side
+        offset = np.mod(phi - vertex[segments.index], wedge) - wedge / 2
+        height = rho * np.cos(offset)
+        apothem = segments.sum(height) / segments.counts
+        fits.append((vertex, apothem, segments.rms(height - apothem[segments.index])))
+    errors = np.stack([error for _, _, error in fits], axis=1)
+    best = np.argmin(errors, axis=1)
+    error = errors[np.arange(len(segments)), best]
+
+    corners = []
+    for i, count in enumerate(sides):
+        vertex, apothem, _ = fits[i]
+        angles = vertex[:, None] + 2 * np.pi / count * np.arange(count)
+        radius = (apothem / np.cos(np.pi / count))[:, None, None]
+        corners.append(segments.centroid[:, None, :] + radius * np.stack([np.cos(angles), np.sin(angles)], axis=2))
+    return corners, best, error
+
+def sample_ellipses(segments, rows, counts, centers, semi_axes, angles):
+    """``counts`` points on the ellipses of ``rows``.
+
+    Closed segments go once around from their first point, open ones follow
+    the arc from their first to their last point, in the drawing direction.
+    """
+    index = np.repeat(np.arange(len(rows)), counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cos, sin = np.cos(angles), np.sin(angles)
+
+    def parameter(points):
+        relative = points - centers
+        return np.arctan2((-relative[:, 0] * sin + relative[:, 1] * cos) / semi_axes[:, 1],
+                          (relative[:, 0] * cos + relative[:, 1] * sin) / semi_axes[:, 0])
+
+    start = parameter(segments.xy[segments.starts[rows]])
+    end = parameter(segments.xy[segments.ends[rows]])
+    # The sign of the area enclosed with the chord tells the drawing direction
+    direction = np.where(segments.area[rows] < 0, -1.0, 1.0)
+    sweep = np.where(segments.closed[rows], 2 * np.pi, np.mod(direction * (end - start), 2 * np.pi)) * direction
+    t = start[index] + sweep[index] * k / np.maximum(counts[index] - 1, 1)
+    x = semi_axes[index, 0] * np.cos(t)
+    y = semi_axes[index, 1] * np.sin(t)
+    return np.stack([centers[index, 0] + x * cos[index] - y * sin[index],
+                     centers[index, 1] + x * sin[index] + y * cos[index]], axis=1)
+
+def close_corners(segments, rows, corners):
+    """Closed corner lists of ``rows`` in their drawing direction, starting at the corner nearest their first point."""
+    corners = np.where((segments.area[rows] < 0)[:, None, None], corners[:, ::-1], corners)
+    first = segments.xy[segments.starts[rows]]
+    nearest = np.argmin(np.hypot(*(corners - first[:, None, :]).transpose(2, 0, 1)), axis=1)
+    sides = corners.shape[1]
+    corners = np.take_along_axis(corners, ((np.arange(sides) + nearest[:, None]) % sides)[:, :, None], axis=1)
+    return np.concatenate([corners, corners[:, :1]], axis=1)
+
+@tracing.stage('regularize', lambda result: {'segments': len(result[2])})
+def regularize(xy, offsets, tolerance=0.015, open_tolerance=0.01, slack=3.0, shapes=models):
+    """Fit every segment of a flat point array and replace it with its simplest acceptable model.
+
+    A model is acceptable within ``tolerance`` (``open_tolerance`` for open
+    segments) when no other model fits more than ``slack`` times better;
+    errors below a fifth of the tolerance count as exact fits, so an almost
+    straight stroke stays a line rather than a huge arc. ``shapes`` limits the
+    candidate models. Returns the new flat point array, its offsets (in the
+    ``group_paths`` layout) and the chosen model per segment (``''`` when the
+    segment was kept as drawn).
+    """
+    counts = np.diff(np.asarray(offsets[:, 1], dtype=np.int64))
+    segments = Segments(*resample_segments(xy, offsets))
+    errors = {}
+    if 'lines' in shapes:
+        line_ends, errors['lines'] = fit_lines(segments)
+    if 'circles' in shapes:
+        circle_centers, radii, errors['circles'] = fit_circles(segments)
+    if 'ellipses' in shapes:
+        ellipse_centers, semi_axes, angles, errors['ellipses'] = fit_ellipses(segments)
+    if 'rectangles' in shapes:
+        rectangle_corners, errors['rectangles'] = fit_rectangles(segments)
+    if 'polygons' in shapes:
+        polygon_corners, polygon_sides_index, errors['polygons'] = fit_regular_polygons(segments, polygon_sides)
+
+    # Pick the simplest acceptable model per segment
+    names = [name for name in models if name in errors]
+    table = np.full((len(segments), len(names)), np.inf)
+    for i, name in enumerate(names):
+        allowed = np.where(segments.closed, name in closed_models, name in open_models)
+        table[:, i] = np.where(allowed, errors[name], np.inf)
+    best = table.min(axis=1, initial=np.inf)[:, None]
+    limit = np.where(segments.closed, tolerance, open_tolerance)[:, None]
+    acceptable = (table <= limit) & ((table <= tolerance / 5) | (table <= slack * best))
+    chosen = np.where(acceptable.any(axis=1), np.argmax(acceptable, axis=1), -1)
+    kinds = np.array([names[i] if i >= 0 else '' for i in chosen], dtype=object)
+
+    # Build the output point blocks, one model at a time
+    blocks = [None] * len(segments)
+    for name in names:
+        rows = np.flatnonzero(kinds == name)
+        if not len(rows):
+            continue
+        if name == 'lines':
+            new = list(line_ends[rows])
+        elif name == 'circles':
+            radius = np.repeat(radii[rows, None], 2, axis=1)
+            points = sample_ellipses(segments, rows, counts[rows], circle_centers[rows], radius, np.zeros(len(rows)))
+            new = np.split(points, np.cumsum(counts[rows])[:-1])
+        elif name == 'ellipses':
+            points = sample_ellipses(segments, rows, counts[rows], ellipse_centers[rows], semi_axes[rows],
+                                     angles[rows])
+            new = np.split(points, np.cumsum(counts[rows])[:-1])
+        elif name == 'rectangles':
+            new = list(close_corners(segments, rows, rectangle_corners[rows]))
+        else:
+            # Polygons are built per side count; their rows are filled in place
+            new = []
+            for i, corners in enumerate(polygon_corners):
+                group = rows[polygon_sides_index[rows] == i]
+                for row, block in zip(group, close_corners(segments, group, corners[group])):
+                    blocks[row] = block
+        for row, block in zip(rows, new):
+            blocks[row] = block
+    starts = np.asarray(offsets[:-1, 1], dtype=np.int64)
+    for row in np.flatnonzero(kinds == ''):
+        blocks[row] = np.asarray(xy[starts[row]:starts[row] + counts[row]], dtype=np.float64)
+
+    new_counts = np.array([len(block) for block in blocks], dtype=np.int64)
+    new_offsets = np.empty((len(segments) + 1, 2), dtype=np.int64)
+    new_offsets[:-1, 0] = segments.path_numbers
+    new_offsets[:-1, 1] = np.cumsum(new_counts) - new_counts
+    new_offsets[-1] = (offsets[-1, 0], new_counts.sum())
+    new_xy = np.concatenate(blocks) if blocks else np.empty((0, 2))
+    return new_xy, new_offsets, kinds
+
+def write_csv(output_path, xy, offsets):
+    """Write a flat point array in the CSV layout of the inputs: path, segment, x, y."""
+    counts = np.diff(offsets[:, 1])
+    path_numbers = offsets[:-1, 0]
+    # Number the segments from 0 within each path
+    path_first = np.concatenate(([0], np.flatnonzero(np.diff(path_numbers)) + 1))
+    first_of_path = np.repeat(path_first, np.diff(np.concatenate((path_first, [len(path_numbers)]))))
+    segment_numbers = np.arange(len(path_numbers)) - first_of_path
+    rows = np.column_stack([np.repeat(path_numbers, counts), np.repeat(segment_numbers, counts), xy])
+    np.savetxt(output_path, rows, delimiter=',')
+    return output_path
+
+def regularize_csv(csv_path, output_path, tolerance=0.015, open_tolerance=0.01, use_cache=False):
+    """Regularize every path of a CSV file into ``output_path``; returns the chosen model per segment."""
+    xy, offsets = shape_main.read_csv_flat(csv_path, use_cache=use_cache)
+    new_xy, new_offsets, kinds = regularize(xy, offsets, tolerance, open_tolerance)
+    write_csv(output_path, new_xy, new_offsets)
+    logger.info("Regularized %d segments of %s into %s: %s", len(kinds), csv_path, output_path,
+                {name: int(np.sum(kinds == name)) for name in models + ('',) if np.any(kinds == name)})
+    return kinds
+
+if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get("GENSOLVE_LOG_LEVEL", "WARNING"), format="%(message)s")
+    if len(sys.argv) != 3:
+        sys.exit(f"usage: {sys.argv[0]} INPUT.csv OUTPUT.csv")
+    regularize_csv(sys.argv[1], sys.argv[2])
@@ -0,0 +1,122 @@
+"""Columnar storage for the ``shapes`` and ``symmetric_shapes`` dicts of ``main.py``.
+
+Every shape type becomes a NumPy structured array with one row per detection,
+and all outline vertices (rectangles, polygons, stars, ...) share one flat
+``(n, 2)`` int32 buffer addressed by per-row offsets. Symmetry results are
+stored as columns of the same rows, with the reflection axes in a flat table
+of their own. The whole result saves to and loads from a single ``.npz``.
+"""
+import numpy as np
+
+# Types stored as outlines in the shared vertex buffer
+outline_types = ('rectangles', 'rounded_rectangles', 'polygons', 'stars')
+
+symmetry_fields = [
+    ('rotational_order', 'i2'),   # 1 = none, 0 = continuous, -1 = not analysed
+    ('reflection_axes', 'i2'),    # number of axes, -1 = every axis through the center
+    ('center_x', 'f8'),
+    ('center_y', 'f8'),
+]
+
+dtypes = {
+    'lines': np.dtype([('x1', 'i4'), ('y1', 'i4'), ('x2', 'i4'), ('y2', 'i4')] + symmetry_fields),
+    'circles': np.dtype([('x', 'i4'), ('y', 'i4'), ('r', 'i4')] + symmetry_fields),
+    'ellipses': np.dtype([('cx', 'f8'), ('cy', 'f8'), ('width', 'f8'), ('height', 'f8'), ('angle', 'f8')]
+                         + symmetry_fields),
+    'outlines': np.dtype([('start', 'i8'), ('count', 'i4')] + symmetry_fields),
+}
+
+axis_dtype = np.dtype([('shape_type', 'U18'), ('index', 'i4'), ('x', 'f8'), ('y', 'f8'), ('angle', 'f8')])
+
+class ShapeResults:
+    """Detections as one structured array per shape type plus a flat vertex buffer.
+
+    ``tables[shape_type]`` holds the rows of each requested type;
+    ``vertices[start:start + count]`` are the points of an outline row, and
+    ``axes`` lists every finite reflection axis with the row it belongs to.
+    """
+
+    def __init__(self, tables, vertices, axes):
+        self.tables = tables
+        self.vertices = vertices
+        self.axes = axes
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables.values())
+
+    def counts(self):
+        return {shape_type: len(table) for shape_type, table in self.tables.items()}
+
+    def outline(self, shape_type, index):
+        """Vertices of one outline, shaped ``(n, 1, 2)`` like ``approxPolyDP`` output."""
+        row = self.tables[shape_type][index]
+        return self.vertices[row['start']:row['start'] + row['count']].reshape(-1, 1, 2)
+
+    @classmethod
+    def from_dicts(cls, shapes, symmetric_shapes=None):
+        """Build the columnar form of ``detect_shapes`` (and optionally ``detect_symmetry``) output."""
+        tables, vertex_blocks, start = {}, [], 0
+        for shape_type, shape_list in shapes.items():
+            if shape_type in outline_types:
+                table = np.zeros(len(shape_list), dtype=dtypes['outlines'])
+                blocks = [np.asarray(shape, dtype=np.int32).reshape(-1, 2) for shape in shape_list]
+                counts = np.array([len(block) for block in blocks], dtype=np.int64)
+                table['count'] = counts
+                table['start'] = start + np.cumsum(counts) - counts
+                start += counts.sum()
+                vertex_blocks.extend(blocks)
+            else:
+                table = np.zeros(len(shape_list), dtype=dtypes[shape_type])
+                if shape_list and shape_type == 'lines':
+                    columns = np.asarray(shape_list).reshape(-1, 4).T
+                    table['x1'], table['y1'], table['x2'], table['y2'] = columns
+                elif shape_list and shape_type == 'circles':
+                    table['x'], table['y'], table['r'] = np.asarray(shape_list).reshape(-1, 3).T
+                elif shape_list and shape_type == 'ellipses':
+                    columns = np.array([(cx, cy, w, h, angle) for (cx, cy), (w, h), angle in shape_list]).T
+                    table['cx'], table['cy'], table['width'], table['height'], table['angle'] = columns
+            table['rotational_order'] = -1
+            table['center_x'] = table['center_y'] = np.nan
+            tables[shape_type] = table
+
+        axes = []
+        for detail in (symmetric_shapes or {}).get('details', []):
+            row = tables[detail['shape_type']][detail['index']:detail['index'] + 1]
+            row['rotational_order'] = detail['rotational_order']
+            if detail['center'] is not None:
+                row['center_x'], row['center_y'] = detail['center']
+            if detail['reflection_axes'] is None:
+                row['reflection_axes'] = -1
+            else:
+                row['reflection_axes'] = len(detail['reflection_axes'])
+                axes.extend((detail['shape_type'], detail['index'], x, y, angle)
+                            for (x, y), angle in detail['reflection_axes'])
+
+        vertices = np.concatenate(vertex_blocks) if vertex_blocks else np.empty((0, 2), dtype=np.int32)
+        return cls(tables, vertices, np.array(axes, dtype=axis_dtype))
+
+    def to_dicts(self):
+        """Rebuild the ``shapes`` dict in the form ``detect_shapes`` returns."""
+        shapes = {}
+        for shape_type, table in self.tables.items():
+            if shape_type in outline_types:
+                shapes[shape_type] = [self.outline(shape_type, i) for i in range(len(table))]
+            elif shape_type == 'lines':
+                shapes[shape_type] = [((int(r['x1']), int(r['y1'])), (int(r['x2']), int(r['y2']))) for r in table]
+            elif shape_type == 'circles':
+                shapes[shape_type] = [(int(r['x']), int(r['y']), int(r['r'])) for r in table]
+            else:
+                shapes[shape_type] = [((float(r['cx']), float(r['cy'])), (float(r['width']), float(r['height'])),
+                                       float(r['angle'])) for r in table]
+        return shapes
+
+    def save(self, path):
+        """Write every table, the vertex buffer and the axes to one compressed ``.npz`` file."""
+        arrays = {f"table_{shape_type}": table for shape_type, table in self.tables.items()}
+        np.savez_compressed(path, vertices=self.vertices, axes=self.axes, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            tables = {name[len("table_"):]: data[name] for name in data.files if name.startswith("table_")}
+            return cls(tables, data['vertices'], data['axes'])
@@ -0,0 +1,55 @@
+"""Uniform grid hash over bounding boxes, used to deduplicate and query detections."""
+from collections import defaultdict
+import math
+
+class GridIndex:
+    """Spatial hash of axis-aligned bounding boxes ``(x0, y0, x1, y1)``.
+
+    Every item is stored in each ``cell_size`` cell its box overlaps, so a
+    query only looks at the cells around it. Inserting and querying n boxes
+    of roughly the cell size takes near-linear time instead of comparing
+    every pair.
+    """
+
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+        self.boxes = {}
+        self.order = {}
+
+    def __len__(self):
+        return len(self.boxes)
+
+    def cell_range(self, box):
+        x0, y0, x1, y1 = box
+        size = self.cell_size
+        return (range(math.floor(x0 / size), math.floor(x1 / size) + 1),
+                range(math.floor(y0 / size), math.floor(y1 / size) + 1))
+
+    def insert(self, item, box):
+        """Add ``item`` (any hashable) with its bounding box."""
+        self.boxes[item] = box
+        self.order.setdefault(item, len(self.order))
+        columns, rows = self.cell_range(box)
+        for cx in columns:
+            for cy in rows:
+                self.cells[cx, cy].append(item)
+
+    def query(self, box):
+        """Return the items whose boxes intersect ``box``, in insertion order."""
+        x0, y0, x1, y1 = box
+        found = set()
+        columns, rows = self.cell_range(box)
+        for cx in columns:
+            for cy in rows:
+                for item in self.cells.get((cx, cy), ()):
+                    if item in found:
+                        continue
+                    bx0, by0, bx1, by1 = self.boxes[item]
+                    if bx0 <= x1 and x0 <= bx1 and by0 <= y1 and y0 <= by1:
+                        found.add(item)
+        return sorted(found, key=self.order.__getitem__)
+
+    def query_point(self, x, y, radius=0):
+        """Return the items whose boxes come within ``radius`` of the point ``(x, y)``."""
+        return self.query((x - radius, y - radius, x + radius, y + radius))
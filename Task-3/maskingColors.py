@@ -1,146 +1,330 @@
-import cv2
-import numpy as np
-import os
-import matplotlib.pyplot as plt
-
-# Parameters
-white_threshold = 240  # Adjust the threshold as needed
-
-def load_image(image_path):
-    """Load an image."""
-    image = cv2.imread(image_path)
-    if image is None:
-        raise ValueError(f"Image at path '{image_path}' could not be loaded.")
-    return image
-
-def extract_unique_colors(image_rgb):
-    """Extract unique non-white colors from the image and convert them to HSV."""
-    # Reshape the image to be a list of pixels
-    pixels = image_rgb.reshape(-1, 3)
-
-    # Filter out white or near-white pixels
-    filtered_pixels = pixels[np.all(pixels < [white_threshold, white_threshold, white_threshold], axis=1)]
-
-    # Remove duplicate colors
-    unique_colors = np.unique(filtered_pixels, axis=0)
-
-    # Convert unique colors from RGB to HSV
-    unique_colors_hsv = cv2.cvtColor(unique_colors.reshape(-1, 1, 3), cv2.COLOR_RGB2HSV).reshape(-1, 3)
-    
-    return unique_colors_hsv
-
-def format_color_ranges(unique_colors_hsv):
-    """Format the HSV values into tuples for color segmentation."""
-    color_ranges = []
-    for hsv_value in unique_colors_hsv:
-        lower_bound = np.clip(hsv_value - [10, 40, 40], 0, 255)
-        upper_bound = np.clip(hsv_value + [10, 40, 40], 0, 255)
-        color_ranges.append((tuple(lower_bound), tuple(upper_bound)))
-    return color_ranges
-
-def segment_by_color(image, color_ranges):
-    """Segment the image by color using provided HSV ranges."""
-    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
-    masks = []
-    
-    for lower, upper in color_ranges:
-        mask = cv2.inRange(hsv, np.array(lower), np.array(upper))
-        masks.append(mask)
-    
-    return masks
-
-def complete_mask(mask):
-    """Complete incomplete masks using morphological operations and convex hull."""
-    # Define kernel for morphological operations
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (20, 20))
-    
-    # Fill holes in the mask (closing operation)
-    mask_filled = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-    
-    # Optional: Further improve mask by dilation to close small gaps
-    mask_dilated = cv2.dilate(mask_filled, kernel, iterations=1)
-    
-    # Find contours
-    contours, _ = cv2.findContours(mask_dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    
-    # Create an empty mask to draw the convex hull
-    convex_hull_mask = np.zeros_like(mask)
-    
-    for contour in contours:
-        # Compute the convex hull of the contour
-        hull = cv2.convexHull(contour)
-        cv2.drawContours(convex_hull_mask, [hull], 0, 255, -1)  # Draw filled hull
-    
-    # Combine the dilated mask and convex hull mask
-    combined_mask = cv2.bitwise_or(mask_dilated, convex_hull_mask)
-    
-    return combined_mask
-
-def concatenate_masks(mask1, mask2):
-    """Concatenate two masks side by side."""
-    # Ensure both masks have the same height
-    height = max(mask1.shape[0], mask2.shape[0])
-    width1 = mask1.shape[1]
-    width2 = mask2.shape[1]
-    
-    # Resize masks to the same height
-    if mask1.shape[0] != height:
-        mask1 = cv2.resize(mask1, (width1, height))
-    if mask2.shape[0] != height:
-        mask2 = cv2.resize(mask2, (width2, height))
-    
-    # Concatenate masks horizontally
-    combined = np.hstack((mask1, mask2))
-    return combined
-
-def save_image(image, filename):
-    """Save the image to the specified file in the output folder."""
-    output_folder = 'output'
-    os.makedirs(output_folder, exist_ok=True)
-    full_path = os.path.join(output_folder, filename)
-    cv2.imwrite(full_path, image)
-    print(f"Image saved as {full_path}")
-
-def main(image_path):
-    # Step 1: Load the image
-    image = load_image(image_path)
-    
-    # Convert the image from BGR to RGB (since OpenCV loads in BGR format)
-    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-    
-    # Step 2: Extract unique non-white colors and convert to HSV
-    unique_colors_hsv = extract_unique_colors(image_rgb)
-    
-    # Step 3: Format the HSV values into tuples for color segmentation
-    color_ranges = format_color_ranges(unique_colors_hsv)
-    
-    # Step 4: Segment the image by color using the extracted ranges
-    masks = segment_by_color(image, color_ranges)
-    
-    # Ensure we have at least two masks
-    if len(masks) < 2:
-        raise ValueError("Expected at least two masks for concatenation.")
-    
-    # Step 5: Complete the masks
-    mask1 = complete_mask(masks[0])
-    mask2 = complete_mask(masks[1])
-    
-    # Step 6: Concatenate the masks side by side
-    combined_image = concatenate_masks(mask1, mask2)
-    
-    # Extract the base name of the image file without extension
-    base_name = os.path.splitext(os.path.basename(image_path))[0]
-
-    output_filename = f"mask_{base_name}.png"
-    save_image(combined_image, output_filename)
-    
-    # Step 7: Display the result using plt.show
-    plt.imshow(combined_image, cmap='gray')
-    plt.title('Combined Masks')
-    plt.axis('off')
-    plt.show()
-
-if __name__ == "__main__":
-    # Example usage
-    image_path = './problems/occlusion1_rec.png'  # Use the uploaded image path
-    main(image_path)
+import cv2
+import logging
+import numpy as np
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import regions
+from regions import apply_in_windows
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rendering
+import result_cache
+import tracing
+
+logger = logging.getLogger("gensolve.masks")
+
+# Parameters
+white_threshold = 240  # Adjust the threshold as needed
+
+@tracing.stage('load_image')
+def load_image(image_path):
+    """Load an image."""
+    image = cv2.imread(image_path)
+    if image is None:
+        raise ValueError(f"Image at path '{image_path}' could not be loaded.")
+    return image
+
+def pack_colors(pixels):
+    """Pack (N, 3) uint8 RGB pixels into 24-bit integers."""
+    pixels = pixels.astype(np.uint32)
+    return (pixels[:, 0] << 16) | (pixels[:, 1] << 8) | pixels[:, 2]
+
+def hue_distance(h1, h2):
+    """Distance between OpenCV hues (0-179), which wrap around."""
+    d = np.abs(h1.astype(np.int32) - h2.astype(np.int32))
+    return np.minimum(d, 180 - d)
+
+@tracing.stage('extract_unique_colors', lambda colors: {'colors': len(colors)})
+def extract_unique_colors(image_rgb, max_colors=16, merge_threshold=(10, 40, 40), bits=5):
+    """Extract the palette of non-white colors from the image and convert it to HSV.
+
+    Pixels are packed into 24-bit integers and counted with a histogram over the
+    top ``bits`` of each channel, which takes linear time. Each bin keeps the
+    mean color of its pixels. Starting from the most frequent bin, a bin whose
+    HSV value lies within ``merge_threshold`` of a palette color is merged into
+    it; otherwise it starts a new color, up to ``max_colors``. Pass None to
+    either to disable merging or the size limit. The palette is returned in RGB
+    order, like ``np.unique``.
+    """
+    # Reshape the image to be a list of pixels
+    pixels = image_rgb.reshape(-1, 3)
+
+    # Filter out white or near-white pixels (any channel at or above the threshold)
+    brightest = cv2.max(cv2.max(image_rgb[..., 0], image_rgb[..., 1]), image_rgb[..., 2])
+    filtered_pixels = pixels[brightest.ravel() < white_threshold]
+    if not len(filtered_pixels):
+        return np.empty((0, 3), dtype=np.uint8)
+
+    # Histogram of the packed colors, keeping the mean color of every bin
+    shift = 8 - bits
+    packed = pack_colors(filtered_pixels)
+    bins = (((packed >> (16 + shift)) & 0xFF) << (2 * bits)) | (((packed >> (8 + shift)) & 0xFF) << bits) | \
+           ((packed & 0xFF) >> shift)
+    counts = np.bincount(bins, minlength=1 << (3 * bits))
+    occupied = np.flatnonzero(counts)
+    sums = np.stack([np.bincount(bins, weights=filtered_pixels[:, c], minlength=len(counts))[occupied]
+                     for c in range(3)], axis=1)
+    counts = counts[occupied]
+    order = np.argsort(-counts, kind='stable')
+    sums, counts = sums[order], counts[order]
+    bin_colors = np.rint(sums / counts[:, None]).astype(np.uint8)
+    bin_hsv = cv2.cvtColor(bin_colors.reshape(-1, 1, 3), cv2.COLOR_RGB2HSV).reshape(-1, 3)
+
+    # Greedily merge bins into a bounded palette, most frequent first
+    palette_sums, palette_counts, palette_hsv = [], [], []
+    for color_sum, count, hsv_value in zip(sums, counts, bin_hsv):
+        if merge_threshold is not None and palette_hsv:
+            hsv = np.array(palette_hsv)
+            close = (hue_distance(hsv[:, 0], hsv_value[0]) <= merge_threshold[0]) & \
+                    np.all(np.abs(hsv[:, 1:].astype(np.int32) - hsv_value[1:]) <= merge_threshold[1:], axis=1)
+            if close.any():
+                i = np.flatnonzero(close)[0]
+                palette_sums[i] = palette_sums[i] + color_sum
+                palette_counts[i] += count
+                continue
+        if max_colors is None or len(palette_hsv) < max_colors:
+            palette_sums.append(color_sum)
+            palette_counts.append(count)
+            palette_hsv.append(hsv_value)
+
+    palette = np.rint(np.array(palette_sums) / np.array(palette_counts)[:, None]).astype(np.uint8)
+    palette = palette[np.argsort(pack_colors(palette), kind='stable')]
+
+    # Convert the palette from RGB to HSV
+    unique_colors_hsv = cv2.cvtColor(palette.reshape(-1, 1, 3), cv2.COLOR_RGB2HSV).reshape(-1, 3)
+
+    return unique_colors_hsv
+
+def format_color_ranges(unique_colors_hsv):
+    """Format the HSV values into tuples for color segmentation."""
+    color_ranges = []
+    for hsv_value in unique_colors_hsv:
+        lower_bound = np.clip(hsv_value - [10, 40, 40], 0, 255)
+        upper_bound = np.clip(hsv_value + [10, 40, 40], 0, 255)
+        color_ranges.append((tuple(lower_bound), tuple(upper_bound)))
+    return color_ranges
+
+@tracing.stage('segment_by_color', lambda masks: {'masks': len(masks)})
+def segment_by_color(image, color_ranges):
+    """Segment the image by color using provided HSV ranges."""
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    masks = []
+    
+    for lower, upper in color_ranges:
+        mask = cv2.inRange(hsv, np.array(lower), np.array(upper))
+        masks.append(mask)
+    
+    return masks
+
+class LabelMasks:
+    """Per-color masks of a label image, computed only when indexed.
+
+    ``labels`` holds 0 for unassigned pixels and ``i + 1`` for pixels of color
+    ``i``. ``masks[i]`` returns the same 0/255 uint8 mask that ``cv2.inRange``
+    would, so the object can stand in for the list from ``segment_by_color``.
+    """
+
+    def __init__(self, labels, count):
+        self.labels = labels
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("mask index out of range")
+        return cv2.compare(self.labels, index + 1, cv2.CMP_EQ)
+
+    def __iter__(self):
+        return (self[i] for i in range(self.count))
+
+def build_label_lut(color_ranges):
+    """Build a lookup table from every OpenCV HSV value to the index (plus one) of its color range.
+
+    Ranges are written in reverse so the first range containing a value wins.
+    """
+    dtype = np.uint8 if len(color_ranges) < 255 else np.uint16
+    lut = np.zeros((180, 256, 256), dtype=dtype)
+    for label in range(len(color_ranges), 0, -1):
+        (h0, s0, v0), (h1, s1, v1) = color_ranges[label - 1]
+        lut[int(h0):int(h1) + 1, int(s0):int(s1) + 1, int(v0):int(v1) + 1] = label
+    return lut
+
+@tracing.stage('segment_by_color_labels', lambda masks: {'masks': len(masks)})
+def segment_by_color_labels(image, color_ranges, lut=None):
+    """Segment the image into a label map in one pass over the pixels.
+
+    Every pixel is looked up in a table indexed by its HSV value, giving a
+    uint8 (or uint16) label image instead of one full-size mask per color.
+    Where ranges overlap a pixel belongs to the first matching color. Returns a
+    ``LabelMasks`` whose per-color masks are built on demand.
+    """
+    if lut is None:
+        lut = build_label_lut(color_ranges)
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
+    index = (hsv[..., 0].astype(np.uint32) << 16) | (hsv[..., 1].astype(np.uint32) << 8) | hsv[..., 2]
+    labels = lut.reshape(-1)[index]
+    return LabelMasks(labels, len(color_ranges))
+
+# Reach of complete_mask: the close and dilate grow a mask by up to 20 pixels and
+# look 30 pixels back at their input
+completion_pad = 50
+
+# Structuring element shared by every mask completion
+completion_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (20, 20))
+
+# Thread pool shared by complete_masks, created on first use as (workers, executor)
+completion_pool = None
+
+def get_completion_pool(workers=None):
+    """Return the shared completion thread pool, recreating it when the worker count changes."""
+    global completion_pool
+    workers = workers or os.cpu_count()
+    if completion_pool is None or completion_pool[0] != workers:
+        if completion_pool is not None:
+            completion_pool[1].shutdown(wait=False)
+        completion_pool = (workers, ThreadPoolExecutor(max_workers=workers, thread_name_prefix="complete_mask"))
+    return completion_pool[1]
+
+def complete_mask(mask, use_roi=True, dst=None):
+    """Complete incomplete masks using morphological operations and convex hull.
+
+    With ``use_roi`` the work only runs inside padded windows around the
+    mask's connected components; the result is the same as for the full image.
+    ``dst`` optionally receives the result instead of a new array.
+    """
+    if use_roi:
+        return apply_in_windows(mask, completion_pad, lambda crop: complete_mask(crop, use_roi=False), out=dst)
+
+    # Fill holes in the mask (closing operation)
+    mask_filled = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, completion_kernel)
+    
+    # Optional: Further improve mask by dilation to close small gaps
+    mask_dilated = cv2.dilate(mask_filled, completion_kernel, iterations=1)
+    
+    # Find contours
+    contours, _ = cv2.findContours(mask_dilated, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    
+    # Create an empty mask to draw the convex hull
+    convex_hull_mask = np.zeros_like(mask)
+    
+    for contour in contours:
+        # Compute the convex hull of the contour
+        hull = cv2.convexHull(contour)
+        cv2.drawContours(convex_hull_mask, [hull], 0, 255, -1)  # Draw filled hull
+    
+    # Combine the dilated mask and convex hull mask
+    combined_mask = cv2.bitwise_or(mask_dilated, convex_hull_mask, dst=dst)
+    
+    return combined_mask
+
+@tracing.stage('complete_masks', lambda masks: {'masks': len(masks)})
+def complete_masks(masks, workers=None, use_roi=True, out=None):
+    """Complete every mask concurrently on the shared thread pool, returning the results in input order.
+
+    OpenCV releases the GIL during morphology, so the masks are processed in
+    parallel. The results are written into one preallocated ``(n, h, w)``
+    buffer, which can be passed in as ``out`` to reuse it across calls.
+    ``workers`` sets the pool size (default: CPU count). ``masks`` is only
+    indexed, inside each task, so a ``LabelMasks`` builds one mask per worker
+    at a time instead of all of them up front.
+    """
+    if not len(masks):
+        return []
+    if out is None:
+        out = np.empty((len(masks),) + masks[0].shape, dtype=np.uint8)
+
+    pool = get_completion_pool(workers)
+    futures = [pool.submit(lambda i: complete_mask(masks[i], use_roi, out[i]), i) for i in range(len(masks))]
+    for future in futures:
+        future.result()
+    return list(out)
+
+def concatenate_masks(mask1, mask2):
+    """Concatenate two masks side by side."""
+    # Ensure both masks have the same height
+    height = max(mask1.shape[0], mask2.shape[0])
+    width1 = mask1.shape[1]
+    width2 = mask2.shape[1]
+    
+    # Resize masks to the same height
+    if mask1.shape[0] != height:
+        mask1 = cv2.resize(mask1, (width1, height))
+    if mask2.shape[0] != height:
+        mask2 = cv2.resize(mask2, (width2, height))
+    
+    # Concatenate masks horizontally
+    combined = np.hstack((mask1, mask2))
+    return combined
+
+@tracing.stage('save_image')
+def save_image(image, filename):
+    """Save the image to the specified file in the output folder."""
+    output_folder = 'output'
+    os.makedirs(output_folder, exist_ok=True)
+    full_path = os.path.join(output_folder, filename)
+    cv2.imwrite(full_path, image)
+    logger.info("Image saved as %s", full_path)
+
+def extract_completed_masks(image_path, use_label_map=True):
+    """Load an image and return its completed per-color masks as one ``(n, h, w)`` array."""
+    # Step 1: Load the image
+    image = load_image(image_path)
+    
+    # Convert the image from BGR to RGB (since OpenCV loads in BGR format)
+    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    
+    # Step 2: Extract unique non-white colors and convert to HSV
+    unique_colors_hsv = extract_unique_colors(image_rgb)
+    
+    # Step 3: Format the HSV values into tuples for color segmentation
+    color_ranges = format_color_ranges(unique_colors_hsv)
+    
+    # Step 4: Segment the image by color using the extracted ranges
+    if use_label_map:
+        masks = segment_by_color_labels(image, color_ranges)
+    else:
+        masks = segment_by_color(image, color_ranges)
+    
+    # Ensure we have at least one mask
+    if len(masks) < 1:
+        raise ValueError("Expected at least one mask for concatenation.")
+    
+    # Step 5: Complete every mask in parallel
+    return np.stack(complete_masks(masks))
+
+def main(image_path, use_label_map=True, backend=None, cache=None):
+    """Complete the color masks of an image, save them side by side and display them.
+
+    The completed masks go through ``result_cache`` (``cache`` or the
+    GENSOLVE_CACHE_DIR cache), keyed on the image contents and this code.
+    """
+    with tracing.session(os.path.splitext(os.path.basename(image_path))[0]):
+        # Steps 1-5: Completed masks, from the cache when available
+        completed_masks = result_cache.cached(cache, [image_path, __file__, regions.__file__],
+                                              {'use_label_map': use_label_map}, extract_completed_masks,
+                                              image_path, use_label_map)
+    
+        # Step 6: Concatenate the masks side by side (they all share the image height)
+        combined_image = np.hstack(completed_masks)
+    
+        # Extract the base name of the image file without extension
+        base_name = os.path.splitext(os.path.basename(image_path))[0]
+
+        output_filename = f"mask_{base_name}.png"
+        save_image(combined_image, output_filename)
+    
+        # Step 7: Display the result with the rendering backend
+        with tracing.span('display'):
+            rendering.get_backend(backend).image(combined_image, 'Combined Masks')
+
+if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get("GENSOLVE_LOG_LEVEL", "WARNING"), format="%(message)s")
+    # Example usage
+    image_path = './problems/occlusion1_rec.png'  # Use the uploaded image path
+    main(image_path)
@@ -1,78 +1,178 @@
-import cv2
-import numpy as np
-import os
-import matplotlib.pyplot as plt
-
-def detect_and_complete_occlusion(img_path):
-    # Load the image as grayscale
-    image = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
-    print("Print any key to interrupt")
-
-    if image is None:
-        print("Error loading image. Please check the file path and file format.")
-        return None
-
-    # Threshold the image to create a binary mask
-    _, binary_mask = cv2.threshold(image, 127, 255, cv2.THRESH_BINARY)
-
-    # Define the kernel for morphological operations
-    kernel = np.ones((5, 5), np.uint8)
-
-    # Perform morphological operations
-    eroded_mask = cv2.erode(binary_mask, kernel, iterations=1)
-    dilated_mask = cv2.dilate(eroded_mask, kernel, iterations=3)
-    closing_kernel = np.ones((15, 15), np.uint8)
-    closed_mask = cv2.morphologyEx(dilated_mask, cv2.MORPH_CLOSE, closing_kernel)
-    completed_mask = cv2.dilate(closed_mask, kernel, iterations=2)
-    completed_image = cv2.bitwise_and(image, image, mask=completed_mask)
-
-    # Resize all images to the same height for uniformity
-    height = max(image.shape[0], binary_mask.shape[0], eroded_mask.shape[0], dilated_mask.shape[0],
-                  closed_mask.shape[0], completed_mask.shape[0], completed_image.shape[0])
-
-    def resize_to_height(img, height):
-        """Resize image to a specific height while maintaining aspect ratio."""
-        ratio = height / img.shape[0]
-        new_width = int(img.shape[1] * ratio)
-        return cv2.resize(img, (new_width, height))
-
-    image_resized = resize_to_height(image, height)
-    binary_mask_resized = resize_to_height(binary_mask, height)
-    eroded_mask_resized = resize_to_height(eroded_mask, height)
-    dilated_mask_resized = resize_to_height(dilated_mask, height)
-    closed_mask_resized = resize_to_height(closed_mask, height)
-    completed_mask_resized = resize_to_height(completed_mask, height)
-    completed_image_resized = resize_to_height(completed_image, height)
-
-    # Concatenate all images horizontally
-    combined_image = np.hstack([image_resized, binary_mask_resized, eroded_mask_resized,
-                                dilated_mask_resized, closed_mask_resized, completed_mask_resized,
-                                completed_image_resized])
-
-    # Create the output directory if it does not exist
-    output_folder = 'output'
-    os.makedirs(output_folder, exist_ok=True)
-
-    # Create the output file name
-    base_name = os.path.basename(img_path)
-    name, _ = os.path.splitext(base_name)
-    output_filename = f'morphed_{name}.png'
-    output_path = os.path.join(output_folder, output_filename)
-
-    # Save the combined image
-    cv2.imwrite(output_path, combined_image)
-    print(f"Combined image saved as {output_path}")
-
-    # Display the combined image using Matplotlib
-    plt.figure(figsize=(12, 6))
-    plt.imshow(combined_image, cmap='gray')
-    plt.title('Morphological Operations Results')
-    plt.axis('off')
-    plt.show()
-
-    return completed_image
-
-# Example usage:
-if __name__ == "__main__":
-    img_path = './problems/occlusion2_rec.png'
-    detect_and_complete_occlusion(img_path)
+import cv2
+import logging
+import numpy as np
+import os
+import sys
+
+import regions
+from regions import apply_in_windows
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import rendering
+import result_cache
+import tracing
+
+logger = logging.getLogger("gensolve.occlusion")
+
+# Reach of morph_chain: every output pixel depends on input up to 26 pixels away
+# (2 erode + 3 * 2 dilate + 2 * 7 close + 2 * 2 dilate), and the mask grows by
+# up to 17 pixels
+occlusion_halo = 26
+occlusion_pad = 17 + occlusion_halo
+
+# Kernels for the morphological operations
+kernel = np.ones((5, 5), np.uint8)
+closing_kernel = np.ones((15, 15), np.uint8)
+
+class OcclusionPipeline:
+    """Occlusion completion built once and reused across images or video frames.
+
+    The kernels are shared and every stage writes into a ``dst`` buffer that is
+    allocated on the first call and reused while the input shape stays the
+    same, so a tight loop performs no allocations. Results returned by ``run``
+    are those buffers and are overwritten by the next call; copy them to keep
+    them.
+    """
+
+    def __init__(self, threshold=127):
+        self.threshold = threshold
+        self.buffers = None
+
+    def buffers_for(self, shape):
+        if self.buffers is None or self.buffers['binary'].shape != shape:
+            self.buffers = {name: np.empty(shape, dtype=np.uint8)
+                            for name in ('binary', 'eroded', 'dilated', 'closed', 'completed', 'image')}
+        return self.buffers
+
+    @tracing.stage('morph_chain')
+    def complete(self, binary_mask, buffers=None):
+        """Erode, dilate, close and dilate a binary mask, returning every intermediate mask.
+
+        New arrays are allocated unless ``buffers`` (from ``buffers_for``) is given.
+        """
+        if buffers is None:
+            buffers = dict.fromkeys(('eroded', 'dilated', 'closed', 'completed'))
+        eroded_mask = cv2.erode(binary_mask, kernel, dst=buffers['eroded'], iterations=1)
+        dilated_mask = cv2.dilate(eroded_mask, kernel, dst=buffers['dilated'], iterations=3)
+        closed_mask = cv2.morphologyEx(dilated_mask, cv2.MORPH_CLOSE, closing_kernel, dst=buffers['closed'])
+        completed_mask = cv2.dilate(closed_mask, kernel, dst=buffers['completed'], iterations=2)
+        return eroded_mask, dilated_mask, closed_mask, completed_mask
+
+    @tracing.stage('occlusion_pipeline')
+    def run(self, image, output='mask'):
+        """Complete a grayscale image and return only the completed 'mask' or the masked 'image'."""
+        buffers = self.buffers_for(image.shape[:2])
+        cv2.threshold(image, self.threshold, 255, cv2.THRESH_BINARY, dst=buffers['binary'])
+        completed_mask = self.complete(buffers['binary'], buffers)[-1]
+        if output == 'image':
+            # The mask is 0/255, so a plain AND zeroes the background without a masked copy
+            return cv2.bitwise_and(image, completed_mask, dst=buffers['image'])
+        return completed_mask
+
+def morph_chain(binary_mask):
+    """Erode, dilate, close and dilate a binary mask, returning every intermediate mask."""
+    return OcclusionPipeline().complete(binary_mask)
+
+def open_image_buffer(path, shape=None, dtype=np.uint8):
+    """Memory-map a grayscale image stored as a .npy file, or as raw bytes when ``shape`` is given."""
+    if path.endswith('.npy'):
+        return np.load(path, mmap_mode='r')
+    if shape is None:
+        raise ValueError("The shape of a raw image buffer must be given.")
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+@tracing.stage('detect_and_complete_occlusion_tiled')
+def detect_and_complete_occlusion_tiled(input_path, output_path, shape=None, tile_size=2048, output='mask',
+                                        use_roi=True):
+    """Complete occlusions tile by tile on a memory-mapped image and write the result straight to disk.
+
+    ``input_path`` is a .npy file or a raw uint8 buffer of the given ``shape``;
+    ``output_path`` is written in the same way (.npy or raw). Every tile is read
+    with a halo of ``occlusion_halo`` pixels, the full reach of the morphology
+    chain, so the output is identical to processing the whole image while peak
+    memory stays bounded by the tile size. ``output`` selects the completed
+    'mask' or the masked 'image'.
+    """
+    image = open_image_buffer(input_path, shape)
+    height, width = image.shape[:2]
+    if output_path.endswith('.npy'):
+        result = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.uint8, shape=(height, width))
+    else:
+        result = np.memmap(output_path, dtype=np.uint8, mode='w+', shape=(height, width))
+
+    pipeline = OcclusionPipeline()
+    for y in range(0, height, tile_size):
+        for x in range(0, width, tile_size):
+            y1, x1 = min(y + tile_size, height), min(x + tile_size, width)
+            wy0, wx0 = max(y - occlusion_halo, 0), max(x - occlusion_halo, 0)
+            wy1, wx1 = min(y1 + occlusion_halo, height), min(x1 + occlusion_halo, width)
+            tile = np.asarray(image[wy0:wy1, wx0:wx1])
+
+            if use_roi:
+                _, binary_mask = cv2.threshold(tile, 127, 255, cv2.THRESH_BINARY)
+                completed_mask = apply_in_windows(binary_mask, occlusion_pad, lambda crop: morph_chain(crop)[-1])
+                if output == 'image':
+                    completed_mask = cv2.bitwise_and(tile, tile, mask=completed_mask)
+            else:
+                completed_mask = pipeline.run(tile, output)
+
+            result[y:y1, x:x1] = completed_mask[y - wy0:y1 - wy0, x - wx0:x1 - wx0]
+
+    result.flush()
+    return result
+
+@tracing.stage('complete_occlusion_masks')
+def complete_occlusion_masks(binary_mask, use_roi=True):
+    """Run ``morph_chain`` on a binary mask, only around its connected components when ``use_roi`` is set."""
+    if use_roi:
+        return apply_in_windows(binary_mask, occlusion_pad, morph_chain)
+    return morph_chain(binary_mask)
+
+@tracing.stage('detect_and_complete_occlusion')
+def detect_and_complete_occlusion(img_path, use_roi=True, backend=None, cache=None):
+    # Load the image as grayscale
+    image = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+
+    if image is None:
+        logger.error("Error loading image %s. Please check the file path and file format.", img_path)
+        return None
+
+    # Threshold the image to create a binary mask
+    _, binary_mask = cv2.threshold(image, 127, 255, cv2.THRESH_BINARY)
+
+    # Complete the mask, from the result cache (cache or GENSOLVE_CACHE_DIR) when available; use_roi
+    # gives the same masks, so it is not part of the key
+    eroded_mask, dilated_mask, closed_mask, completed_mask = result_cache.cached(
+        cache, [img_path, __file__, regions.__file__], {}, complete_occlusion_masks, binary_mask, use_roi)
+    completed_image = cv2.bitwise_and(image, image, mask=completed_mask)
+
+    # Every stage keeps the input size, so the images can be concatenated horizontally as they are
+    combined_image = np.hstack([image, binary_mask, eroded_mask, dilated_mask, closed_mask, completed_mask,
+                                completed_image])
+
+    # Create the output directory if it does not exist
+    output_folder = 'output'
+    os.makedirs(output_folder, exist_ok=True)
+
+    # Create the output file name
+    base_name = os.path.basename(img_path)
+    name, _ = os.path.splitext(base_name)
+    output_filename = f'morphed_{name}.png'
+    output_path = os.path.join(output_folder, output_filename)
+
+    # Save the combined image
+    cv2.imwrite(output_path, combined_image)
+    logger.info("Combined image saved as %s", output_path)
+
+    # Display the combined image with the rendering backend
+    with tracing.span('display'):
+        rendering.get_backend(backend).image(combined_image, 'Morphological Operations Results', figsize=(12, 6))
+
+    return completed_image
+
+# Example usage:
+if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get("GENSOLVE_LOG_LEVEL", "WARNING"), format="%(message)s")
+    img_path = './problems/occlusion2_rec.png'
+    with tracing.session(os.path.splitext(os.path.basename(img_path))[0]):
+        detect_and_complete_occlusion(img_path)
@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+
+def occupied_blocks(mask, block):
+    """Return a boolean grid marking every ``block`` x ``block`` cell of the mask that holds a nonzero pixel."""
+    height, width = mask.shape[:2]
+    full_rows, full_cols = height // block * block, width // block * block
+    row_max = mask[:full_rows].reshape(full_rows // block, block, width).max(axis=1)
+    if full_rows < height:
+        row_max = np.vstack([row_max, mask[full_rows:].max(axis=0, keepdims=True)])
+    grid = row_max[:, :full_cols].reshape(len(row_max), full_cols // block, block).max(axis=2)
+    if full_cols < width:
+        grid = np.hstack([grid, row_max[:, full_cols:].max(axis=1, keepdims=True)])
+    return grid > 0
+
+def component_windows(mask, pad, block=16):
+    """Return disjoint (x0, y0, x1, y1) windows around the connected regions of a mask.
+
+    The mask is reduced to a grid of ``block``-pixel cells, occupied cells are
+    grown by at least ``pad`` pixels and the bounding boxes of the resulting
+    groups are merged until no two overlap. Every nonzero pixel therefore lies
+    at least ``pad`` pixels inside its window (or at the image border).
+    """
+    height, width = mask.shape[:2]
+    grid = occupied_blocks(mask, block).astype(np.uint8)
+    if not grid.any():
+        return []
+    cells = -(-pad // block)
+    grid = cv2.dilate(grid, np.ones((2 * cells + 1, 2 * cells + 1), np.uint8))
+
+    # Merge the groups' bounding boxes on the grid until they stop overlapping
+    while True:
+        count, _, stats, _ = cv2.connectedComponentsWithStats(grid, connectivity=8)
+        if count == 2 or np.count_nonzero(grid) == np.sum(stats[1:, 2] * stats[1:, 3]):
+            break
+        grid = np.zeros_like(grid)
+        for x, y, w, h, _ in stats[1:]:
+            grid[y:y + h, x:x + w] = 1
+
+    return [(x * block, y * block, min((x + w) * block, width), min((y + h) * block, height))
+            for x, y, w, h, _ in stats[1:]]
+
+def apply_in_windows(mask, pad, func, full_fraction=0.5, out=None):
+    """Run ``func`` only on the windows around the components of ``mask`` and paste the results back.
+
+    ``func`` takes a mask crop and returns an array (or a tuple of arrays) of the
+    same shape; the returned full-size results are zero outside the windows.
+    ``pad`` must cover how far the operation reaches out from the mask plus how
+    far it looks back at its input, which makes the result identical to running
+    ``func`` on the whole mask. When the mask is empty or the windows cover
+    more than ``full_fraction`` of the image, ``func`` simply runs on the
+    whole mask. ``out`` optionally gives the output array (or tuple of
+    arrays) to fill instead of allocating new ones.
+    """
+    windows = component_windows(mask, pad)
+    covered = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in windows)
+    if not windows or covered > full_fraction * mask.shape[0] * mask.shape[1]:
+        full_results = func(mask)
+        if out is None:
+            return full_results
+        for result, full_result in zip(out if isinstance(out, tuple) else (out,),
+                                       full_results if isinstance(full_results, tuple) else (full_results,)):
+            result[...] = full_result
+        return out
+
+    results = None if out is None else list(out if isinstance(out, tuple) else (out,))
+    if results is not None:
+        for result in results:
+            result.fill(0)
+    for x0, y0, x1, y1 in windows:
+        crop_results = func(mask[y0:y1, x0:x1])
+        single = not isinstance(crop_results, tuple)
+        if single:
+            crop_results = (crop_results,)
+        if results is None:
+            results = [np.zeros(mask.shape[:2] + r.shape[2:], dtype=r.dtype) for r in crop_results]
+        for result, crop_result in zip(results, crop_results):
+            result[y0:y1, x0:x1] = crop_result
+    return results[0] if single else tuple(results)
@@ -0,0 +1,247 @@
+"""Benchmark suite for the Task-1-and-2 and Task-3 pipelines.
+
+Runs every stage over the bundled ``problems/`` files and over synthetically
+scaled versions of them (more paths, denser sampling, larger images, more
+colors), and reports per-stage wall time, throughput and peak memory.
+
+Usage:
+    python benchmark.py                       # full run, print a table
+    python benchmark.py --quick               # bundled inputs and the smallest scale-ups only
+    python benchmark.py --save baseline.json  # store the results as a baseline
+    python benchmark.py --compare baseline.json --tolerance 0.25
+
+With ``--compare`` every stage that got slower than the baseline by more than
+``--tolerance`` is listed and the script exits with status 1.
+"""
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("MPLBACKEND", "Agg")  # plt.show() must not block
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TASK12_DIR = os.path.join(ROOT, "Task-1-and-2")
+TASK3_DIR = os.path.join(ROOT, "Task-3")
+sys.path[:0] = [TASK12_DIR, TASK3_DIR]
+
+import cv2
+import numpy as np
+
+import main as shape_main
+import maskingColors
+import morphology
+import regularize
+
+SHAPES = ['lines', 'rectangles', 'circles', 'ellipses', 'polygons', 'stars']
+
+def measure(func, *args, repeat=3):
+    """Return (result, median seconds over ``repeat`` runs, peak traced bytes of one extra run)."""
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = func(*args)
+            times.append(time.perf_counter() - start)
+        tracemalloc.start()
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, statistics.median(times), peak
+
+def stage_record(seconds, peak, items, unit):
+    return {"seconds": seconds, "peak_mb": peak / 2 ** 20, "throughput": items / seconds if seconds else None,
+            "unit": unit}
+
+# Synthetic inputs
+
+def write_csv(path_XYs, csv_path):
+    rows = [np.column_stack([np.full(len(XY), i), np.full(len(XY), j), XY])
+            for i, XYs in enumerate(path_XYs) for j, XY in enumerate(XYs)]
+    np.savetxt(csv_path, np.vstack(rows), delimiter=",")
+
+def more_paths(path_XYs, copies):
+    """Tile the drawing ``copies`` x ``copies`` times side by side."""
+    extent = np.max([XY.max(axis=0) for XYs in path_XYs for XY in XYs], axis=0) + 10
+    return [[XY + extent * (cx, cy) for XY in XYs]
+            for cy in range(copies) for cx in range(copies) for XYs in path_XYs]
+
+def denser(path_XYs, factor):
+    """Resample every segment with ``factor`` times as many points."""
+    def resample(XY):
+        t = np.linspace(0, len(XY) - 1, (len(XY) - 1) * factor + 1)
+        return np.column_stack([np.interp(t, np.arange(len(XY)), XY[:, c]) for c in range(2)])
+    return [[resample(XY) for XY in XYs] for XYs in path_XYs]
+
+def larger_image(image, factor):
+    return cv2.resize(image, None, fx=factor, fy=factor, interpolation=cv2.INTER_NEAREST)
+
+def more_colors(image, count):
+    """Recolor the non-white pixels in ``count`` vertical stripes, each with its own hue."""
+    image = image.copy()
+    colored = image.min(axis=2) < maskingColors.white_threshold
+    stripes = np.arange(image.shape[1]) * count // image.shape[1]
+    hues = np.uint8(np.arange(count) * 180 // count)
+    palette = cv2.cvtColor(np.stack([hues, np.full(count, 220, np.uint8), np.full(count, 200, np.uint8)],
+                                    axis=1).reshape(-1, 1, 3), cv2.COLOR_HSV2BGR).reshape(-1, 3)
+    stripe_colors = palette[np.broadcast_to(stripes, image.shape[:2])]
+    image[colored] = stripe_colors[colored]
+    return image
+
+def csv_cases(work_dir, quick):
+    problems = sorted(glob.glob(os.path.join(TASK12_DIR, "problems", "*.csv")))
+    for csv_path in problems:
+        yield os.path.basename(csv_path), csv_path
+    base_paths = shape_main.read_csv(os.path.join(TASK12_DIR, "problems", "isolated.csv"))
+    variants = [("paths_x4", more_paths(base_paths, 2)), ("dense_x4", denser(base_paths, 4))]
+    if not quick:
+        variants += [("paths_x16", more_paths(base_paths, 4)), ("dense_x16", denser(base_paths, 16))]
+    for name, path_XYs in variants:
+        csv_path = os.path.join(work_dir, f"isolated_{name}.csv")
+        write_csv(path_XYs, csv_path)
+        yield f"isolated_{name}", csv_path
+
+def image_cases(work_dir, quick):
+    problems = sorted(glob.glob(os.path.join(TASK3_DIR, "problems", "*_rec.png")))
+    for image_path in problems:
+        yield os.path.basename(image_path), image_path
+    base = cv2.imread(os.path.join(TASK3_DIR, "problems", "occlusion2_rec.png"))
+    variants = [("size_x2", larger_image(base, 2)), ("colors_8", more_colors(base, 8))]
+    if not quick:
+        variants += [("size_x4", larger_image(base, 4)), ("colors_16", more_colors(base, 16))]
+    for name, image in variants:
+        image_path = os.path.join(work_dir, f"occlusion2_rec_{name}.png")
+        cv2.imwrite(image_path, image)
+        yield f"occlusion2_rec_{name}", image_path
+
+# Pipelines
+
+def bench_csv(csv_path, repeat):
+    stages = {}
+    path_XYs, seconds, peak = measure(shape_main.read_csv, csv_path, repeat=repeat)
+    points = sum(len(XY) for XYs in path_XYs for XY in XYs)
+    stages["read_csv"] = stage_record(seconds, peak, points, "points/s")
+
+    (image, _), seconds, peak = measure(shape_main.parse_csv_with_read_csv, csv_path, repeat=repeat)
+    stages["parse_csv_with_read_csv"] = stage_record(seconds, peak, points, "points/s")
+    pixels = image.size
+
+    processed, seconds, peak = measure(shape_main.preprocess_image, image, repeat=repeat)
+    stages["preprocess_image"] = stage_record(seconds, peak, pixels, "pixels/s")
+
+    shapes, seconds, peak = measure(shape_main.detect_shapes, processed, SHAPES, repeat=repeat)
+    stages["detect_shapes"] = stage_record(seconds, peak, pixels, "pixels/s")
+    shape_count = sum(len(v) for v in shapes.values())
+
+    _, seconds, peak = measure(shape_main.detect_shapes_pyramid, path_XYs, SHAPES, repeat=repeat)
+    stages["detect_shapes_pyramid"] = stage_record(seconds, peak, pixels, "pixels/s")
+
+    _, seconds, peak = measure(shape_main.detect_symmetry, shapes, repeat=repeat)
+    stages["detect_symmetry"] = stage_record(seconds, peak, shape_count, "shapes/s")
+
+    _, seconds, peak = measure(shape_main.detect_shapes_from_paths, path_XYs, SHAPES, repeat=repeat)
+    stages["detect_shapes_from_paths"] = stage_record(seconds, peak, points, "points/s")
+
+    xy, offsets = shape_main.read_csv_flat(csv_path)
+    _, seconds, peak = measure(regularize.regularize, xy, offsets, repeat=repeat)
+    stages["regularize"] = stage_record(seconds, peak, len(offsets) - 1, "segments/s")
+    return stages
+
+def bench_image(image_path, repeat):
+    stages = {}
+    image, seconds, peak = measure(maskingColors.load_image, image_path, repeat=repeat)
+    pixels = image.shape[0] * image.shape[1]
+    stages["load_image"] = stage_record(seconds, peak, pixels, "pixels/s")
+
+    image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    colors, seconds, peak = measure(maskingColors.extract_unique_colors, image_rgb, repeat=repeat)
+    stages["extract_unique_colors"] = stage_record(seconds, peak, pixels, "pixels/s")
+
+    color_ranges = maskingColors.format_color_ranges(colors)
+    masks, seconds, peak = measure(maskingColors.segment_by_color_labels, image, color_ranges, repeat=repeat)
+    stages["segment_by_color_labels"] = stage_record(seconds, peak, pixels, "pixels/s")
+
+    masks = list(masks)
+    _, seconds, peak = measure(maskingColors.complete_masks, masks, repeat=repeat)
+    stages["complete_masks"] = stage_record(seconds, peak, pixels * len(masks), "pixels/s")
+
+    if len(masks):
+        _, seconds, peak = measure(maskingColors.main, image_path, repeat=repeat)
+        stages["maskingColors.main"] = stage_record(seconds, peak, pixels, "pixels/s")
+
+    _, seconds, peak = measure(morphology.detect_and_complete_occlusion, image_path, repeat=repeat)
+    stages["detect_and_complete_occlusion"] = stage_record(seconds, peak, pixels, "pixels/s")
+    return stages
+
+def run(quick=False, repeat=3):
+    results = {}
+    with tempfile.TemporaryDirectory() as work_dir:
+        cwd = os.getcwd()
+        os.chdir(work_dir)  # The scripts write their images to ./output
+        try:
+            for name, csv_path in csv_cases(work_dir, quick):
+                results[name] = bench_csv(csv_path, repeat)
+            for name, image_path in image_cases(work_dir, quick):
+                results[name] = bench_image(image_path, repeat)
+        finally:
+            os.chdir(cwd)
+    return results
+
+def print_table(results, baseline=None):
+    print(f"{'case':32} {'stage':30} {'seconds':>9} {'peak MB':>9} {'throughput':>16} {'vs base':>8}")
+    for case, stages in results.items():
+        for stage, record in stages.items():
+            change = ""
+            base = (baseline or {}).get(case, {}).get(stage)
+            if base and base["seconds"]:
+                change = f"{record['seconds'] / base['seconds'] - 1:+.0%}"
+            throughput = f"{record['throughput']:.3g} {record['unit']}" if record["throughput"] else ""
+            print(f"{case:32} {stage:30} {record['seconds']:9.4f} {record['peak_mb']:9.1f} {throughput:>16} {change:>8}")
+
+def regressions(results, baseline, tolerance):
+    slower = []
+    for case, stages in results.items():
+        for stage, record in stages.items():
+            base = baseline.get(case, {}).get(stage)
+            if base and base["seconds"] and record["seconds"] > base["seconds"] * (1 + tolerance):
+                slower.append((case, stage, base["seconds"], record["seconds"]))
+    return slower
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the shape detection and mask completion pipelines.")
+    parser.add_argument("--quick", action="store_true", help="skip the largest synthetic scale-ups")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage (default: %(default)s)")
+    parser.add_argument("--save", metavar="FILE", help="write the results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE", help="compare against a saved JSON baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="allowed slowdown before a stage counts as a regression (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    results = run(args.quick, args.repeat)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+    print_table(results, baseline)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}, f, indent=2)
+        print(f"Baseline saved to {args.save}")
+
+    if baseline is not None:
+        slower = regressions(results, baseline, args.tolerance)
+        for case, stage, before, after in slower:
+            print(f"REGRESSION {case} {stage}: {before:.4f}s -> {after:.4f}s")
+        if slower:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Load generator for ``server.py``: sends requests concurrently and reports the latency percentiles.
+
+Every connection is kept alive and sends its next request as soon as the
+previous answer arrived, so ``--concurrency`` is the number of requests the
+server sees at once. Requests answered 503 (the server's backpressure) are
+counted separately and left out of the latencies, and requests the server
+closed the connection on are counted as "closed".
+
+Usage:
+    python load_client.py --port 8765 --requests 200 --concurrency 8
+    python load_client.py --unix /tmp/gensolve.sock --mode vector Task-1-and-2/problems/isolated.csv
+    python load_client.py --occlusion Task-3/problems/occlusion1_rec.png
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from server import ROOT, read_message
+import main as shape_main
+
+def shapes_payload(csv_path, mode="raster", scale=5):
+    """The ``/shapes`` request body for the paths of a CSV file."""
+    paths = [[XY.tolist() for XY in XYs] for XYs in shape_main.read_csv(csv_path)]
+    return json.dumps({"paths": paths, "mode": mode, "scale": scale}).encode()
+
+def encode_request(route, body, content_type):
+    head = (f"POST {route} HTTP/1.1\r\nHost: localhost\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n")
+    return head.encode("latin-1") + body
+
+async def connect(host, port, unix_path):
+    if unix_path is not None:
+        return await asyncio.open_unix_connection(unix_path)
+    return await asyncio.open_connection(host, port)
+
+async def run_connection(requests, counter, total, latencies, statuses, host, port, unix_path):
+    """Send requests over one connection until ``total`` have been sent by all connections."""
+    reader, writer = await connect(host, port, unix_path)
+    try:
+        while counter[0] < total:
+            request = requests[counter[0] % len(requests)]
+            counter[0] += 1
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            message = await read_message(reader)
+            if message is None:
+                # The server closed the connection without answering; count it and stop this connection
+                statuses["closed"] = statuses.get("closed", 0) + 1
+                break
+            status = int(message[0].split()[1])
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+async def run_load(requests, total=100, concurrency=4, host="127.0.0.1", port=8765, unix_path=None):
+    """Send ``total`` requests (cycling through ``requests``) over ``concurrency`` connections."""
+    latencies, statuses, counter = [], {}, [0]
+    start = time.perf_counter()
+    await asyncio.gather(*(run_connection(requests, counter, total, latencies, statuses, host, port, unix_path)
+                           for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - start
+
+def summarize(latencies, statuses, seconds):
+    """Latency percentiles in milliseconds, throughput and status counts of a load run."""
+    summary = {"requests": sum(statuses.values()), "statuses": statuses,
+               "throughput": sum(statuses.values()) / seconds}
+    if latencies:
+        p50, p90, p99 = np.percentile(np.asarray(latencies) * 1000, [50, 90, 99])
+        summary.update(p50_ms=p50, p90_ms=p90, p99_ms=p99, max_ms=max(latencies) * 1000)
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the latency of a running server.py.")
+    parser.add_argument("inputs", nargs="*",
+                        help="CSV files (or PNG images with --occlusion) to send; default: the bundled problems")
+    parser.add_argument("--host", default="127.0.0.1", help="server address (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8765, help="server TCP port (default: %(default)s)")
+    parser.add_argument("--unix", metavar="PATH", help="connect to this Unix socket instead of TCP")
+    parser.add_argument("--requests", type=int, default=100, help="requests to send (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="connections sending at the same time (default: %(default)s)")
+    parser.add_argument("--mode", choices=["raster", "vector", "pyramid"], default="raster",
+                        help="detection mode of the /shapes requests (default: %(default)s)")
+    parser.add_argument("--occlusion", action="store_true", help="send images to /occlusion instead")
+    args = parser.parse_args(argv)
+
+    if args.occlusion:
+        inputs = args.inputs or sorted(glob.glob(os.path.join(ROOT, "Task-3", "problems", "*_rec.png")))
+        requests = []
+        for path in inputs:
+            with open(path, "rb") as f:
+                requests.append(encode_request("/occlusion", f.read(), "image/png"))
+    else:
+        inputs = args.inputs or sorted(glob.glob(os.path.join(ROOT, "Task-1-and-2", "problems", "*.csv")))
+        requests = [encode_request("/shapes", shapes_payload(path, args.mode), "application/json")
+                    for path in inputs]
+    if not requests:
+        parser.error("no inputs to send")
+
+    summary = summarize(*asyncio.run(run_load(requests, args.requests, args.concurrency, args.host, args.port,
+                                              args.unix)))
+    print(json.dumps(summary, indent=2))
+    return 0 if summary["statuses"].get(200) == summary["requests"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,249 @@
+"""Rendering backends for the shape plots and mask displays of both tasks.
+
+Detection never needs matplotlib, so it is only imported when the matplotlib
+backend actually draws something. The backends are
+
+    none        draw nothing
+    file        draw with OpenCV and write the image file only (no window)
+    matplotlib  the original figures, saved and optionally shown
+    svg         write the shapes as an SVG vector image
+
+The default comes from the GENSOLVE_RENDER environment variable and falls
+back to matplotlib; every entry point also takes a ``backend`` argument.
+
+The drawing primitives below work on whole arrays: coordinates are scaled in
+one NumPy operation and every shape type is drawn with a single batched
+OpenCV call, so the cost stays flat as the number of shapes grows.
+"""
+import os
+
+import cv2
+import numpy as np
+
+default_backend = os.environ.get("GENSOLVE_RENDER", "matplotlib")
+
+# Shape colors shared by the backends, as matplotlib format strings and BGR
+shape_styles = {
+    'lines': ('b-', (255, 0, 0)),
+    'circles': ('g', (0, 128, 0)),
+    'ellipses': ('r', (0, 0, 255)),
+    'rectangles': ('c-', (255, 255, 0)),
+    'rounded_rectangles': ('m-', (255, 0, 255)),
+    'polygons': ('y-', (0, 255, 255)),
+    'stars': ('b-', (255, 0, 0)),
+}
+
+# Fixed-point bits for sub-pixel shape outlines in cv2.polylines
+shift_bits = 4
+
+def bresenham_pixels(starts, ends):
+    """Pixels of the integer segments ``starts[i] -> ends[i]``, endpoints included, as (x, y) arrays.
+
+    All segments are rasterized at once with the closed form of the integer
+    Bresenham algorithm that PIL's ``ImageDraw.line`` (width 1) uses, so the
+    pixels are identical to drawing the segments one by one with PIL.
+    """
+    delta = ends - starts
+    step = np.where(delta < 0, -1, 1)
+    dx, dy = np.abs(delta).T
+    x_major = dx > dy
+    major = np.where(x_major, dx, dy)
+    minor = np.where(x_major, dy, dx)
+    counts = major + 1
+    segment = np.repeat(np.arange(len(starts)), counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    major, minor, x_major = major[segment], minor[segment], x_major[segment]
+    m = (2 * minor * k + major) // np.maximum(2 * major, 1)
+    x = starts[segment, 0] + step[segment, 0] * np.where(x_major, k, m)
+    y = starts[segment, 1] + step[segment, 1] * np.where(x_major, m, k)
+    return x, y
+
+def rasterize_polylines(image, xy, starts, value=0, origin=(0, 0)):
+    """Draw 1-pixel polylines into ``image`` in place.
+
+    ``xy`` holds the points of every polyline back to back and ``starts`` the
+    index where each polyline begins, followed by ``len(xy)``. Coordinates are
+    shifted by ``origin`` and truncated like PIL does, and pixels outside the
+    image are skipped.
+    """
+    points = np.trunc(np.asarray(xy, dtype=np.float64) - origin).astype(np.int64)
+    # A segment joins every point to the next one within the same polyline
+    joins = np.ones(len(points), dtype=bool)
+    joins[np.asarray(starts[1:], dtype=np.int64) - 1] = False
+    first = np.flatnonzero(joins[:-1]) if len(points) else np.empty(0, dtype=np.int64)
+    x, y = bresenham_pixels(points[first], points[first + 1])
+    inside = (x >= 0) & (y >= 0) & (x < image.shape[1]) & (y < image.shape[0])
+    image[y[inside], x[inside]] = value
+    return image
+
+def ellipse_outlines(centers, axes, angles, samples=90):
+    """Sample ellipses given like ``cv2.fitEllipse`` (full axis lengths, degrees) as ``(n, samples, 2)`` points."""
+    centers = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+    half_axes = np.asarray(axes, dtype=np.float64).reshape(-1, 2) / 2
+    theta = np.deg2rad(np.asarray(angles, dtype=np.float64).reshape(-1, 1))
+    t = np.linspace(0, 2 * np.pi, samples, endpoint=False)
+    x = half_axes[:, :1] * np.cos(t)
+    y = half_axes[:, 1:] * np.sin(t)
+    return np.stack([centers[:, :1] + x * np.cos(theta) - y * np.sin(theta),
+                     centers[:, 1:] + x * np.sin(theta) + y * np.cos(theta)], axis=2)
+
+def shape_outlines(shape_type, shape_list):
+    """Return the polylines of a list of detections and whether they are closed."""
+    if not len(shape_list):
+        return [], True
+    if shape_type == 'lines':
+        return list(np.asarray(shape_list, dtype=np.float64).reshape(-1, 2, 2)), False
+    if shape_type == 'circles':
+        circles = np.asarray(shape_list, dtype=np.float64).reshape(-1, 3)
+        diameters = 2 * circles[:, 2:].repeat(2, axis=1)
+        return list(ellipse_outlines(circles[:, :2], diameters, np.zeros(len(circles)))), True
+    if shape_type == 'ellipses':
+        centers, axes, angles = zip(*shape_list)
+        return list(ellipse_outlines(centers, axes, angles)), True
+    return [np.asarray(shape, dtype=np.float64).reshape(-1, 2) for shape in shape_list], True
+
+def draw_shapes(canvas, shapes, color=None, thickness=2):
+    """Draw every detection into ``canvas`` in place with one ``cv2.polylines`` call per shape type.
+
+    ``color`` overrides the per-type colors of ``shape_styles`` (use a scalar
+    for grayscale canvases).
+    """
+    for shape_type, shape_list in shapes.items():
+        outlines, closed = shape_outlines(shape_type, shape_list)
+        if not outlines:
+            continue
+        shape_color = color if color is not None else shape_styles.get(shape_type, ('', (0, 0, 0)))[1]
+        fixed = [np.rint(outline * (1 << shift_bits)).astype(np.int32) for outline in outlines]
+        cv2.polylines(canvas, fixed, closed, shape_color, thickness, cv2.LINE_8, shift_bits)
+    return canvas
+
+def svg_path_data(polylines, closed):
+    """SVG path data with one subpath per polyline."""
+    end = " Z" if closed else ""
+    return " ".join("M " + " L ".join(f"{x:.2f} {y:.2f}" for x, y in polyline) + end
+                    for polyline in polylines if len(polyline))
+
+def write_svg(output_path, width, height, paths=None, shapes=None, highlights=None):
+    """Write polylines and detections straight to an SVG file.
+
+    ``paths`` is a list of polylines drawn in black, ``shapes`` a detection
+    dict drawn in the ``shape_styles`` colors and ``highlights`` a detection
+    dict drawn in red on top. Each group becomes a single ``<path>``.
+    """
+    elements = [f'<rect width="{width}" height="{height}" fill="white"/>']
+    if paths:
+        elements.append(f'<path d="{svg_path_data(paths, False)}" fill="none" stroke="black" stroke-width="1"/>')
+    for group, stroke in ((shapes, None), (highlights, "red")):
+        for shape_type, shape_list in (group or {}).items():
+            outlines, closed = shape_outlines(shape_type, shape_list)
+            if not outlines:
+                continue
+            b, g, r = shape_styles.get(shape_type, ('', (0, 0, 0)))[1]
+            color = stroke or f"rgb({r},{g},{b})"
+            elements.append(f'<path class="{shape_type}" d="{svg_path_data(outlines, closed)}" fill="none" '
+                            f'stroke="{color}" stroke-width="2"/>')
+    with open(output_path, "w") as f:
+        f.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+                f'viewBox="0 0 {width} {height}">\n' + "\n".join(elements) + "\n</svg>\n")
+    return output_path
+
+class NullBackend:
+    """Draws nothing."""
+
+    def shapes(self, original_image, processed_image, shapes, output_path, show=True):
+        return None
+
+    def image(self, image, title, output_path=None, show=True, figsize=None):
+        return None
+
+class FileBackend:
+    """Draws with OpenCV into an image file; ``show`` is ignored."""
+
+    thickness = 2
+
+    def shapes(self, original_image, processed_image, shapes, output_path, show=True):
+        """Write the original and the processed image with the shapes drawn on it side by side."""
+        canvas = draw_shapes(cv2.cvtColor(processed_image, cv2.COLOR_GRAY2BGR), shapes, thickness=self.thickness)
+        combined = np.hstack([cv2.cvtColor(original_image, cv2.COLOR_GRAY2BGR), canvas])
+        cv2.imwrite(output_path, combined)
+        return output_path
+
+    def image(self, image, title, output_path=None, show=True, figsize=None):
+        if output_path is None:
+            return None
+        cv2.imwrite(output_path, image)
+        return output_path
+
+class MatplotlibBackend:
+    """The matplotlib figures; pyplot is imported on first use."""
+
+    def shapes(self, original_image, processed_image, shapes, output_path, show=True):
+        import matplotlib.pyplot as plt
+        from matplotlib.collections import LineCollection
+
+        # Create the plot
+        fig, axes = plt.subplots(1, 2, figsize=(16, 8))
+
+        # Show the original image
+        axes[0].imshow(original_image, cmap='gray')
+        axes[0].set_title("Original Image")
+        axes[0].axis("off")
+
+        # Show the processed image with detected shapes
+        axes[1].imshow(processed_image, cmap='gray')
+        axes[1].set_title("Detected Shapes")
+        axes[1].axis("off")
+
+        # One collection per shape type instead of one plot call per shape
+        for shape_type, shape_list in shapes.items():
+            outlines, closed = shape_outlines(shape_type, shape_list)
+            if not outlines or shape_type not in shape_styles:
+                continue
+            if closed:
+                outlines = [np.vstack([outline, outline[:1]]) for outline in outlines]
+            axes[1].add_collection(LineCollection(outlines, colors=shape_styles[shape_type][0].rstrip('-'),
+                                                  linewidths=2))
+
+        # Save the image
+        plt.savefig(output_path)
+
+        # Show the image
+        if show:
+            plt.show()
+
+        # Close the plot to release memory
+        plt.close()
+        return output_path
+
+    def image(self, image, title, output_path=None, show=True, figsize=None):
+        import matplotlib.pyplot as plt
+
+        plt.figure(figsize=figsize)
+        plt.imshow(image, cmap='gray')
+        plt.title(title)
+        plt.axis('off')
+        if output_path is not None:
+            plt.savefig(output_path)
+        if show:
+            plt.show()
+        plt.close()
+        return output_path
+
+class SvgBackend:
+    """Writes the detections as an SVG next to ``output_path`` (with a .svg extension); ``show`` is ignored."""
+
+    def shapes(self, original_image, processed_image, shapes, output_path, show=True):
+        height, width = processed_image.shape[:2]
+        return write_svg(os.path.splitext(output_path)[0] + ".svg", width, height, shapes=shapes)
+
+    def image(self, image, title, output_path=None, show=True, figsize=None):
+        return None
+
+backends = {'none': NullBackend, 'file': FileBackend, 'matplotlib': MatplotlibBackend, 'svg': SvgBackend}
+
+def get_backend(name=None):
+    """Return the rendering backend called ``name`` (default: ``default_backend``)."""
+    name = name or default_backend
+    if name not in backends:
+        raise ValueError(f"Unknown rendering backend '{name}', expected one of {', '.join(backends)}.")
+    return backends[name]()
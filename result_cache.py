@@ -0,0 +1,143 @@
+"""Content-addressed on-disk cache for detection results, shared by both tasks.
+
+Entries are keyed on a SHA-256 over the contents of the input files, the
+source of the modules that produced the result (so changing a threshold in
+the code invalidates them) and the call parameters such as the shape list and
+scale. Values are pickled and zlib-compressed. Every entry is written to a
+temporary file and moved into place with ``os.replace``, so worker processes
+sharing a cache directory never see a partial entry. A read refreshes the
+entry's modification time, and once the directory grows past ``max_bytes`` the
+least recently used entries are deleted.
+
+Set GENSOLVE_CACHE_DIR (and optionally GENSOLVE_CACHE_MB) to enable the cache
+for the scripts without changing any code. The cache directory must only be
+writable by you: entries are unpickled.
+"""
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import zlib
+
+file_digests = {}  # (path, size, mtime) -> digest, so unchanged files are hashed once per process
+
+def file_digest(path):
+    """SHA-256 of a file's contents."""
+    stat = os.stat(path)
+    cache_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if cache_key not in file_digests:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        file_digests[cache_key] = digest.hexdigest()
+    return file_digests[cache_key]
+
+class ResultCache:
+    """A directory of compressed results with a size cap and LRU eviction."""
+
+    suffix = ".bin"
+
+    def __init__(self, directory, max_bytes=512 * 2 ** 20, level=1):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.level = level
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, files, **params):
+        """Key for the result of ``files`` (inputs and code) computed with ``params``."""
+        digest = hashlib.sha256()
+        for path in files:
+            digest.update(file_digest(path).encode())
+        digest.update(json.dumps(params, sort_keys=True, default=repr).encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + self.suffix)
+
+    def get(self, key, default=None):
+        """Return the cached value for ``key``, or ``default`` when it is missing or unreadable."""
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.loads(zlib.decompress(f.read()))
+            os.utime(path)  # Mark as recently used
+        except (OSError, zlib.error, pickle.UnpicklingError, EOFError):
+            # Missing, evicted by another process in the meantime, or damaged
+            return default
+        return value
+
+    def put(self, key, value):
+        """Store ``value`` under ``key`` atomically and evict old entries when over the size cap."""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), self.level)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.evict()
+
+    def get_or_compute(self, key, func, *args, **kwargs):
+        """Return the cached value for ``key``, computing and storing it with ``func`` on a miss."""
+        value = self.get(key, default=self)
+        if value is self:
+            value = func(*args, **kwargs)
+            self.put(key, value)
+        return value
+
+    def entries(self):
+        """Return (mtime, size, path) of every entry, oldest first."""
+        entries = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(self.suffix):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, os.path.join(root, name)))
+        return sorted(entries)
+
+    def evict(self):
+        """Delete the least recently used entries until the cache fits in ``max_bytes``."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass  # Already evicted by another process
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+def default_cache():
+    """The cache configured by GENSOLVE_CACHE_DIR / GENSOLVE_CACHE_MB, or None."""
+    directory = os.environ.get("GENSOLVE_CACHE_DIR")
+    if not directory:
+        return None
+    return ResultCache(directory, int(os.environ.get("GENSOLVE_CACHE_MB", 512)) * 2 ** 20)
+
+def cached(cache, files, params, func, *args):
+    """Return ``func(*args)`` through ``cache`` (``default_cache()`` when None), keyed on ``files`` and ``params``.
+
+    Without any cache configured ``func`` is simply called.
+    """
+    cache = cache or default_cache()
+    if cache is None:
+        return func(*args)
+    return cache.get_or_compute(cache.key(files, **params), func, *args)
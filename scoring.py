@@ -0,0 +1,246 @@
+"""Quality scores against the ``*_sol`` ground truth bundled in ``problems/``.
+
+Curves (the CSV paths, regularized paths or detected shape outlines) are
+compared to a solution CSV by drawing both on one grid and looking up every
+drawn pixel of one side in the distance transform of the other. That gives
+both directed distance distributions in two ``cv2.distanceTransform`` calls,
+from which come the Chamfer distance (mean of the two directed means), the
+Hausdorff distance (largest distance either way) and the fraction of pixels
+within ``tolerance`` of the other side (precision for the prediction, recall
+for the truth). Distances are in CSV units. ``chamfer_distance`` and
+``hausdorff_distance`` compute the same two distances for two pixel masks.
+
+Masks (the Task-3 completions) are compared to the foreground of the
+``*_sol_rec.png`` images with IoU, for whole stacks of masks at once.
+
+Usage:
+    python scoring.py masks Task-3/problems             # score the Task-3 completions
+    python scoring.py compare base.jsonl fast.jsonl    # accept or reject a batch mode
+
+``batch.py --score`` adds the curve scores of every input to its record;
+``compare`` then weighs the timings of two such runs against their scores and
+exits with status 1 when the candidate lost quality.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import rendering
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Inputs whose ground truth does not follow the ``<stem>_sol.csv`` naming
+shared_solutions = {"frag0": "frag01_sol.csv", "frag1": "frag01_sol.csv"}
+
+def solution_path(csv_path):
+    """The ``*_sol.csv`` that holds the ground truth of ``csv_path``, or None.
+
+    ``<stem>.csv`` is solved by ``<stem>_sol.csv`` in the same directory,
+    except for the stems listed in ``shared_solutions`` (``frag0.csv`` and
+    ``frag1.csv`` share ``frag01_sol.csv``). Solution files themselves, and
+    inputs without a solution file, have no ground truth to score against.
+    """
+    directory, base = os.path.split(csv_path)
+    stem = os.path.splitext(base)[0]
+    if stem.endswith("_sol"):
+        return None
+    candidate = os.path.join(directory, shared_solutions.get(stem, f"{stem}_sol.csv"))
+    return candidate if os.path.exists(candidate) else None
+
+def flat_starts(offsets):
+    """Point index where every segment starts, followed by the number of points (see ``group_paths``)."""
+    return np.asarray(offsets)[:, 1]
+
+def shape_polylines(shapes, scale=5):
+    """Outlines of a ``detect_shapes`` dict as a flat point array in CSV units plus segment starts."""
+    polylines = []
+    for shape_type, shape_list in shapes.items():
+        outlines, closed = rendering.shape_outlines(shape_type, shape_list)
+        if closed:
+            outlines = [np.vstack([outline, outline[:1]]) for outline in outlines]
+        polylines.extend(outlines)
+    if not polylines:
+        return np.empty((0, 2)), np.zeros(1, dtype=np.int64)
+    counts = np.array([len(polyline) for polyline in polylines])
+    return np.concatenate(polylines) / scale, np.concatenate(([0], np.cumsum(counts)))
+
+def curve_grid(xys, resolution, margin, max_side):
+    """Origin and pixel size of a grid that holds every point array with ``margin`` units around them."""
+    points = np.concatenate([np.asarray(xy, dtype=np.float64).reshape(-1, 2) for xy in xys])
+    low = points.min(axis=0) - margin
+    extent = points.max(axis=0) + margin - low
+    # Coarsen the grid rather than allocating huge images for huge drawings
+    resolution = min(resolution, (max_side - 1) / max(extent.max(), 1e-9))
+    width, height = np.ceil(extent * resolution).astype(int) + 1
+    return low, resolution, (height, width)
+
+def curve_pixels(xy, starts, low, resolution, shape):
+    """Mask of the polylines drawn 1 pixel wide on the grid."""
+    image = np.zeros(shape, dtype=np.uint8)
+    xy = (np.asarray(xy, dtype=np.float64).reshape(-1, 2) - low) * resolution
+    return rendering.rasterize_polylines(image, xy, starts, value=1).astype(bool)
+
+def directed_distances(mask, other):
+    """Distance in pixels from every set pixel of ``mask`` to the nearest set pixel of ``other``."""
+    return cv2.distanceTransform(np.uint8(~np.asarray(other, dtype=bool)), cv2.DIST_L2,
+                                 cv2.DIST_MASK_PRECISE)[np.asarray(mask, dtype=bool)]
+
+def chamfer_distance(predicted, truth):
+    """Mean of the two directed mean distances between two non-empty boolean masks, in pixels."""
+    return float((directed_distances(predicted, truth).mean() + directed_distances(truth, predicted).mean()) / 2)
+
+def hausdorff_distance(predicted, truth):
+    """Largest distance from a pixel of either non-empty boolean mask to the other, in pixels."""
+    return float(max(directed_distances(predicted, truth).max(), directed_distances(truth, predicted).max()))
+
+def curve_scores(xy, starts, truth_xy, truth_starts, resolution=4, tolerance=1.0, max_side=4096):
+    """Chamfer, Hausdorff, precision and recall of the polylines ``xy`` against ``truth_xy``.
+
+    Both sides are a flat point array plus segment starts ending with the
+    number of points. Distances are in the units of the points, resolved to
+    ``1 / resolution``.
+    """
+    xy = np.asarray(xy, dtype=np.float64).reshape(-1, 2)
+    truth_xy = np.asarray(truth_xy, dtype=np.float64).reshape(-1, 2)
+    if not len(xy) or not len(truth_xy):
+        return {"chamfer": float("inf"), "hausdorff": float("inf"), "precision": 0.0, "recall": 0.0}
+    low, resolution, shape = curve_grid([xy, truth_xy], resolution, 2 * tolerance + 1, max_side)
+    predicted = curve_pixels(xy, starts, low, resolution, shape)
+    truth = curve_pixels(truth_xy, truth_starts, low, resolution, shape)
+
+    to_truth = directed_distances(predicted, truth) / resolution
+    to_predicted = directed_distances(truth, predicted) / resolution
+    return {
+        "chamfer": float((to_truth.mean() + to_predicted.mean()) / 2),
+        "hausdorff": float(max(to_truth.max(), to_predicted.max())),
+        "precision": float(np.mean(to_truth <= tolerance)),
+        "recall": float(np.mean(to_predicted <= tolerance)),
+    }
+
+def foreground(image, white=250):
+    """Pixels of an image that are not white (any channel below ``white``)."""
+    image = np.asarray(image)
+    return (image.min(axis=2) if image.ndim == 3 else image) < white
+
+def mask_iou(masks, truth):
+    """IoU of a mask, or of every mask of an ``(n, h, w)`` stack, with the boolean ``truth``.
+
+    Masks of another size than ``truth`` are resized to it first (nearest
+    neighbour), since some solutions were exported a few pixels narrower.
+    """
+    masks = np.asarray(masks).astype(bool)
+    if masks.shape[-2:] != truth.shape:
+        flat = masks.reshape(-1, *masks.shape[-2:]).astype(np.uint8)
+        resized = [cv2.resize(mask, truth.shape[::-1], interpolation=cv2.INTER_NEAREST) for mask in flat]
+        masks = np.stack(resized).reshape(*masks.shape[:-2], *truth.shape).astype(bool)
+    intersection = np.count_nonzero(masks & truth, axis=(-2, -1))
+    union = np.count_nonzero(masks | truth, axis=(-2, -1))
+    return np.where(union > 0, intersection / np.maximum(union, 1), 1.0)
+
+def score_mask_images(problem_dir, use_roi=True):
+    """Score the Task-3 completions of every ``*_rec.png`` that has a ``*_sol_rec.png`` next to it.
+
+    Yields one record per image with the IoU of the raw drawing, of
+    ``morphology``'s completed mask and of the union of ``maskingColors``'
+    completed color masks, plus the seconds each completion took.
+    """
+    sys.path.insert(0, os.path.join(ROOT, "Task-3"))
+    import maskingColors
+    import morphology
+
+    for truth_path in sorted(glob.glob(os.path.join(problem_dir, "*_sol_rec.png"))):
+        image_path = truth_path[:-len("_sol_rec.png")] + "_rec.png"
+        if not os.path.exists(image_path):
+            continue
+        truth = foreground(cv2.imread(truth_path))
+        gray = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+        record = {"input": image_path, "truth": truth_path,
+                  "input_iou": float(mask_iou(foreground(gray), truth))}
+
+        start = time.perf_counter()
+        _, binary_mask = cv2.threshold(gray, 127, 255, cv2.THRESH_BINARY)
+        completed_mask = morphology.complete_occlusion_masks(binary_mask, use_roi)[-1]
+        seconds = time.perf_counter() - start
+        # The morphology masks mark the white background, so the shapes are their complement
+        record["morphology"] = {"iou": float(mask_iou(completed_mask == 0, truth)), "seconds": seconds}
+
+        start = time.perf_counter()
+        masks = maskingColors.extract_completed_masks(image_path)
+        seconds = time.perf_counter() - start
+        record["masks"] = {"iou": float(mask_iou(np.any(masks > 127, axis=0), truth)), "seconds": seconds,
+                           "per_mask_iou": mask_iou(masks > 127, truth).tolist()}
+        yield record
+
+def load_records(path):
+    with open(path) as f:
+        return {record["input"]: record for record in map(json.loads, f) if "error" not in record}
+
+def run_seconds(record):
+    """Time a batch record spent on everything but the scoring itself."""
+    return record["timings"]["total"] - record["timings"].get("score", 0)
+
+def compare_runs(baseline, candidate, tolerance=0.25, recall_drop=0.02):
+    """Compare two ``batch.py --score`` runs input by input.
+
+    Returns the rows of the comparison and the inputs where the candidate
+    lost quality: a Chamfer distance more than ``tolerance`` units above the
+    baseline, or a recall more than ``recall_drop`` below it.
+    """
+    rows, rejected = [], []
+    for name in sorted(set(baseline) & set(candidate)):
+        base, cand = baseline[name], candidate[name]
+        for output in ("detected", "regularized"):
+            base_score = base.get("score", {}).get(output)
+            cand_score = cand.get("score", {}).get(output)
+            if base_score is None or cand_score is None:
+                continue
+            row = {"input": name, "output": output, "speedup": run_seconds(base) / max(run_seconds(cand), 1e-9),
+                   "chamfer": (base_score["chamfer"], cand_score["chamfer"]),
+                   "recall": (base_score["recall"], cand_score["recall"])}
+            rows.append(row)
+            if (cand_score["chamfer"] > base_score["chamfer"] + tolerance
+                    or cand_score["recall"] < base_score["recall"] - recall_drop):
+                rejected.append(row)
+    return rows, rejected
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score outputs against the bundled ground truth.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    masks = commands.add_parser("masks", help="score the Task-3 completions against the *_sol_rec.png images")
+    masks.add_argument("problem_dir", nargs="?", default=os.path.join(ROOT, "Task-3", "problems"))
+    masks.add_argument("--no-roi", action="store_true", help="complete the masks over the whole image")
+    compare = commands.add_parser("compare", help="compare the timings and scores of two batch.py --score runs")
+    compare.add_argument("baseline", help="JSON-lines output of the reference run")
+    compare.add_argument("candidate", help="JSON-lines output of the run to accept or reject")
+    compare.add_argument("--tolerance", type=float, default=0.25,
+                         help="largest accepted increase of the Chamfer distance, in CSV units (default: %(default)s)")
+    compare.add_argument("--recall-drop", type=float, default=0.02,
+                         help="largest accepted decrease of the recall (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.command == "masks":
+        for record in score_mask_images(args.problem_dir, not args.no_roi):
+            print(json.dumps(record))
+        return 0
+
+    rows, rejected = compare_runs(load_records(args.baseline), load_records(args.candidate), args.tolerance,
+                                  args.recall_drop)
+    print(f"{'input':<40} {'output':<12} {'speedup':>8} {'chamfer':>17} {'recall':>13}")
+    for row in rows:
+        print(f"{os.path.basename(row['input']):<40} {row['output']:<12} {row['speedup']:>7.2f}x "
+              f"{row['chamfer'][0]:>8.3f}->{row['chamfer'][1]:<7.3f} {row['recall'][0]:>5.3f}->{row['recall'][1]:<5.3f}")
+    if rejected:
+        print(f"\nRejected: {len(rejected)} outputs lost quality")
+        for row in rejected:
+            print(f"  {row['input']} ({row['output']})")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
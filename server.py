@@ -0,0 +1,365 @@
+"""Long-running local detection server for both tasks.
+
+Starting Python, importing OpenCV and NumPy and allocating the canvas costs
+more than detecting the shapes of one drawing. The server pays for it once:
+a pool of worker processes imports both pipelines, runs a warm-up detection
+and then keeps its canvas and ``OcclusionPipeline`` buffers between
+requests. An asyncio front end speaks plain HTTP/1.1 with JSON, on localhost
+TCP or a Unix socket:
+
+    POST /shapes      {"paths": [[[[x, y], ...], ...], ...], "shapes": [...], "scale": 5,
+                       "mode": "raster" | "vector" | "pyramid", "symmetry": true}
+                      paths are nested like ``read_csv``: path -> segment -> points
+    POST /occlusion   the PNG (or any OpenCV image) bytes; returns the completed
+                      mask as a base64 PNG
+    GET  /health      pool size and requests in flight
+
+At most ``workers + queue`` requests are in flight. Beyond that the server
+answers 503 with ``Retry-After`` right away instead of queueing without
+bound, so clients see the backpressure. A worker that dies takes the pool
+down with it; the pool is then replaced and the affected requests get 503.
+Raster and pyramid requests whose canvas would exceed ``--max-canvas-mpx``
+are refused with 413 before they reach a worker.
+
+Usage:
+    python server.py --port 8765 --workers 4
+    python server.py --unix /tmp/gensolve.sock
+    python load_client.py --port 8765 --requests 200 --concurrency 8
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+
+# Never open a window from a worker
+os.environ["MPLBACKEND"] = "Agg"
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.join(ROOT, "Task-1-and-2"), os.path.join(ROOT, "Task-3")]
+
+import cv2
+import numpy as np
+
+import main as shape_main
+import morphology
+import rendering
+from batch import DEFAULT_SHAPES, to_jsonable
+
+logger = logging.getLogger("gensolve.server")
+
+# Per-process state of a worker, filled in by init_worker
+worker_state = {}
+
+def init_worker():
+    """Import everything, allocate the buffers and run one warm-up request in a new worker."""
+    cv2.setNumThreads(1)
+    worker_state['canvas'] = np.empty((0, 0), dtype=np.uint8)
+    worker_state['pipeline'] = morphology.OcclusionPipeline()
+    square = [[np.array([[10, 10], [60, 10], [60, 60], [10, 60], [10, 10]], dtype=np.float64)]]
+    logging.disable(logging.INFO)  # Keep the warm-up out of the log
+    try:
+        detect_paths(square, DEFAULT_SHAPES)
+        worker_state['pipeline'].run(np.full((64, 64), 255, dtype=np.uint8))
+    finally:
+        logging.disable(logging.NOTSET)
+
+def worker_ready():
+    return os.getpid()
+
+def canvas_view(height, width, slack=4, keep_pixels=2 ** 20):
+    """A white ``(height, width)`` view into the worker's reused canvas.
+
+    The canvas grows to fit the request. Whenever it would hold more than
+    ``slack`` times the pixels the request needs (and more than
+    ``keep_pixels``), it is reallocated at the requested size instead, so one
+    large drawing does not pin its canvas for the rest of the worker's life.
+    """
+    canvas = worker_state['canvas']
+    limit = slack * max(height * width, keep_pixels)
+    if canvas.shape[0] < height or canvas.shape[1] < width or canvas.size > limit:
+        shape = (max(height, canvas.shape[0]), max(width, canvas.shape[1]))
+        if shape[0] * shape[1] > limit:
+            shape = (height, width)
+        canvas = np.empty(shape, dtype=np.uint8)
+        worker_state['canvas'] = canvas
+    view = canvas[:height, :width]
+    view.fill(255)
+    return view
+
+def detect_paths(path_XYs, shapes_to_detect, scale=5, mode="raster", symmetry=True):
+    """Detect shapes (and their symmetry) in paths nested like ``read_csv`` output."""
+    start = time.perf_counter()
+    path_XYs = [[np.asarray(XY, dtype=np.float64).reshape(-1, 2) for XY in XYs] for XYs in path_XYs]
+    if mode == "vector":
+        shapes = shape_main.detect_shapes_from_paths(path_XYs, shapes_to_detect, scale)
+    elif mode == "pyramid":
+        shapes = shape_main.detect_shapes_pyramid(path_XYs, shapes_to_detect, scale)
+    elif mode == "raster":
+        # Same canvas as parse_csv_with_read_csv, drawn into the reused buffer
+        left, top, right, bottom = shape_main.canvas_bounds(path_XYs, scale)
+        image = canvas_view(bottom - top, right - left)
+        segments = [XY for XYs in path_XYs for XY in XYs]
+        if segments:
+            starts = np.concatenate(([0], np.cumsum([len(XY) for XY in segments])))
+            rendering.rasterize_polylines(image, np.concatenate(segments) * scale - (left, top), starts)
+        shapes = shape_main.translate_shapes(
+            shape_main.detect_shapes(shape_main.preprocess_image(image), shapes_to_detect), (left, top))
+    else:
+        raise ValueError(f"Unknown mode '{mode}', expected raster, vector or pyramid.")
+    result = {"shapes": to_jsonable(shapes)}
+    if symmetry:
+        result["symmetry"] = to_jsonable(shape_main.detect_symmetry(shapes))
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+def complete_occlusion(image_bytes):
+    """Complete the occlusions of an encoded image and return the mask as a base64 PNG."""
+    start = time.perf_counter()
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        raise ValueError("The request body is not an image OpenCV can decode.")
+    # The pipeline's buffers are reused by the next request, so only the encoded copy leaves the worker
+    completed_mask = worker_state['pipeline'].run(image)
+    _, png = cv2.imencode(".png", completed_mask)
+    return {"width": image.shape[1], "height": image.shape[0], "mask_png": base64.b64encode(png).decode(),
+            "seconds": time.perf_counter() - start}
+
+class RequestError(ValueError):
+    """A malformed request, answered with ``status`` (400 unless given)."""
+
+    def __init__(self, message, status=HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+async def read_message(reader, max_body=64 * 2 ** 20):
+    """Read one HTTP/1.1 message and return its start line, lower-cased headers and body (None at EOF).
+
+    Raises ``RequestError`` for a start line without three parts, a header
+    line without a colon, a Content-Length that is not a non-negative
+    integer (400) or a body over ``max_body`` bytes (413).
+    """
+    start_line = await reader.readline()
+    if not start_line:
+        return None
+    start_line = start_line.decode("latin-1").strip()
+    if len(start_line.split()) != 3:
+        raise RequestError(f"Malformed start line {start_line[:80]!r}.")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, colon, value = line.decode("latin-1").partition(":")
+        if not colon or not name.strip():
+            raise RequestError(f"Malformed header line {line[:80]!r}.")
+        headers[name.strip().lower()] = value.strip()
+    length = headers.get("content-length", "0")
+    if not length.isdigit():
+        raise RequestError(f"Content-Length must be a non-negative integer, got {length[:80]!r}.")
+    length = int(length)
+    if length > max_body:
+        raise RequestError(f"Body of {length} bytes exceeds the limit of {max_body}.",
+                           HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    body = await reader.readexactly(length) if length else b""
+    return start_line, headers, body
+
+# Values accepted in a /shapes request
+known_shapes = DEFAULT_SHAPES + ['rounded_rectangles']
+known_modes = ("raster", "vector", "pyramid")
+
+def parse_shapes_request(body, max_canvas_pixels=None):
+    """Validate a ``/shapes`` body and return the ``detect_paths`` arguments, raising ``RequestError``.
+
+    The raster and pyramid modes draw the whole scaled drawing, so with
+    ``max_canvas_pixels`` a larger canvas is refused with 413.
+    """
+    try:
+        request = json.loads(body)
+    except ValueError as e:
+        raise RequestError(f"The body is not JSON: {e}")
+    if not isinstance(request, dict) or "paths" not in request:
+        raise RequestError("Expected a JSON object with 'paths'.")
+
+    paths = request["paths"]
+    if not isinstance(paths, list) or not all(isinstance(XYs, list) for XYs in paths):
+        raise RequestError("'paths' must be a list of paths, each a list of segments.")
+    path_XYs = []
+    for i, XYs in enumerate(paths):
+        segments = []
+        for j, XY in enumerate(XYs):
+            try:
+                XY = np.asarray(XY, dtype=np.float64)
+            except (ValueError, TypeError):
+                XY = None
+            if XY is None or XY.ndim != 2 or XY.shape[0] == 0 or XY.shape[1] != 2 or not np.isfinite(XY).all():
+                raise RequestError(f"Segment {j} of path {i} must be a non-empty list of finite [x, y] points.")
+            segments.append(XY)
+        path_XYs.append(segments)
+
+    shapes_to_detect = request.get("shapes", DEFAULT_SHAPES)
+    if not isinstance(shapes_to_detect, list) or not all(shape in known_shapes for shape in shapes_to_detect):
+        raise RequestError(f"'shapes' must be a list of shape types out of {known_shapes}.")
+    scale = request.get("scale", 5)
+    if isinstance(scale, bool) or not isinstance(scale, (int, float)) or not 0 < scale < float("inf"):
+        raise RequestError("'scale' must be a positive number.")
+    mode = request.get("mode", "raster")
+    if mode not in known_modes:
+        raise RequestError(f"Unknown mode {mode!r}, expected raster, vector or pyramid.")
+    symmetry = request.get("symmetry", True)
+    if not isinstance(symmetry, bool):
+        raise RequestError("'symmetry' must be true or false.")
+    if max_canvas_pixels is not None and mode != "vector":
+        left, top, right, bottom = shape_main.canvas_bounds(path_XYs, scale)
+        if (right - left) * (bottom - top) > max_canvas_pixels:
+            raise RequestError(f"The {right - left}x{bottom - top} canvas at scale {scale} exceeds the limit of "
+                               f"{max_canvas_pixels} pixels.", HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    return path_XYs, shapes_to_detect, scale, mode, symmetry
+
+def encode_message(start_line, payload, extra_headers=()):
+    """An HTTP/1.1 message with a JSON body."""
+    body = json.dumps(payload).encode()
+    headers = [start_line, "Content-Type: application/json", f"Content-Length: {len(body)}", *extra_headers]
+    return ("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body
+
+class DetectionServer:
+    """The asyncio front end: parses requests and hands the work to the warm process pool."""
+
+    def __init__(self, workers=None, queue=None, max_canvas_pixels=64 * 2 ** 20):
+        self.workers = workers or os.cpu_count()
+        self.capacity = self.workers + (self.workers if queue is None else queue)
+        self.max_canvas_pixels = max_canvas_pixels
+        self.in_flight = 0
+        self.pool = None
+
+    def new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker)
+
+    async def start_pool(self):
+        """Start every worker now, so the first requests do not pay for the imports."""
+        self.pool = self.new_pool()
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*(loop.run_in_executor(self.pool, worker_ready) for _ in range(self.workers)))
+        logger.info("%d workers ready (pids %s)", self.workers, sorted(set(pids)))
+
+    async def submit(self, func, *args):
+        """Run ``func`` in the pool, or return None at once when ``capacity`` requests are in flight.
+
+        When a worker dies the pool is broken for every request; the first
+        request to notice replaces it, and the affected requests return None.
+        """
+        if self.in_flight >= self.capacity:
+            return None
+        self.in_flight += 1
+        pool = self.pool
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+        except BrokenProcessPool:
+            if self.pool is pool:
+                logger.error("A worker process died, restarting the pool")
+                pool.shutdown(wait=False, cancel_futures=True)
+                self.pool = self.new_pool()
+            return None
+        finally:
+            self.in_flight -= 1
+
+    async def dispatch(self, method, target, headers, body):
+        """Return the status and JSON payload for one request."""
+        route = target.split("?", 1)[0]
+        if method == "GET" and route == "/health":
+            return HTTPStatus.OK, {"status": "ok", "workers": self.workers, "in_flight": self.in_flight,
+                                   "capacity": self.capacity}
+        if method != "POST" or route not in ("/shapes", "/occlusion"):
+            return HTTPStatus.NOT_FOUND, {"error": f"No route for {method} {route}"}
+
+        if route == "/shapes":
+            try:
+                func, args = detect_paths, parse_shapes_request(body, self.max_canvas_pixels)
+            except RequestError as e:
+                return e.status, {"error": str(e)}
+        else:
+            func, args = complete_occlusion, (body,)
+        try:
+            result = await self.submit(func, *args)
+        except ValueError as e:
+            # Undecodable images
+            return HTTPStatus.BAD_REQUEST, {"error": str(e)}
+        if result is None:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Server busy or restarting its workers, retry later"}
+        return HTTPStatus.OK, result
+
+    async def handle(self, reader, writer):
+        """Serve the requests of one (keep-alive) connection."""
+        try:
+            while True:
+                try:
+                    message = await read_message(reader)
+                except RequestError as e:
+                    # The rest of the stream cannot be framed, so the connection ends here
+                    writer.write(encode_message(f"HTTP/1.1 {e.status.value} {e.status.phrase}", {"error": str(e)},
+                                                ["Connection: close"]))
+                    await writer.drain()
+                    break
+                if message is None:
+                    break
+                start_line, headers, body = message
+                method, target = start_line.split()[:2]
+                try:
+                    status, payload = await self.dispatch(method, target, headers, body)
+                except Exception as e:
+                    logger.exception("Request %s %s failed", method, target)
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(e).__name__}: {e}"}
+                extra = ["Retry-After: 1"] if status == HTTPStatus.SERVICE_UNAVAILABLE else []
+                writer.write(encode_message(f"HTTP/1.1 {status.value} {status.phrase}", payload, extra))
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass  # Client went away mid-request
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765, unix_path=None):
+        await self.start_pool()
+        try:
+            if unix_path is not None:
+                server = await asyncio.start_unix_server(self.handle, unix_path)
+                logger.info("Listening on %s", unix_path)
+            else:
+                server = await asyncio.start_server(self.handle, host, port)
+                logger.info("Listening on http://%s:%d", host, port)
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            if unix_path is not None and os.path.exists(unix_path):
+                os.unlink(unix_path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve shape detection and occlusion completion over local HTTP.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: %(default)s)")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port (default: %(default)s)")
+    parser.add_argument("--unix", metavar="PATH", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (default: CPU count)")
+    parser.add_argument("--queue", type=int,
+                        help="requests that may wait for a worker before the server answers 503 (default: workers)")
+    parser.add_argument("--max-canvas-mpx", type=float, default=64,
+                        help="largest raster or pyramid canvas a request may need, in megapixels (default: "
+                             "%(default)s)")
+    args = parser.parse_args(argv)
+
+    server = DetectionServer(args.workers, args.queue, int(args.max_canvas_mpx * 2 ** 20))
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    logging.basicConfig(level=os.environ.get("GENSOLVE_LOG_LEVEL", "WARNING"), format="%(message)s")
+    main()
@@ -0,0 +1,10 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TASK12_DIR = os.path.join(ROOT, "Task-1-and-2")
+TASK3_DIR = os.path.join(ROOT, "Task-3")
+sys.path[:0] = [ROOT, TASK12_DIR, TASK3_DIR]
+
+os.environ.setdefault("GENSOLVE_RENDER", "none")
+os.environ.setdefault("MPLBACKEND", "Agg")
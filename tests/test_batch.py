@@ -0,0 +1,31 @@
+import inspect
+import os
+
+import pytest
+
+import batch
+import rendering
+from conftest import TASK12_DIR
+
+CSV_PATH = os.path.join(TASK12_DIR, 'problems', 'isolated.csv')
+
+@pytest.mark.parametrize("render, extension", [('file', '.png'), ('svg', '.svg')])
+def test_image_record_points_to_the_written_file(tmp_path, render, extension):
+    record = batch.process_csv(CSV_PATH, batch.DEFAULT_SHAPES, image_dir=str(tmp_path), render=render)
+    assert 'error' not in record
+    assert record['image'].endswith(extension) and os.path.isfile(record['image'])
+
+def test_no_image_record_without_a_file(tmp_path):
+    record = batch.process_csv(CSV_PATH, batch.DEFAULT_SHAPES, image_dir=str(tmp_path), render='none')
+    assert 'error' not in record
+    assert record['image'] is None and not os.listdir(tmp_path)
+
+def test_default_render_is_the_file_backend(tmp_path, monkeypatch):
+    calls = []
+    signature = inspect.signature(batch.run_batch)
+    monkeypatch.setattr(batch, 'run_batch', lambda *args, **kwargs: calls.append(
+        signature.bind(*args, **kwargs).arguments))
+    batch.main([CSV_PATH, '--images', str(tmp_path), '--output', str(tmp_path / 'out.jsonl')])
+    assert calls[0]['render'] == 'file'
+    # The file backend draws with OpenCV, so headless workers never need matplotlib
+    assert isinstance(rendering.get_backend(calls[0]['render']), rendering.FileBackend)
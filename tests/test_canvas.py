@@ -0,0 +1,98 @@
+import os
+
+import numpy as np
+import pytest
+
+import main as shape_main
+from conftest import TASK12_DIR
+
+SHAPES = ['lines', 'rectangles', 'circles', 'ellipses', 'polygons', 'stars']
+
+def circle_csv(tmp_path, cx, cy, radius=80):
+    t = np.linspace(0, 2 * np.pi, 400)
+    rows = np.column_stack([np.zeros((len(t), 2)), cx + radius * np.cos(t), cy + radius * np.sin(t)])
+    path = tmp_path / "circle.csv"
+    np.savetxt(path, rows, delimiter=",")
+    return str(path)
+
+def test_canvas_follows_the_bounding_box():
+    t = np.linspace(0, 2 * np.pi, 100)
+    far = [[np.column_stack([3000 + 40 * np.cos(t), 3000 + 40 * np.sin(t)])]]
+    width, height = shape_main.canvas_size(far)
+    assert width < 500 and height < 500
+
+@pytest.mark.parametrize("center", [(100, 100), (3000, 3000), (-10, 100), (-500, -700)])
+def test_circles_are_found_anywhere(tmp_path, center):
+    csv_path = circle_csv(tmp_path, *center)
+    path_XYs = shape_main.read_csv(csv_path)
+    raster, _ = shape_main.detect_csv(csv_path, SHAPES)
+    tiled = shape_main.detect_shapes_tiled(path_XYs, SHAPES, tile_size=256)
+    pyramid = shape_main.detect_shapes_pyramid(path_XYs, SHAPES)
+    for shapes in (raster, tiled, pyramid):
+        assert len(shapes['circles']) == 1
+        x, y, radius = shapes['circles'][0]
+        assert abs(x - 5 * center[0]) <= 2 and abs(y - 5 * center[1]) <= 2 and abs(radius - 400) <= 4
+    # The whole circle is inked, including the part at negative coordinates
+    image, _ = shape_main.parse_csv_with_read_csv(csv_path)
+    assert np.count_nonzero(image < 255) > 2 * np.pi * 400 * 0.9
+
+def test_translate_shapes_round_trip():
+    shapes = {'lines': [((1, 2), (3, 4))], 'circles': [(5, 6, 7)], 'ellipses': [((1.0, 2.0), (3.0, 4.0), 5.0)],
+              'rectangles': [np.array([[[0, 0]], [[4, 0]], [[4, 4]], [[0, 4]]], dtype=np.int32)]}
+    back = shape_main.translate_shapes(shape_main.translate_shapes(shapes, (10, -20)), (-10, 20))
+    assert back['lines'] == shapes['lines'] and back['circles'] == shapes['circles']
+    assert back['ellipses'] == shapes['ellipses']
+    np.testing.assert_array_equal(back['rectangles'][0], shapes['rectangles'][0])
+
+def same_shapes(a, b):
+    assert a.keys() == b.keys()
+    for shape_type in a:
+        assert len(a[shape_type]) == len(b[shape_type]), shape_type
+        for x, y in zip(a[shape_type], b[shape_type]):
+            assert np.allclose(np.hstack([np.ravel(v) for v in x]), np.hstack([np.ravel(v) for v in y])), shape_type
+
+PROBLEMS = sorted(n[:-4] for n in os.listdir(os.path.join(TASK12_DIR, 'problems')) if n.endswith('.csv'))
+
+@pytest.mark.parametrize("name", PROBLEMS)
+def test_pyramid_matches_detect_shapes(name):
+    csv_path = os.path.join(TASK12_DIR, 'problems', name + '.csv')
+    shapes, _ = shape_main.detect_csv(csv_path, SHAPES)
+    pyramid, _ = shape_main.detect_csv(csv_path, SHAPES, pyramid=True)
+    same_shapes(pyramid, shapes)
+
+def canonical(shapes):
+    """Every detection as a flat tuple, sorted per type, so the order of detection does not matter."""
+    return {shape_type: sorted(tuple(np.round(np.hstack([np.ravel(v) for v in shape]), 3)) for shape in shape_list)
+            for shape_type, shape_list in shapes.items()}
+
+@pytest.mark.parametrize("name", PROBLEMS)
+def test_tiled_matches_untiled(name):
+    csv_path = os.path.join(TASK12_DIR, 'problems', name + '.csv')
+    shape_types = SHAPES[1:] + ['rounded_rectangles']
+    image, _ = shape_main.parse_csv_with_read_csv(csv_path)
+    origin = shape_main.canvas_bounds(shape_main.read_csv(csv_path))[:2]
+    untiled = shape_main.translate_shapes(
+        shape_main.detect_shapes(shape_main.preprocess_image(image), shape_types, dedupe=False), origin)
+    # Lines are reported per tile, every other shape must come out exactly once and unchanged
+    for tile_size in (128, 200, 256, 300, 400, 512, 700):
+        tiled = shape_main.detect_shapes_tiled(shape_main.read_csv(csv_path), shape_types, tile_size=tile_size,
+                                               dedupe=False)
+        assert canonical(tiled) == canonical(untiled), tile_size
+
+@pytest.mark.parametrize("name", ['isolated', 'isolated_sol'])
+def test_vector_counts_match_raster(name):
+    csv_path = os.path.join(TASK12_DIR, 'problems', name + '.csv')
+    raster, _ = shape_main.detect_csv(csv_path, SHAPES)
+    vector = shape_main.detect_shapes_from_paths(shape_main.read_csv(csv_path), SHAPES)
+    counts = {shape_type: (len(vector[shape_type]), len(raster[shape_type])) for shape_type in SHAPES}
+    # Outlines drawn once are found once either way
+    for shape_type in ('circles', 'ellipses', 'polygons'):
+        assert counts[shape_type][0] == counts[shape_type][1], shape_type
+    # On the canvas strokes that cross also enclose regions of their own, and Hough splits curved strokes
+    for shape_type in ('lines', 'rectangles', 'stars'):
+        assert 0 < counts[shape_type][0] <= counts[shape_type][1], shape_type
+    # Every outline found on the paths is found on the canvas too, in the same place
+    for shape_type in SHAPES[1:]:
+        boxes = np.array([shape_main.shape_bbox(shape_type, shape) for shape in raster[shape_type]])
+        for shape in vector[shape_type]:
+            assert np.abs(boxes - shape_main.shape_bbox(shape_type, shape)).max(axis=1).min() <= 12, shape_type
@@ -0,0 +1,39 @@
+import numpy as np
+import pytest
+
+import main as shape_main
+
+def raw_detections(tmp_path, rows, shapes):
+    path = tmp_path / "shape.csv"
+    np.savetxt(path, rows, delimiter=",")
+    image, _ = shape_main.parse_csv_with_read_csv(str(path))
+    return shape_main.detect_shapes(shape_main.preprocess_image(image), shapes, dedupe=False)
+
+def outline(points):
+    points = np.asarray(points, dtype=float)
+    return np.column_stack([np.zeros((len(points), 2)), points])
+
+def test_concentric_circles_are_kept():
+    shapes = {'circles': [(500, 500, 100), (500, 500, 106)]}
+    assert len(shape_main.deduplicate_shapes(shapes)['circles']) == 2
+
+def test_parallel_lines_are_kept():
+    shapes = {'lines': [((100, 200), (400, 200)), ((100, 205), (400, 205))]}
+    assert len(shape_main.deduplicate_shapes(shapes)['lines']) == 2
+
+def test_close_copies_are_merged():
+    shapes = {'circles': [(500, 500, 100), (502, 499, 103)],
+              'lines': [((100, 200), (400, 200)), ((106, 203), (404, 202))],
+              'rectangles': [((100, 100), (300, 200)), ((103, 102), (298, 197))]}
+    deduplicated = shape_main.deduplicate_shapes(shapes)
+    assert {name: len(found) for name, found in deduplicated.items()} == {'circles': 1, 'lines': 1, 'rectangles': 1}
+
+@pytest.mark.parametrize("shape_type, rows", [
+    ('circles', outline([(500 + 150 * np.cos(t), 400 + 150 * np.sin(t)) for t in np.linspace(0, 2 * np.pi, 400)])),
+    ('rectangles', outline([(100, 100), (500, 100), (500, 300), (100, 300), (100, 100)])),
+    ('lines', outline([(100, 100), (200, 100)])),
+])
+def test_both_contours_of_a_stroke_are_merged(tmp_path, shape_type, rows):
+    raw = raw_detections(tmp_path, rows, [shape_type])
+    assert len(raw[shape_type]) > 1
+    assert len(shape_main.deduplicate_shapes(raw)[shape_type]) == 1
@@ -0,0 +1,124 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+import maskingColors
+import regions
+from conftest import TASK3_DIR
+
+def problem_image(name):
+    return maskingColors.load_image(os.path.join(TASK3_DIR, 'problems', name + '.png'))
+
+def problem_ranges(image):
+    colors = maskingColors.extract_unique_colors(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+    return maskingColors.format_color_ranges(colors)
+
+@pytest.mark.parametrize("name", ['occlusion1_rec', 'occlusion2_rec'])
+def test_label_map_matches_in_range(name):
+    image = problem_image(name)
+    color_ranges = problem_ranges(image)
+    expected = maskingColors.segment_by_color(image, color_ranges)
+    labels = maskingColors.segment_by_color_labels(image, color_ranges)
+    assert len(labels) == len(expected)
+    for mask, reference in zip(labels, expected):
+        assert np.array_equal(mask, reference)
+
+def test_label_map_overlap_goes_to_first_range():
+    rng = np.random.default_rng(0)
+    image = rng.integers(0, 256, (64, 64, 3), dtype=np.uint8)
+    color_ranges = [((0, 0, 0), (90, 255, 255)), ((60, 0, 0), (179, 255, 255)), ((0, 0, 0), (179, 255, 128))]
+    expected = maskingColors.segment_by_color(image, color_ranges)
+    labels = maskingColors.segment_by_color_labels(image, color_ranges)
+    taken = np.zeros(image.shape[:2], dtype=bool)
+    for mask, reference in zip(labels, expected):
+        assert np.array_equal(mask > 0, (reference > 0) & ~taken)
+        taken |= reference > 0
+
+def blob_mask(seed=0, shape=(1200, 1600), count=6):
+    rng = np.random.default_rng(seed)
+    mask = np.zeros(shape, dtype=np.uint8)
+    for _ in range(count):
+        center = (int(rng.integers(0, shape[1])), int(rng.integers(0, shape[0])))
+        axes = (int(rng.integers(3, 40)), int(rng.integers(3, 40)))
+        cv2.ellipse(mask, center, axes, float(rng.uniform(0, 180)), 0, float(rng.uniform(90, 360)), 255, 2)
+    return mask
+
+@pytest.mark.parametrize("seed", range(4))
+def test_roi_completion_matches_full(seed):
+    mask = blob_mask(seed)
+    # The windows are sparse enough that the windowed path actually runs
+    windows = regions.component_windows(mask, maskingColors.completion_pad)
+    assert sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in windows) < 0.5 * mask.size
+    assert np.array_equal(maskingColors.complete_mask(mask, use_roi=True), maskingColors.complete_mask(mask, use_roi=False))
+
+@pytest.mark.parametrize("name", ['occlusion1_rec', 'occlusion2_rec'])
+def test_roi_completion_matches_full_on_problems(name):
+    image = problem_image(name)
+    for mask in maskingColors.segment_by_color_labels(image, problem_ranges(image)):
+        assert np.array_equal(maskingColors.complete_mask(mask, use_roi=True),
+                              maskingColors.complete_mask(mask, use_roi=False))
+
+class RecordingMasks(maskingColors.LabelMasks):
+    """LabelMasks that records the thread building each mask."""
+
+    def __init__(self, labels, count):
+        super().__init__(labels, count)
+        self.threads = []
+
+    def __getitem__(self, index):
+        self.threads.append(threading.current_thread().name)
+        return super().__getitem__(index)
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_concurrent_completion_matches_sequential(workers):
+    image = problem_image('occlusion2_rec')
+    labels = maskingColors.segment_by_color_labels(image, problem_ranges(image))
+    masks = RecordingMasks(labels.labels, len(labels))
+    completed = maskingColors.complete_masks(masks, workers=workers)
+    # Apart from the first mask (for the output shape) every mask is built inside its task
+    assert len(masks.threads) == len(masks) + 1
+    assert all(name.startswith('complete_mask') for name in masks.threads[1:])
+    for mask, result in zip(labels, completed):
+        assert np.array_equal(result, maskingColors.complete_mask(mask))
+
+def palette_image(hsv_counts):
+    """One-row RGB image with ``count`` pixels of every HSV color, plus some white background."""
+    hsv = np.array([color for color, _ in hsv_counts], dtype=np.uint8).reshape(-1, 1, 3)
+    rgb = cv2.cvtColor(hsv, cv2.COLOR_HSV2RGB).reshape(-1, 3)
+    pixels = np.repeat(rgb, [count for _, count in hsv_counts], axis=0)
+    return np.vstack([pixels, np.full((100, 3), 255, np.uint8)]).reshape(1, -1, 3)
+
+def find_color(palette, hsv, tolerance=(3, 12, 12)):
+    """Indices of the palette colors within ``tolerance`` of ``hsv``."""
+    close = (maskingColors.hue_distance(palette[:, 0], np.uint8(hsv[0])) <= tolerance[0]) & \
+            np.all(np.abs(palette[:, 1:].astype(np.int32) - hsv[1:]) <= tolerance[1:], axis=1)
+    return np.flatnonzero(close)
+
+def test_near_duplicate_hues_merge_across_red():
+    # 2 and 177 are 5 hues apart across the wraparound, 170 is 12 away from 2
+    colors = [((2, 200, 200), 500), ((177, 200, 200), 300), ((170, 200, 200), 200),
+              ((60, 200, 200), 400), ((64, 210, 190), 100)]
+    palette = maskingColors.extract_unique_colors(palette_image(colors))
+    assert len(palette) == 3
+    # The merged reds average to a hue within the red wraparound, not a green
+    reds = find_color(palette, (0, 200, 200), tolerance=(4, 12, 12))
+    assert len(reds) == 1
+    assert len(find_color(palette, (170, 200, 200))) == 1
+    assert len(find_color(palette, (61, 202, 198))) == 1
+    # Without merging every color stays
+    assert len(maskingColors.extract_unique_colors(palette_image(colors), merge_threshold=None)) == 5
+
+def test_palette_keeps_the_most_frequent_colors():
+    # 18 colors pairwise further apart than the merge threshold, the last two the rarest
+    hsv = [(hue, saturation, 200) for saturation in (240, 160, 80) for hue in range(0, 180, 30)]
+    colors = [(color, 1000 - 10 * i) for i, color in enumerate(hsv)]
+    palette = maskingColors.extract_unique_colors(palette_image(colors))
+    assert len(palette) == 16
+    for color in hsv[:16]:
+        assert len(find_color(palette, color)) == 1, color
+    for color in hsv[16:]:
+        assert len(find_color(palette, color)) == 0, color
+    assert len(maskingColors.extract_unique_colors(palette_image(colors), max_colors=None)) == 18
@@ -0,0 +1,52 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+import morphology
+from conftest import TASK3_DIR
+
+def problem_gray(name):
+    return cv2.imread(os.path.join(TASK3_DIR, 'problems', name + '.png'), cv2.IMREAD_GRAYSCALE)
+
+@pytest.mark.parametrize("output", ['mask', 'image'])
+@pytest.mark.parametrize("use_roi", [True, False])
+@pytest.mark.parametrize("tile_size", [64, 333])
+def test_tiled_occlusion_is_bit_identical(tmp_path, output, use_roi, tile_size):
+    image = problem_gray('occlusion2_rec')
+    expected = morphology.OcclusionPipeline().run(image, output)
+    input_path, output_path = str(tmp_path / 'in.npy'), str(tmp_path / 'out.npy')
+    np.save(input_path, image)
+    result = morphology.detect_and_complete_occlusion_tiled(input_path, output_path, tile_size=tile_size,
+                                                            output=output, use_roi=use_roi)
+    assert np.array_equal(result, expected)
+    assert np.array_equal(np.load(output_path), expected)
+
+def test_tiled_occlusion_raw_buffers(tmp_path):
+    image = problem_gray('occlusion1_rec')
+    input_path, output_path = str(tmp_path / 'in.raw'), str(tmp_path / 'out.raw')
+    image.tofile(input_path)
+    morphology.detect_and_complete_occlusion_tiled(input_path, output_path, shape=image.shape, tile_size=200)
+    result = np.fromfile(output_path, dtype=np.uint8).reshape(image.shape)
+    assert np.array_equal(result, morphology.OcclusionPipeline().run(image))
+
+def reference_chain(binary_mask):
+    eroded = cv2.erode(binary_mask, morphology.kernel, iterations=1)
+    dilated = cv2.dilate(eroded, morphology.kernel, iterations=3)
+    closed = cv2.morphologyEx(dilated, cv2.MORPH_CLOSE, morphology.closing_kernel)
+    return eroded, dilated, closed, cv2.dilate(closed, morphology.kernel, iterations=2)
+
+def test_pipeline_matches_plain_chain():
+    pipeline = morphology.OcclusionPipeline()
+    # Reused buffers stay correct when the shape changes between calls
+    for name in ('occlusion1_rec', 'occlusion2_rec', 'occlusion1_rec'):
+        image = problem_gray(name)
+        _, binary_mask = cv2.threshold(image, 127, 255, cv2.THRESH_BINARY)
+        expected = reference_chain(binary_mask)
+        for stage, reference in zip(morphology.morph_chain(binary_mask), expected):
+            assert np.array_equal(stage, reference)
+        for stage, reference in zip(morphology.complete_occlusion_masks(binary_mask), expected):
+            assert np.array_equal(stage, reference)
+        assert np.array_equal(pipeline.run(image), expected[-1])
+        assert np.array_equal(pipeline.run(image, 'image'), cv2.bitwise_and(image, image, mask=expected[-1]))
@@ -0,0 +1,65 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+import main as shape_main
+from conftest import TASK12_DIR
+
+def problem_copy(tmp_path, name="isolated.csv"):
+    path = tmp_path / name
+    shutil.copy(os.path.join(TASK12_DIR, "problems", name), path)
+    return str(path)
+
+def test_cached_read_equals_parse(tmp_path):
+    csv_path = problem_copy(tmp_path)
+    xy, offsets = shape_main.read_csv_flat(csv_path)
+    shape_main.read_csv_flat(csv_path, use_cache=True)  # Writes the sidecars
+    cached_xy, cached_offsets = shape_main.read_csv_flat(csv_path, use_cache=True)
+    assert isinstance(cached_xy, np.memmap)
+    np.testing.assert_array_equal(cached_xy, xy)
+    np.testing.assert_array_equal(cached_offsets, offsets)
+
+def test_truncated_sidecar_is_rebuilt(tmp_path):
+    csv_path = problem_copy(tmp_path)
+    xy, offsets = shape_main.read_csv_flat(csv_path, use_cache=True)
+    xy_path, _ = shape_main.cache_paths(csv_path)
+    # A write cut short leaves a fresh but truncated file
+    with open(xy_path, "r+b") as f:
+        f.truncate(os.path.getsize(xy_path) // 2)
+    cached_xy, cached_offsets = shape_main.read_csv_flat(csv_path, use_cache=True)
+    np.testing.assert_array_equal(cached_xy, xy)
+    np.testing.assert_array_equal(cached_offsets, offsets)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+PROBLEMS = sorted(name for name in os.listdir(os.path.join(TASK12_DIR, "problems")) if name.endswith(".csv"))
+
+def same_paths(a, b):
+    assert len(a) == len(b)
+    for XYs, expected in zip(a, b):
+        assert len(XYs) == len(expected)
+        for XY, expected_XY in zip(XYs, expected):
+            np.testing.assert_array_equal(XY, expected_XY)
+
+@pytest.mark.parametrize("chunk_rows", [1, 2, 3, 7, 100, 65536])
+@pytest.mark.parametrize("name", PROBLEMS)
+def test_streamed_paths_equal_read_csv(name, chunk_rows):
+    csv_path = os.path.join(TASK12_DIR, "problems", name)
+    same_paths(list(shape_main.iter_csv_paths(csv_path, chunk_rows)), shape_main.read_csv(csv_path))
+
+@pytest.mark.parametrize("chunk_rows", [1, 7, 65536])
+def test_stream_detect_equals_per_path_detection(chunk_rows):
+    csv_path = os.path.join(TASK12_DIR, "problems", "isolated_sol.csv")
+    shapes_to_detect = ['lines', 'rectangles', 'circles', 'ellipses', 'polygons', 'stars']
+    streamed = list(shape_main.stream_detect(csv_path, shapes_to_detect, chunk_rows=chunk_rows))
+    path_XYs = shape_main.read_csv(csv_path)
+    assert [path_index for path_index, _, _ in streamed] == list(range(len(path_XYs)))
+    for (_, shapes, _), XYs in zip(streamed, path_XYs):
+        expected = shape_main.detect_shapes_from_paths([XYs], shapes_to_detect)
+        assert shapes.keys() == expected.keys()
+        for shape_type in shapes:
+            assert len(shapes[shape_type]) == len(expected[shape_type]), shape_type
+            for shape, expected_shape in zip(shapes[shape_type], expected[shape_type]):
+                assert np.array_equal(np.hstack([np.ravel(v) for v in shape]),
+                                      np.hstack([np.ravel(v) for v in expected_shape])), shape_type
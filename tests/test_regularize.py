@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+import regularize
+
+def segments_of(*polylines, resample=True):
+    """``Segments`` of the given polylines, one path each, resampled like ``regularize`` does."""
+    polylines = [np.asarray(points, dtype=np.float64) for points in polylines]
+    counts = [len(points) for points in polylines]
+    offsets = np.column_stack([np.arange(len(polylines) + 1), np.concatenate(([0], np.cumsum(counts)))])
+    xy = np.concatenate(polylines)
+    if resample:
+        xy, offsets = regularize.resample_segments(xy, offsets)
+    return regularize.Segments(xy, offsets)
+
+def wobble(points, amplitude=0.3, seed=0):
+    """Points moved by up to ``amplitude`` in both coordinates, like a steady hand."""
+    return points + np.random.default_rng(seed).uniform(-amplitude, amplitude, np.shape(points))
+
+def arc(center, radius, start=0, stop=2 * np.pi, count=200):
+    t = np.linspace(start, stop, count)
+    return np.column_stack([center[0] + radius * np.cos(t), center[1] + radius * np.sin(t)])
+
+def rectangle(center, width, height, angle):
+    corners = np.array([[-width, -height], [width, -height], [width, height], [-width, height]]) / 2
+    cos, sin = np.cos(angle), np.sin(angle)
+    return corners @ [[cos, sin], [-sin, cos]] + center
+
+def assert_same_corners(found, expected, tolerance=1.0):
+    # Same corner set whatever the starting corner or direction
+    distances = np.hypot(*(np.asarray(found)[:, None, :] - np.asarray(expected)[None, :, :]).transpose(2, 0, 1))
+    assert len(found) == len(expected)
+    assert distances.min(axis=0).max() < tolerance
+
+@pytest.mark.parametrize("degrees", [0, 17, 45, 90, 135, -60])
+def test_fit_lines(degrees):
+    direction = np.array([np.cos(np.deg2rad(degrees)), np.sin(np.deg2rad(degrees))])
+    start, end = np.array([100.0, 200.0]), np.array([100.0, 200.0]) + 300 * direction
+    points = wobble(start + np.linspace(0, 1, 50)[:, None] * (end - start))
+    ends, error = regularize.fit_lines(segments_of(points))
+    assert np.allclose(ends[0], [start, end], atol=1.0)
+    assert error[0] < 0.002
+
+@pytest.mark.parametrize("start, stop", [(0, 2 * np.pi), (0.3, 2.0)])
+def test_fit_circles(start, stop):
+    centers, radii, error = regularize.fit_circles(segments_of(wobble(arc((250, 150), 80, start, stop))))
+    assert np.allclose(centers[0], (250, 150), atol=1.0)
+    assert radii[0] == pytest.approx(80, abs=1.0)
+    assert error[0] < 0.005
+
+@pytest.mark.parametrize("degrees", [0, 30, 90, 160])
+def test_fit_ellipses(degrees):
+    angle = np.deg2rad(degrees)
+    t = np.linspace(0, 2 * np.pi, 200)
+    x, y = 120 * np.cos(t), 60 * np.sin(t)
+    points = np.column_stack([300 + x * np.cos(angle) - y * np.sin(angle), 200 + x * np.sin(angle) + y * np.cos(angle)])
+    centers, semi_axes, angles, error = regularize.fit_ellipses(segments_of(wobble(points)))
+    assert np.allclose(centers[0], (300, 200), atol=1.0)
+    assert np.allclose(np.sort(semi_axes[0]), (60, 120), atol=1.5)
+    # The angle is that of the first semi-axis, which may be the minor one
+    major_angle = angles[0] + (0 if semi_axes[0, 0] > semi_axes[0, 1] else np.pi / 2)
+    assert np.cos(2 * (major_angle - angle)) > np.cos(np.deg2rad(2))
+    assert error[0] < 0.005
+
+@pytest.mark.parametrize("degrees", [0, 25, 90])
+def test_fit_rectangles(degrees):
+    corners = rectangle((200, 150), 200, 100, np.deg2rad(degrees))
+    found, error = regularize.fit_rectangles(segments_of(np.vstack([corners, corners[:1]])))
+    assert_same_corners(found[0], corners)
+    assert error[0] < 0.002
+
+@pytest.mark.parametrize("sides", regularize.polygon_sides)
+def test_fit_regular_polygons(sides):
+    corners = arc((300, 300), 100, 0.4, 0.4 + 2 * np.pi, sides + 1)
+    found, best, error = regularize.fit_regular_polygons(segments_of(wobble(corners)), regularize.polygon_sides)
+    assert regularize.polygon_sides[best[0]] == sides
+    assert_same_corners(found[best[0]][0], corners[:-1], tolerance=2.0)
+    assert error[0] < 0.005
+
+def test_collinear_points_have_no_circle_or_ellipse():
+    straight = np.column_stack([np.linspace(0, 100, 80), np.linspace(0, 50, 80)])
+    segments = segments_of(straight, arc((250, 150), 80))
+    _, _, circle_error = regularize.fit_circles(segments)
+    _, _, _, ellipse_error = regularize.fit_ellipses(segments)
+    assert np.isinf(circle_error[0]) and np.isinf(ellipse_error[0])
+    # The degenerate segment does not spoil the others fitted with it
+    assert circle_error[1] < 1e-6 and ellipse_error[1] < 1e-6
+
+def test_too_few_points():
+    # Two points for a circle, five for an ellipse: one short of determining either
+    segments = segments_of([[0, 0], [10, 5]], arc((50, 50), 20, count=5)[::2], arc((50, 50), 20, 0, 4, count=5),
+                           resample=False)
+    _, _, circle_error = regularize.fit_circles(segments)
+    _, _, _, ellipse_error = regularize.fit_ellipses(segments)
+    assert np.isinf(circle_error[0]) and np.isfinite(circle_error[1])
+    assert np.all(np.isinf(ellipse_error))
+    ends, line_error = regularize.fit_lines(segments)
+    assert np.allclose(ends[0], [[0, 0], [10, 5]]) and line_error[0] < 1e-9
@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+import main as shape_main
+import rendering
+from conftest import TASK12_DIR
+
+def pil_polylines(shape, polylines, origin=(0, 0)):
+    image = Image.new('L', (shape[1], shape[0]), 255)
+    draw = ImageDraw.Draw(image)
+    for polyline in polylines:
+        for p0, p1 in zip(polyline[:-1], polyline[1:]):
+            draw.line([tuple(p0 - origin), tuple(p1 - origin)], fill=0, width=1)
+    return np.array(image)
+
+def vector_polylines(shape, polylines, origin=(0, 0)):
+    image = np.full(shape, 255, dtype=np.uint8)
+    starts = np.cumsum([0] + [len(polyline) for polyline in polylines])
+    return rendering.rasterize_polylines(image, np.concatenate(polylines), starts, origin=origin)
+
+@pytest.mark.parametrize("seed", range(3))
+def test_rasterize_polylines_matches_pil(seed):
+    rng = np.random.default_rng(seed)
+    # Float points, some outside the canvas, single points and long strokes
+    polylines = [rng.uniform(-40, 240, (int(rng.integers(1, 30)), 2)) for _ in range(50)]
+    assert np.array_equal(vector_polylines((150, 200), polylines), pil_polylines((150, 200), polylines))
+    origin = np.array([13.0, -7.0])
+    assert np.array_equal(vector_polylines((150, 200), polylines, origin),
+                          pil_polylines((150, 200), polylines, origin))
+
+def test_rasterize_problem_matches_pil():
+    path_XYs = shape_main.read_csv(os.path.join(TASK12_DIR, 'problems', 'frag0.csv'))
+    polylines = [5 * segment for path in path_XYs for segment in path]
+    width, height = shape_main.canvas_size(path_XYs)
+    assert np.array_equal(vector_polylines((height, width), polylines), pil_polylines((height, width), polylines))
@@ -0,0 +1,53 @@
+import os
+import shutil
+
+import numpy as np
+
+import main as shape_main
+import result_cache
+from conftest import TASK12_DIR
+
+SHAPES = ['rectangles', 'circles', 'stars', 'polygons']
+
+def copy_problem(tmp_path, name='isolated_sol'):
+    path = tmp_path / (name + '.csv')
+    shutil.copy(os.path.join(TASK12_DIR, 'problems', name + '.csv'), path)
+    return str(path)
+
+def test_cached_detection_matches_uncached(tmp_path):
+    csv_path = copy_problem(tmp_path)
+    cache = result_cache.ResultCache(str(tmp_path / 'cache'))
+    shapes, symmetric = shape_main.detect_csv(csv_path, SHAPES)
+    first = shape_main.detect_csv(csv_path, SHAPES, cache=cache)
+    second = shape_main.detect_csv(csv_path, SHAPES, cache=cache)
+    assert len(cache.entries()) == 1
+    for cached_shapes, _ in (first, second):
+        assert cached_shapes['circles'] == shapes['circles']
+        for shape_type in ('rectangles', 'stars', 'polygons'):
+            assert all(np.array_equal(a, b) for a, b in zip(cached_shapes[shape_type], shapes[shape_type]))
+    assert [d['rotational_order'] for d in second[1]['details']] == [d['rotational_order'] for d in symmetric['details']]
+
+def test_key_follows_the_csv_and_the_sources(tmp_path, monkeypatch):
+    csv_path = copy_problem(tmp_path)
+    cache = result_cache.ResultCache(str(tmp_path / 'cache'))
+    key = shape_main.detection_cache_key(cache, csv_path, SHAPES)
+    assert shape_main.detection_cache_key(cache, csv_path, SHAPES) == key
+    assert shape_main.detection_cache_key(cache, csv_path, SHAPES, pyramid=True) != key
+
+    # Same path, new contents
+    with open(csv_path, 'a') as f:
+        f.write('9,0,1.0,1.0\n')
+    changed = shape_main.detection_cache_key(cache, csv_path, SHAPES)
+    assert changed != key
+
+    # Every detection source is part of the key
+    for index, source in enumerate(shape_main.detection_sources):
+        edited = tmp_path / ('edited_%d.py' % index)
+        edited.write_text(open(source).read() + '\n# edited\n')
+        sources = list(shape_main.detection_sources)
+        sources[index] = str(edited)
+        monkeypatch.setattr(shape_main, 'detection_sources', sources)
+        assert shape_main.detection_cache_key(cache, csv_path, SHAPES) != changed
+        monkeypatch.undo()
+    assert any(source.endswith('spatial_index.py') for source in shape_main.detection_sources)
+    assert any(source.endswith('rendering.py') for source in shape_main.detection_sources)
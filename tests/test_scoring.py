@@ -0,0 +1,55 @@
+import os
+
+import numpy as np
+import pytest
+
+import scoring
+from conftest import TASK12_DIR
+
+def square(offset=(0, 0), size=20, shape=(100, 100)):
+    mask = np.zeros(shape, dtype=bool)
+    y, x = 10 + offset[0], 10 + offset[1]
+    mask[y:y + size, x:x + size] = True
+    return mask
+
+def line(row, shape=(100, 100)):
+    mask = np.zeros(shape, dtype=bool)
+    mask[row, 10:90] = True
+    return mask
+
+def test_solution_path_maps_stems_exactly(tmp_path):
+    for name in ('frag0.csv', 'frag01_sol.csv', 'frag2.csv', 'frag2_sol.csv', 'shape1.csv', 'shape12_sol.csv'):
+        (tmp_path / name).write_text('')
+    assert scoring.solution_path(str(tmp_path / 'frag2.csv')) == str(tmp_path / 'frag2_sol.csv')
+    assert scoring.solution_path(str(tmp_path / 'frag0.csv')) == str(tmp_path / 'frag01_sol.csv')
+    # No digit matching: shape1 is not solved by shape12_sol
+    assert scoring.solution_path(str(tmp_path / 'shape1.csv')) is None
+    assert scoring.solution_path(str(tmp_path / 'frag2_sol.csv')) is None
+    assert scoring.solution_path(str(tmp_path / 'frag01_sol.csv')) is None
+
+def test_bundled_solutions():
+    problems = os.path.join(TASK12_DIR, 'problems')
+    for name in ('frag0', 'frag1', 'frag2', 'isolated', 'occlusion1', 'occlusion2'):
+        truth = scoring.solution_path(os.path.join(problems, name + '.csv'))
+        assert os.path.basename(truth) == ('frag01_sol.csv' if name in ('frag0', 'frag1') else name + '_sol.csv')
+
+@pytest.mark.parametrize("k", [0, 1, 3, 7])
+def test_distances_of_shifted_lines(k):
+    assert scoring.chamfer_distance(line(50 + k), line(50)) == pytest.approx(k, abs=0.01)
+    assert scoring.hausdorff_distance(line(50 + k), line(50)) == pytest.approx(k, abs=0.01)
+
+def test_distances_of_disjoint_masks():
+    left, right = square(), square((0, 50))
+    # Pixels in the same row are 31 to 50 columns from the other square
+    assert scoring.hausdorff_distance(left, right) == pytest.approx(50, abs=0.01)
+    assert scoring.chamfer_distance(left, right) == pytest.approx(np.mean(np.arange(31, 51)), abs=0.01)
+
+@pytest.mark.parametrize("k", [0, 2, 5, 10])
+def test_iou_of_shifted_squares(k):
+    assert scoring.mask_iou(square((0, k)), square()) == pytest.approx((20 - k) / (20 + k))
+
+def test_iou_of_disjoint_and_stacked_masks():
+    assert scoring.mask_iou(square((0, 50)), square()) == 0
+    assert scoring.mask_iou(np.zeros((100, 100), bool), np.zeros((100, 100), bool)) == 1
+    stack = np.stack([square(), square((0, 5)), square((50, 50))])
+    assert np.allclose(scoring.mask_iou(stack, square()), [1, 15 / 25, 0])
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import os
+from http import HTTPStatus
+
+import numpy as np
+import pytest
+
+import server
+
+def read(data):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await server.read_message(reader)
+    return asyncio.run(run())
+
+def test_read_message():
+    assert read(b"") is None
+    start_line, headers, body = read(b"POST /shapes HTTP/1.1\r\nContent-Length: 2\r\nX-A: b\r\n\r\n{}")
+    assert start_line == "POST /shapes HTTP/1.1" and headers == {"content-length": "2", "x-a": "b"} and body == b"{}"
+
+@pytest.mark.parametrize("data, status", [
+    (b"GET\r\n\r\n", HTTPStatus.BAD_REQUEST),
+    (b"garbage\r\n\r\n", HTTPStatus.BAD_REQUEST),
+    (b"POST /shapes HTTP/1.1\r\nno colon here\r\n\r\n", HTTPStatus.BAD_REQUEST),
+    (b"POST /shapes HTTP/1.1\r\nContent-Length: ten\r\n\r\n", HTTPStatus.BAD_REQUEST),
+    (b"POST /shapes HTTP/1.1\r\nContent-Length: -5\r\n\r\n", HTTPStatus.BAD_REQUEST),
+    (b"POST /shapes HTTP/1.1\r\nContent-Length: %d\r\n\r\n" % 2 ** 40, HTTPStatus.REQUEST_ENTITY_TOO_LARGE),
+])
+def test_read_message_rejects(data, status):
+    with pytest.raises(server.RequestError) as error:
+        read(data)
+    assert error.value.status == status
+
+@pytest.mark.parametrize("request_body", [
+    b"not json", b"[1, 2]", b"{}", {"paths": 5}, {"paths": [5]}, {"paths": [[5]]}, {"paths": [[[]]]},
+    {"paths": [[[[0, 0], [1]]]]}, {"paths": [[[["a", "b"]]]]}, {"paths": [[[[0, 0, 0]]]]},
+    {"paths": [], "shapes": "circles"}, {"paths": [], "shapes": ["hexagons"]}, {"paths": [], "scale": 0},
+    {"paths": [], "scale": "5"}, {"paths": [], "scale": True}, {"paths": [], "mode": "fast"},
+    {"paths": [], "symmetry": "yes"},
+])
+def test_shapes_request_schema(request_body):
+    body = request_body if isinstance(request_body, bytes) else json.dumps(request_body).encode()
+    status, payload = asyncio.run(server.DetectionServer(workers=1).dispatch("POST", "/shapes", {}, body))
+    assert status == HTTPStatus.BAD_REQUEST and "error" in payload
+
+def test_valid_shapes_request():
+    path_XYs, shapes, scale, mode, symmetry = server.parse_shapes_request(
+        json.dumps({"paths": [[[[0, 0], [50, 0], [50, 50]]]], "shapes": ["circles"], "scale": 2.5}).encode())
+    assert path_XYs[0][0].shape == (3, 2) and shapes == ["circles"] and scale == 2.5
+    assert mode == "raster" and symmetry is True
+
+def test_canvas_limit():
+    body = json.dumps({"paths": [[[[0, 0], [4000, 3000]]]]}).encode()
+    with pytest.raises(server.RequestError) as error:
+        server.parse_shapes_request(body, max_canvas_pixels=2 ** 20)
+    assert error.value.status == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+    # The vector mode draws nothing, so the limit does not apply
+    server.parse_shapes_request(json.dumps({"paths": [[[[0, 0], [4000, 3000]]]], "mode": "vector"}).encode(),
+                                max_canvas_pixels=2 ** 20)
+    status, _ = asyncio.run(server.DetectionServer(workers=1, max_canvas_pixels=2 ** 20).dispatch(
+        "POST", "/shapes", {}, body))
+    assert status == HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+
+def test_canvas_view_shrinks(monkeypatch):
+    monkeypatch.setitem(server.worker_state, 'canvas', np.empty((0, 0), dtype=np.uint8))
+    assert server.canvas_view(100, 200).shape == (100, 200)
+    server.canvas_view(4000, 3000)
+    assert server.worker_state['canvas'].shape == (4000, 3000)
+    # A small request reuses a canvas up to the floor, a large leftover one is dropped
+    view = server.canvas_view(100, 200)
+    assert view.shape == (100, 200) and (view == 255).all()
+    assert server.worker_state['canvas'].size <= 4 * 2 ** 20
+
+def test_pool_is_replaced_after_a_worker_dies():
+    async def run():
+        detection_server = server.DetectionServer(workers=1)
+        detection_server.pool = detection_server.new_pool()
+        try:
+            first = await detection_server.submit(server.worker_ready)
+            assert await detection_server.submit(os._exit, 1) is None
+            assert await detection_server.submit(server.worker_ready) not in (None, first)
+            assert detection_server.in_flight == 0
+        finally:
+            detection_server.pool.shutdown(cancel_futures=True)
+    asyncio.run(run())
@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+import pytest
+
+import main as shape_main
+from conftest import TASK12_DIR
+from shape_results import ShapeResults
+
+SHAPES = ['lines', 'rectangles', 'circles', 'ellipses', 'polygons', 'stars']
+
+@pytest.mark.parametrize("name", ['isolated_sol', 'frag01_sol', 'frag0'])
+def test_round_trip_through_npz(tmp_path, name):
+    shapes, symmetric = shape_main.detect_csv(os.path.join(TASK12_DIR, 'problems', name + '.csv'), SHAPES)
+    path = str(tmp_path / 'results.npz')
+    ShapeResults.from_dicts(shapes, symmetric).save(path)
+    results = ShapeResults.load(path)
+
+    assert results.counts() == {shape_type: len(shape_list) for shape_type, shape_list in shapes.items()}
+    restored = results.to_dicts()
+    assert restored['lines'] == [tuple(map(tuple, line)) for line in shapes['lines']]
+    assert restored['circles'] == [tuple(circle) for circle in shapes['circles']]
+    assert np.allclose([np.hstack(e) for e in restored['ellipses']], [np.hstack(e) for e in shapes['ellipses']])
+    for shape_type in ('rectangles', 'polygons', 'stars'):
+        assert len(restored[shape_type]) == len(shapes[shape_type])
+        for outline, shape in zip(restored[shape_type], shapes[shape_type]):
+            assert np.array_equal(outline, shape)
+
+    for detail in symmetric['details']:
+        row = results.tables[detail['shape_type']][detail['index']]
+        assert row['rotational_order'] == detail['rotational_order']
+        axes = results.axes[(results.axes['shape_type'] == detail['shape_type'])
+                            & (results.axes['index'] == detail['index'])]
+        if detail['reflection_axes'] is None:
+            assert row['reflection_axes'] == -1 and len(axes) == 0
+        else:
+            assert row['reflection_axes'] == len(detail['reflection_axes'])
+            assert np.allclose(axes['angle'], [angle for _, angle in detail['reflection_axes']])
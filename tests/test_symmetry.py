@@ -0,0 +1,41 @@
+import os
+
+import numpy as np
+import pytest
+
+import main as shape_main
+from conftest import TASK12_DIR
+
+def regular_polygon(sides, radius=200, phase=0.3, center=(500, 500)):
+    angles = phase + 2 * np.pi * np.arange(sides) / sides
+    return np.round(np.column_stack([center[0] + radius * np.cos(angles), center[1] + radius * np.sin(angles)]))
+
+@pytest.mark.parametrize("sides", range(3, 13))
+def test_regular_polygons_have_their_order(sides):
+    symmetry = shape_main.analyze_symmetry(regular_polygon(sides))
+    assert symmetry['rotational_order'] == sides
+    assert len(symmetry['reflection_axes']) == sides
+    assert shape_main.is_rotationally_symmetric(regular_polygon(sides), 'polygon')
+
+def test_circle_outline_is_continuous():
+    symmetry = shape_main.analyze_symmetry(regular_polygon(120))
+    assert symmetry['rotational_order'] == 0 and symmetry['reflection_axes'] is None
+    assert shape_main.is_reflectionally_symmetric(regular_polygon(120), 'polygon')
+    assert shape_main.is_rotationally_symmetric(regular_polygon(120), 'polygon')
+
+def test_rectangle_and_irregular_quad():
+    rectangle = shape_main.analyze_symmetry([[0, 0], [200, 0], [200, 100], [0, 100]])
+    assert rectangle['rotational_order'] == 2
+    assert sorted(round(angle) % 180 for _, angle in rectangle['reflection_axes']) == [0, 90]
+    assert not shape_main.is_rotationally_symmetric([[0, 0], [100, 0], [130, 70], [20, 90]], 'polygon')
+
+def test_solution_octagons_and_unique_axes():
+    for name in ('isolated_sol', 'frag01_sol'):
+        shapes, symmetric = shape_main.detect_csv(os.path.join(TASK12_DIR, 'problems', name + '.csv'),
+                                                  ['rectangles', 'circles', 'stars', 'polygons'])
+        octagons = [d for d in symmetric['details'] if d['shape_type'] == 'polygons']
+        assert [d['rotational_order'] for d in octagons] == [8]
+        assert any(shape is shapes['polygons'][0] for shape in symmetric['rotational'])
+        for detail in symmetric['details']:
+            angles = [angle for _, angle in detail['reflection_axes'] or []]
+            assert len(np.unique(np.round(angles, 1))) == len(angles)
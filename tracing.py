@@ -0,0 +1,167 @@
+"""Per-stage tracing and profiling shared by both tasks.
+
+Pipeline stages are marked with the ``stage`` decorator (or the ``span``
+context manager for inline blocks). Tracing is off by default, and then a
+stage costs a single flag check. It is enabled with ``configure`` or with the
+environment variables
+
+    GENSOLVE_TRACE=DIR         write one Chrome trace (JSON) per input to DIR
+    GENSOLVE_TRACE_MEMORY=1    also record the peak allocation of every stage
+    GENSOLVE_PROFILE=STAGE     run every call of STAGE under cProfile and save a .prof file
+
+Each stage becomes a complete event with its duration, its allocation peak
+and counts such as contours, shapes or masks. The stages run inside
+``session(label)`` are written to ``DIR/<label>.trace.json``, which opens in
+chrome://tracing or https://ui.perfetto.dev; the .prof files open with
+``python -m pstats``.
+"""
+import atexit
+import contextlib
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+enabled = False
+trace_dir = None
+trace_memory = False
+profile_stage = None
+
+events = []
+label = None
+profile_count = 0
+lock = threading.Lock()
+local = threading.local()
+epoch = time.perf_counter()
+
+def configure(directory=None, memory=False, profile=None):
+    """Enable tracing into ``directory`` and/or cProfile runs of the stage named ``profile``."""
+    global enabled, trace_dir, trace_memory, profile_stage
+    trace_dir, trace_memory, profile_stage = directory, memory, profile
+    enabled = directory is not None or profile is not None
+    if enabled:
+        os.makedirs(directory or ".", exist_ok=True)
+    if enabled and memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+def configure_from_env():
+    configure(os.environ.get("GENSOLVE_TRACE") or None, os.environ.get("GENSOLVE_TRACE_MEMORY") == "1",
+              os.environ.get("GENSOLVE_PROFILE") or None)
+
+class Span:
+    """One timed stage; ``counts`` can be filled in before it ends."""
+
+    def __init__(self, name):
+        self.name = name
+        self.counts = {}
+
+    def __enter__(self):
+        stack = local.__dict__.setdefault("stack", [])
+        self.child_peak = 0
+        self.memory = trace_memory and tracemalloc.is_tracing()
+        if self.memory:
+            # The peak is process-wide: stages running on other threads add to it
+            self.base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        stack.append(self)
+        self.profiler = None
+        if self.name == profile_stage:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.counts["profile"] = save_profile(self.profiler, self.name)
+        stack = local.stack
+        stack.pop()
+        if self.memory:
+            peak = max(tracemalloc.get_traced_memory()[1], self.child_peak)
+            self.counts["alloc_peak_bytes"] = peak - self.base
+            if stack:
+                stack[-1].child_peak = max(stack[-1].child_peak, peak)
+            tracemalloc.reset_peak()
+        if exc_type is not None:
+            self.counts["error"] = f"{exc_type.__name__}: {exc}"
+        event = {"name": self.name, "ph": "X", "ts": (self.start - epoch) * 1e6, "dur": (end - self.start) * 1e6,
+                 "pid": os.getpid(), "tid": threading.get_ident(), "args": self.counts}
+        with lock:
+            events.append(event)
+        return False
+
+def span(name):
+    """Context manager tracing an inline block as the stage ``name``."""
+    if not enabled:
+        return contextlib.nullcontext({})
+    return Span(name)
+
+def stage(name, counts=None):
+    """Decorator tracing every call as the stage ``name``.
+
+    ``counts`` maps the return value to a dict of counts for the event; it is
+    only called while tracing is enabled.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            with Span(name) as current:
+                result = func(*args, **kwargs)
+                if counts is not None:
+                    current.counts.update(counts(result))
+            return result
+        return wrapper
+    return decorate
+
+def save_profile(profiler, name):
+    global profile_count
+    with lock:
+        profile_count += 1
+        path = os.path.join(trace_dir or ".", f"{label or 'trace'}.{name}.{profile_count}.prof")
+    profiler.dump_stats(path)
+    return path
+
+def write_trace(trace_label, trace_events):
+    if trace_dir is None or not trace_events:
+        return None
+    path = os.path.join(trace_dir, f"{trace_label}.trace.json")
+    with open(path, "w") as f:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms", "otherData": {"input": trace_label}}, f)
+    return path
+
+@contextlib.contextmanager
+def session(name):
+    """Collect the stages run inside the block into their own trace file named after ``name``."""
+    global events, label, profile_count
+    if not enabled:
+        yield
+        return
+    with lock:
+        outer = events, label, profile_count
+        events, label, profile_count = [], name, 0
+    try:
+        yield
+    finally:
+        with lock:
+            collected = events
+            events, label, profile_count = outer
+        write_trace(name, collected)
+
+@atexit.register
+def flush():
+    """Write the stages traced outside any session when the process exits."""
+    global events
+    with lock:
+        collected, events = events, []
+    if enabled:
+        write_trace(f"{os.path.splitext(os.path.basename(sys.argv[0] or 'python'))[0]}-{os.getpid()}", collected)
+
+configure_from_env()